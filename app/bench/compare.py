@@ -0,0 +1,44 @@
+"""
+Сравнение двух результатов bench.run.
+
+    python -m bench.compare bench/results/before.json bench/results/after.json
+"""
+import json
+import sys
+
+_METRICS = [
+    ("throughput_rps", ("throughput_rps",)),
+    ("latency p50, ms", ("latency", "p50_ms")),
+    ("latency p95, ms", ("latency", "p95_ms")),
+    ("latency p99, ms", ("latency", "p99_ms")),
+    ("db statements / update", ("per_update", "db_statements")),
+    ("db commits / update", ("per_update", "db_commits")),
+    ("redis commands / update", ("per_update", "redis_commands")),
+    ("bot api calls / update", ("per_update", "bot_api_calls")),
+]
+
+
+def _get(data: dict, path: tuple[str, ...]) -> float:
+    for key in path:
+        data = data.get(key, {})
+    return float(data or 0)
+
+
+def main() -> None:
+    if len(sys.argv) != 3:
+        print(__doc__.strip())
+        sys.exit(2)
+    with open(sys.argv[1], encoding="utf-8") as f:
+        before = json.load(f)
+    with open(sys.argv[2], encoding="utf-8") as f:
+        after = json.load(f)
+
+    print(f"{'metric':<26}{'before':>12}{'after':>12}{'change':>10}")
+    for title, path in _METRICS:
+        a, b = _get(before, path), _get(after, path)
+        change = f"{(b - a) / a * 100:+.1f}%" if a else "—"
+        print(f"{title:<26}{a:>12.3f}{b:>12.3f}{change:>10}")
+
+
+if __name__ == "__main__":
+    main()
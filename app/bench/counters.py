@@ -0,0 +1,44 @@
+"""Счётчики обращений к Postgres и Redis за время прогона."""
+import threading
+
+import redis
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class CallCounters:
+    def __init__(self) -> None:
+        self.db_statements = 0
+        self.db_commits = 0
+        self.redis_commands = 0
+        self._lock = threading.Lock()
+
+    def install(self, engine: Engine) -> None:
+        counters = self
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _on_execute(*args, **kwargs) -> None:
+            with counters._lock:
+                counters.db_statements += 1
+
+        @event.listens_for(engine, "commit")
+        def _on_commit(*args, **kwargs) -> None:
+            with counters._lock:
+                counters.db_commits += 1
+
+        original = redis.Redis.execute_command
+
+        def execute_command(client, *args, **kwargs):
+            with counters._lock:
+                counters.redis_commands += 1
+            return original(client, *args, **kwargs)
+
+        redis.Redis.execute_command = execute_command
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "db_statements": self.db_statements,
+                "db_commits": self.db_commits,
+                "redis_commands": self.redis_commands,
+            }
@@ -0,0 +1,104 @@
+"""
+Локальная заглушка Telegram Bot API.
+
+Отвечает на любой метод успешным результатом с настраиваемой задержкой,
+а с заданной вероятностью — ошибкой 429 с retry_after.
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class FakeBotApi:
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 10.0, error_429_rate: float = 0.0,
+                 retry_after: int = 1, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_429_rate = error_429_rate
+        self.retry_after = retry_after
+        self.calls: Counter[str] = Counter()
+        self.errors_429 = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self._server: ThreadingHTTPServer | None = None
+
+    def _response(self, method: str, params: dict) -> tuple[int, dict]:
+        with self._lock:
+            self.calls[method] += 1
+            throttled = self._rng.random() < self.error_429_rate
+            if throttled:
+                self.errors_429 += 1
+            self._message_id += 1
+            message_id = self._message_id
+            delay = max(self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000
+
+        time.sleep(delay)
+        if throttled:
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        if method in ("setWebhook", "deleteWebhook"):
+            return 200, {"ok": True, "result": True}
+        chat_id = params.get("chat_id", 0)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            chat_id = 0
+        return 200, {
+            "ok": True,
+            "result": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            },
+        }
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запустить сервер в фоне. Возвращает шаблон URL для telebot.apihelper.API_URL."""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self) -> None:
+                # telebot передаёт параметры в query string, multipart — только для файлов
+                url = urlsplit(self.path)
+                method = url.path.rstrip("/").rsplit("/", 1)[-1]
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if body and self.headers.get("Content-Type", "").startswith("application/json"):
+                    params.update(json.loads(body))
+                status, payload = api._response(method, params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True).start()
+        bound_host, bound_port = self._server.server_address[:2]
+        return f"http://{bound_host}:{bound_port}/bot{{0}}/{{1}}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
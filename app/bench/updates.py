@@ -0,0 +1,87 @@
+"""Генератор реалистичных Telegram Update JSON для нагрузочных тестов."""
+import json
+import random
+import time
+
+from src.bot.messages import BTN_WRITE
+
+# Виды апдейтов и их веса по умолчанию
+DEFAULT_MIX = {
+    "start": 1,
+    "button": 3,
+    "message": 3,
+    "unknown": 1,
+    # Шум, который бот отбрасывает: правки сообщений и болтовня в группе
+    "edited": 0,
+    "group": 0,
+}
+
+_WORDS = (
+    "привет спасибо за канал вопрос по статье когда будет продолжение "
+    "очень понравилось можно ли связаться подскажите пожалуйста"
+).split()
+
+
+def parse_mix(spec: str) -> dict[str, int]:
+    """'start=1,button=3' -> {'start': 1, 'button': 3}."""
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise ValueError(f"Unknown update kind: {kind}")
+        mix[kind] = int(weight)
+    return mix
+
+
+class UpdateGenerator:
+    """Детерминированный (при заданном seed) поток апдейтов от пула пользователей."""
+
+    def __init__(self, mix: dict[str, int], users: int, seed: int, first_user_id: int = 10_000_000):
+        self._rng = random.Random(seed)
+        self._kinds = list(mix)
+        self._weights = [mix[k] for k in self._kinds]
+        self._user_ids = [first_user_id + i for i in range(users)]
+        self._update_id = 1
+        self._message_id = 1
+
+    def _text(self, kind: str) -> str:
+        if kind == "start":
+            return "/start"
+        if kind == "button":
+            return BTN_WRITE
+        if kind == "message":
+            length = self._rng.randint(5, 60)
+            return " ".join(self._rng.choice(_WORDS) for _ in range(length))
+        return self._rng.choice(["ок", "?", "hello", "где кнопка", "👍"])
+
+    def next(self) -> tuple[str, bytes]:
+        """Следующий апдейт: (вид, тело запроса)."""
+        kind = self._rng.choices(self._kinds, self._weights)[0]
+        user_id = self._rng.choice(self._user_ids)
+        update = {
+            "update_id": self._update_id,
+            "message": {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": "Bench"},
+                "from": {
+                    "id": user_id,
+                    "is_bot": False,
+                    "first_name": "Bench",
+                    "username": f"bench_{user_id}",
+                    "language_code": "ru",
+                },
+                "text": self._text(kind),
+            },
+        }
+        if kind == "start":
+            update["message"]["entities"] = [{"offset": 0, "length": 6, "type": "bot_command"}]
+        elif kind == "edited":
+            update["edited_message"] = update.pop("message")
+            update["edited_message"]["edit_date"] = int(time.time())
+        elif kind == "group":
+            update["message"]["chat"] = {"id": -1001000000000, "type": "supergroup", "title": "Bench"}
+        self._update_id += 1
+        self._message_id += 1
+        return kind, json.dumps(update, ensure_ascii=False).encode()
@@ -0,0 +1,337 @@
+"""
+ASGI entrypoint для uvicorn (SERVER_MODE=asgi).
+
+Те же эндпоинты, что и у Flask-приложения (webhook_server.py), но апдейты
+обрабатываются AsyncTeleBot в event loop: запросы к Telegram API, Redis
+и Postgres не держат поток, поэтому один процесс ведёт сотни апдейтов
+одновременно.
+
+UPDATE_PROCESSING:
+  - inline: ответ Telegram — после обработки апдейта (при WEBHOOK_REPLY — с ответом пользователю)
+  - queue:  ответ сразу, апдейт обрабатывается фоновой задачей; задач в работе
+            не больше UPDATE_QUEUE_SIZE, сверх этого — 503
+"""
+import asyncio
+import hmac
+import json
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterator
+from urllib.parse import parse_qsl
+
+import telebot
+from telebot.async_telebot import AsyncTeleBot
+
+from src import metrics
+from src.config import settings
+from src.logging import info_sampled, log_context, logger
+from src.main import create_async_bot
+from src.profiler import profile_update, slow_updates
+from src.bot.blocklist import start_blocklist, stop_blocklist
+from src.bot.dedup import claim_update_async, release_update_async
+from src.bot.fast_update import UpdateRecord, parse_update
+from src.bot.webhook_reply import capture_reply, render
+from src.services.http_client import install_http_client
+from src.services.broadcast import start_broadcasts, stop_broadcasts
+from src.services.export import TABLES, finish_export, iter_export, parse_export_request, try_start_export
+from src.services.outbox import start_delivery_workers, stop_delivery_workers
+from src.services.profile_cache import start_last_seen_flusher, stop_last_seen_flusher
+from src.services.reply_routing import start_forwards_flusher, stop_forwards_flusher
+from src.services.replay import start_replay, stop_replay
+from src.startup import run_startup
+from src.storage.db import dispose_async_engine
+from src.storage.redis_client import close_async_redis
+
+Receive = Callable[[], Awaitable[dict]]
+Send = Callable[[dict], Awaitable[None]]
+
+
+@dataclass
+class StreamingBody:
+    """Тело ответа, отдаваемое по частям; куски синхронного итератора читаются в потоке."""
+    chunks: Iterator[bytes]
+    headers: list[tuple[bytes, bytes]]
+    # Вызывается после отдачи тела (в том числе при отключении клиента)
+    on_close: Callable[[], None]
+
+
+_bot: AsyncTeleBot | None = None
+
+# Апдейты, обрабатываемые в фоне (UPDATE_PROCESSING=queue)
+_tasks: set[asyncio.Task] = set()
+
+
+async def _process_update(record: UpdateRecord, received_at: float | None = None) -> None:
+    """Прогнать принятый апдейт через хендлеры. received_at — для профилировщика (см. src.profiler)."""
+    with log_context(record.update_id, record.user_id), profile_update(record.update_id, record.user_id, received_at):
+        # Повторная доставка того же апдейта — отбрасываем до любой работы
+        if not await claim_update_async(record.update_id):
+            metrics.UPDATES_DROPPED.labels("duplicate").inc()
+            info_sampled("Duplicate update %d dropped", record.update_id)
+            return
+
+        try:
+            await _bot.process_new_updates([record.to_update()])
+        except Exception:
+            # Дадим Telegram повторить доставку
+            await release_update_async(record.update_id)
+            raise
+
+
+async def _process_in_background(record: UpdateRecord) -> None:
+    try:
+        await _process_update(record)
+    except Exception as e:
+        logger.error("Error processing queued update: %s", e)
+
+
+def _header(scope: dict, name: bytes) -> str:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _webhook(scope: dict, receive: Receive) -> tuple[int, bytes, str]:
+    """Эндпоинт для приёма webhook-апдейтов от Telegram."""
+    if _bot is None:
+        logger.error("Bot instance not set")
+        return 500, b"Internal Server Error", "text/plain"
+
+    # Проверка secret token (если задан)
+    if settings.webhook_secret_token:
+        if _header(scope, b"x-telegram-bot-api-secret-token") != settings.webhook_secret_token:
+            logger.warning("Invalid secret token in webhook request")
+            return 403, b"Forbidden", "text/plain"
+
+    content_type = _header(scope, b"content-type")
+    if content_type != "application/json":
+        logger.warning("Invalid content-type: %s", content_type)
+        return 400, b"Bad Request", "text/plain"
+
+    # Ненужные хендлерам апдейты отбрасываются до создания объектов telebot
+    received_at = time.perf_counter()
+    try:
+        record = parse_update(await _read_body(receive))
+    except ValueError:
+        logger.warning("Malformed update body")
+        return 400, b"Bad Request", "text/plain"
+    if record is None:
+        return 200, b"OK", "text/plain"
+
+    if settings.update_processing == "queue":
+        # При переполнении просим Telegram повторить доставку позже
+        if len(_tasks) >= settings.update_queue_size:
+            logger.warning("Update queue is full, rejecting update")
+            return 503, b"Service Unavailable", "text/plain"
+        task = asyncio.create_task(_process_in_background(record))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+        return 200, b"OK", "text/plain"
+
+    try:
+        with capture_reply() as slot:
+            await _process_update(record, received_at)
+    except Exception as e:
+        logger.error("Error processing update: %s", e)
+        return 500, b"Internal Server Error", "text/plain"
+
+    reply = render(slot)
+    if reply is not None:
+        return 200, reply.encode("utf-8"), "application/json"
+    return 200, b"OK", "text/plain"
+
+
+def _internal_token_ok(scope: dict) -> bool:
+    """Проверить Bearer-токен служебных эндпоинтов (если INTERNAL_API_TOKEN задан)."""
+    if not settings.internal_api_token:
+        return True
+    expected = f"Bearer {settings.internal_api_token}"
+    return hmac.compare_digest(_header(scope, b"authorization"), expected)
+
+
+async def _metrics_endpoint(scope: dict, receive: Receive) -> tuple[int, bytes, str]:
+    """Метрики в формате Prometheus."""
+    if not settings.metrics_enabled:
+        return 404, b"Not Found", "text/plain"
+    if not _internal_token_ok(scope):
+        return 401, b"Unauthorized", "text/plain"
+    body, content_type = metrics.render()
+    return 200, body, content_type
+
+
+async def _health(scope: dict, receive: Receive) -> tuple[int, bytes, str]:
+    """Healthcheck эндпоинт."""
+    return 200, b"OK", "text/plain"
+
+
+async def _slow_updates_endpoint(scope: dict, receive: Receive) -> tuple[int, bytes, str]:
+    """Трассы медленных апдейтов (PROFILE_SLOW_UPDATES_MS); только при заданном INTERNAL_API_TOKEN."""
+    if not settings.internal_api_token:
+        return 404, b"Not Found", "text/plain"
+    if not _internal_token_ok(scope):
+        return 401, b"Unauthorized", "text/plain"
+    return 200, json.dumps(slow_updates(), ensure_ascii=False).encode("utf-8"), "application/json"
+
+
+async def _export_endpoint(scope: dict, receive: Receive) -> tuple[int, bytes | StreamingBody, str]:
+    """Потоковая выгрузка users / messages; только при заданном INTERNAL_API_TOKEN."""
+    if not settings.internal_api_token:
+        return 404, b"Not Found", "text/plain"
+    if not _internal_token_ok(scope):
+        return 401, b"Unauthorized", "text/plain"
+    table = scope["path"].rsplit("/", 1)[-1]
+    params = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+    try:
+        export = parse_export_request(table, params)
+    except ValueError as e:
+        return 400, f"{e}\n".encode(), "text/plain"
+    if not try_start_export():
+        return 429, b"Export already in progress\n", "text/plain"
+
+    logger.info("Export %s started over HTTP", export.filename)
+    body = StreamingBody(
+        chunks=iter_export(export),
+        headers=[(b"content-disposition", f'attachment; filename="{export.filename}"'.encode("latin-1"))],
+        on_close=finish_export,
+    )
+    return 200, body, export.content_type
+
+
+async def _send_streaming(send: Send, status: int, body: StreamingBody, content_type: str) -> None:
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type.encode("latin-1")), *body.headers],
+        })
+        while True:
+            # Чтение БД и сжатие — в потоке, event loop продолжает обслуживать webhook
+            chunk = await asyncio.to_thread(next, body.chunks, None)
+            if chunk is None:
+                break
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        await asyncio.to_thread(body.chunks.close)
+        body.on_close()
+
+
+# path -> (метод, имя эндпоинта для метрик, обработчик); имена — как у Flask-приложения
+_routes = {
+    f"/{settings.webhook_path}": ("POST", "webhook", _webhook),
+    "/health": ("GET", "health", _health),
+    "/metrics": ("GET", "metrics_endpoint", _metrics_endpoint),
+    "/debug/slow-updates": ("GET", "slow_updates_endpoint", _slow_updates_endpoint),
+    **{f"/export/{table}": ("GET", "export_endpoint", _export_endpoint) for table in TABLES},
+}
+
+
+async def _startup() -> None:
+    global _bot
+    logger.info("ASGI: Initializing application...")
+
+    # Синхронный бот — для миграций/webhook, воркеров outbox и рассылок (потоки, как и в WSGI-режиме)
+    install_http_client()
+    sync_bot = telebot.TeleBot(settings.bot_token, threaded=False)
+    await asyncio.to_thread(run_startup, sync_bot)
+
+    _bot = create_async_bot()
+    start_replay()
+    start_delivery_workers(sync_bot)
+    await asyncio.to_thread(start_broadcasts, sync_bot)
+    start_last_seen_flusher()
+    start_forwards_flusher()
+    await asyncio.to_thread(start_blocklist)
+
+    if settings.update_processing == "queue":
+        metrics.register_gauge("govorun_update_queue_depth", "Updates waiting in the queue", lambda: len(_tasks))
+        metrics.register_gauge("govorun_update_queue_capacity", "Update queue capacity", lambda: settings.update_queue_size)
+
+    logger.info("ASGI: Application ready")
+
+
+async def _shutdown() -> None:
+    """Дообработать апдейты в работе, остановить доставку и закрыть соединения."""
+    if _tasks:
+        logger.info("Draining update tasks: %d pending", len(_tasks))
+        _, pending = await asyncio.wait(set(_tasks), timeout=settings.update_queue_drain_timeout)
+        if pending:
+            logger.warning("Update drain timed out, %d updates left unprocessed", len(pending))
+            for task in pending:
+                task.cancel()
+
+    # Ждёт конца текущей пачки рассылки — не в потоке event loop
+    await asyncio.to_thread(stop_broadcasts)
+    await asyncio.to_thread(stop_delivery_workers)
+    await asyncio.to_thread(stop_last_seen_flusher)
+    await asyncio.to_thread(stop_forwards_flusher)
+    await asyncio.to_thread(stop_blocklist)
+    await asyncio.to_thread(stop_replay)
+
+    if _bot is not None:
+        await _bot.close_session()
+    await dispose_async_engine()
+    await close_async_redis()
+    logger.info("ASGI: Application stopped")
+
+
+async def _lifespan(receive: Receive, send: Send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await _startup()
+            except Exception as e:
+                logger.exception("ASGI startup failed")
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await _shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope: dict, receive: Receive, send: Send) -> None:
+    """ASGI-приложение: uvicorn src.asgi:application"""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    started = time.perf_counter()
+    route = _routes.get(scope["path"])
+    if route is None:
+        endpoint, status, body, content_type = "unknown", 404, b"Not Found", "text/plain"
+    elif scope["method"] != route[0]:
+        endpoint, status, body, content_type = route[1], 405, b"Method Not Allowed", "text/plain"
+    else:
+        endpoint = route[1]
+        status, body, content_type = await route[2](scope, receive)
+
+    if isinstance(body, StreamingBody):
+        await _send_streaming(send, status, body, content_type)
+        metrics.observe_http(endpoint, status, time.perf_counter() - started)
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+    metrics.observe_http(endpoint, status, time.perf_counter() - started)
@@ -0,0 +1,293 @@
+"""
+Хендлеры для AsyncTeleBot (SERVER_MODE=asgi).
+
+Та же логика, что в handlers.py (общие решения — в handler_logic.py), но все
+обращения к Telegram API, Redis и Postgres — через await: поток не блокируется,
+и один процесс держит в работе сотни апдейтов одновременно.
+"""
+from telebot.async_telebot import AsyncTeleBot
+from telebot.types import Message
+
+from src.config import settings
+from src.logging import info_sampled, logger
+from src.bot.keyboards import main_keyboard
+from src.bot.messages import (
+    START,
+    BTN_WRITE,
+    ASK_MESSAGE,
+    SENT_OK,
+    SENT_FAIL,
+    UNKNOWN,
+    REPLY_SENT,
+    REPLY_FAIL,
+    REPLY_NO_SENDER,
+    BROADCAST_USAGE,
+    EXPORT_USAGE,
+    EXPORT_STARTED,
+    EXPORT_BUSY,
+    BLOCK_OK,
+    UNBLOCK_OK,
+)
+from src.bot.blocklist import set_banned_async
+from src.bot.handler_logic import (
+    CONTENT_TYPES,
+    author_reply_plan,
+    broadcast_stopped_text,
+    chat_info,
+    command_args,
+    defer_unsaved_message,
+    delivery_outcome,
+    hand_off_to_workers,
+    is_admin_private,
+    parse_block_command,
+    parse_user_message,
+    rate_limit_text,
+    sent_text,
+    status_write_failed,
+)
+from src.bot.webhook_reply import reply_async
+from src.bot.router import AsyncRouter
+from src.bot.states import (
+    set_state_async,
+    reset_state_async,
+    STATE_WAITING_MESSAGE,
+)
+from src.services.rate_limit import check_rate_limit_async
+from src.services.author_notify import author_chat_ids, send_to_recipients_async
+from src.services.broadcast import launch_broadcast
+from src.services.export import parse_export_command, start_export_async, try_start_export
+from src.services.reply_routing import find_sender_async
+from src.services.profile_cache import record_message_async, save_user_async
+from src.storage.db import async_session_scope, is_unavailable
+from src.storage.repo import AsyncRepository
+
+
+def register_async_handlers(bot: AsyncTeleBot) -> AsyncRouter:
+    """Регистрирует все хендлеры асинхронного бота."""
+    router = AsyncRouter()
+
+    @router.reply(*author_chat_ids())
+    async def handle_author_reply(message: Message, state: str | None) -> None:
+        """Автор ответил (reply) на пересланное сообщение — ответ уходит пользователю."""
+        chat_id = message.chat.id
+        try:
+            user_id = await find_sender_async(chat_id, message.reply_to_message.message_id)
+        except Exception as e:
+            logger.error("DB error looking up reply target: %s", e)
+            user_id = None
+
+        if user_id is None:
+            # В группе ответы на прочие сообщения бота — обычная переписка
+            if chat_id == settings.admin_id:
+                await reply_async(bot, chat_id, REPLY_NO_SENDER)
+            return
+
+        plan = author_reply_plan(message)
+        try:
+            if plan.text is not None:
+                await bot.send_message(user_id, plan.text)
+            if plan.copy:
+                await bot.copy_message(user_id, chat_id, message.message_id, caption=plan.caption)
+        except Exception as e:
+            logger.error("Failed to deliver author reply to user %d: %s", user_id, e)
+            await reply_async(bot, chat_id, REPLY_FAIL.format(user_id=user_id, error=e))
+            return
+
+        logger.info("Author reply delivered to user %d from chat %d", user_id, chat_id)
+        await reply_async(bot, chat_id, REPLY_SENT.format(user_id=user_id))
+
+    @router.command("start")
+    async def handle_start(message: Message, state: str | None) -> None:
+        """Приветствие + сохранение пользователя."""
+        user = message.from_user
+        info_sampled("/start from user %d (%s)", user.id, user.username)
+
+        try:
+            await save_user_async(
+                telegram_id=user.id,
+                username=user.username,
+                first_name=user.first_name,
+                last_name=user.last_name,
+            )
+        except Exception as e:
+            logger.error("DB error on /start: %s", e)
+
+        await reset_state_async(user.id)
+
+        await reply_async(
+            bot,
+            message.chat.id,
+            START,
+            reply_markup=main_keyboard(),
+        )
+
+    @router.command("getid")
+    async def handle_getid(message: Message, state: str | None) -> None:
+        """Показать chat_id текущего чата. Доступно только админу."""
+        user = message.from_user
+        if user.id != settings.admin_id:
+            return
+
+        chat = message.chat
+        await reply_async(bot, chat.id, chat_info(message), parse_mode="HTML")
+        logger.info("/getid by admin in chat %d (%s)", chat.id, chat.type)
+
+    @router.command("broadcast")
+    async def handle_broadcast(message: Message, state: str | None) -> None:
+        """Рассылка всем пользователям. Только админ, только в ЛС с ботом."""
+        if not is_admin_private(message):
+            return
+
+        text = command_args(message)
+        if not text:
+            await reply_async(bot, message.chat.id, BROADCAST_USAGE)
+            return
+
+        try:
+            async with async_session_scope() as session:
+                broadcast_id, total = await AsyncRepository(session).create_broadcast(text, message.chat.id)
+        except Exception as e:
+            logger.error("DB error creating broadcast: %s", e)
+            await reply_async(bot, message.chat.id, SENT_FAIL)
+            return
+
+        logger.info("Broadcast %d created by admin: %d recipients", broadcast_id, total)
+        # Рассылку ведут потоки с синхронным ботом, как и воркеры outbox
+        launch_broadcast(broadcast_id)
+
+    @router.command("broadcast_stop")
+    async def handle_broadcast_stop(message: Message, state: str | None) -> None:
+        """Остановить идущие рассылки."""
+        if not is_admin_private(message):
+            return
+
+        try:
+            async with async_session_scope() as session:
+                stopped = await AsyncRepository(session).cancel_broadcasts()
+        except Exception as e:
+            logger.error("DB error stopping broadcasts: %s", e)
+            await reply_async(bot, message.chat.id, SENT_FAIL)
+            return
+
+        await reply_async(bot, message.chat.id, broadcast_stopped_text(stopped))
+
+    @router.command("block", "unblock")
+    async def handle_block(message: Message, state: str | None) -> None:
+        """Забанить / разбанить пользователя по telegram_id. Только админ, только в ЛС с ботом."""
+        if not is_admin_private(message):
+            return
+
+        try:
+            target, banned = parse_block_command(message.text)
+        except ValueError as e:
+            await reply_async(bot, message.chat.id, str(e))
+            return
+
+        try:
+            await set_banned_async(target, banned)
+        except Exception as e:
+            logger.error("DB error updating blocklist: %s", e)
+            await reply_async(bot, message.chat.id, SENT_FAIL)
+            return
+
+        logger.info("User %d %s by admin", target, "banned" if banned else "unbanned")
+        await reply_async(bot, message.chat.id, (BLOCK_OK if banned else UNBLOCK_OK).format(user_id=target))
+
+    @router.command("export")
+    async def handle_export(message: Message, state: str | None) -> None:
+        """Выгрузка users / messages файлом. Только админ, только в ЛС с ботом."""
+        if not is_admin_private(message):
+            return
+
+        try:
+            request = parse_export_command(command_args(message))
+        except ValueError as e:
+            await reply_async(bot, message.chat.id, EXPORT_USAGE.format(error=e))
+            return
+
+        if not try_start_export():
+            await reply_async(bot, message.chat.id, EXPORT_BUSY)
+            return
+
+        logger.info("Export %s requested by admin", request.filename)
+        # Файл собирается и отправляется фоновой задачей — ответ на webhook не ждёт выгрузку
+        start_export_async(bot, message.chat.id, request)
+        await reply_async(bot, message.chat.id, EXPORT_STARTED)
+
+    @router.text(BTN_WRITE)
+    async def handle_write_button(message: Message, state: str | None) -> None:
+        """Пользователь нажал кнопку 'Написать автору'."""
+        user = message.from_user
+        info_sampled("Write button pressed by user %d", user.id)
+
+        decision = await check_rate_limit_async(user.id)
+        if not decision.allowed:
+            await reply_async(
+                bot,
+                message.chat.id,
+                rate_limit_text(decision),
+                reply_markup=main_keyboard(),
+            )
+            return
+
+        await set_state_async(user.id, STATE_WAITING_MESSAGE)
+        await reply_async(
+            bot,
+            message.chat.id,
+            ASK_MESSAGE.format(max_len=settings.max_message_length),
+        )
+
+    @router.state(STATE_WAITING_MESSAGE)
+    async def handle_user_message(message: Message, state: str | None) -> None:
+        """Пользователь прислал сообщение для автора: текст или вложение с подписью."""
+        user = message.from_user
+
+        await reset_state_async(user.id)
+
+        try:
+            text, media = parse_user_message(message)
+        except ValueError as e:
+            await reply_async(bot, message.chat.id, str(e), reply_markup=main_keyboard())
+            return
+
+        message_id = None
+        db_unavailable = False
+        try:
+            message_id = await record_message_async(
+                telegram_id=user.id,
+                username=user.username,
+                first_name=user.first_name,
+                last_name=user.last_name,
+                text=text,
+                media=media,
+            )
+        except Exception as e:
+            db_unavailable = is_unavailable(e)
+            logger.error("DB error saving message: %s", e)
+
+        # Outbox / дайджест: воркеры доставки работают в фоновых потоках этого же процесса
+        if hand_off_to_workers(message_id):
+            await reply_async(bot, message.chat.id, SENT_OK, reply_markup=main_keyboard())
+            return
+
+        result = await send_to_recipients_async(bot, user.id, user.username, user.first_name, text, media)
+
+        status, error = delivery_outcome(result)
+        if message_id is not None:
+            try:
+                async with async_session_scope() as session:
+                    await AsyncRepository(session).set_delivery_status(message_id, status, error)
+            except Exception as e:
+                status_write_failed(message_id, status, error, e)
+        elif db_unavailable:
+            defer_unsaved_message(message, text, media, status, error)
+
+        await reply_async(bot, message.chat.id, sent_text(result), reply_markup=main_keyboard())
+
+    @router.default
+    async def handle_unknown(message: Message, state: str | None) -> None:
+        """Обработка всех прочих сообщений."""
+        await reply_async(bot, message.chat.id, UNKNOWN, reply_markup=main_keyboard())
+
+    bot.register_message_handler(router.dispatch, content_types=CONTENT_TYPES)
+    return router
@@ -0,0 +1,147 @@
+"""
+Блоклист пользователей (/block, /unblock).
+
+Забаненные telegram_id (users.is_banned) держатся в памяти каждого процесса
+как неизменяемое множество; апдейт забаненного пользователя отбрасывается
+в parse_update — одна проверка вхождения, до дедупликации в Redis, создания
+объектов telebot, rate limit и записи в БД.
+
+Синхронизация между воркерами и контейнерами:
+  - при старте множество загружается из Postgres (частичный индекс ix_users_banned);
+  - /block и /unblock пишут в Postgres и публикуют событие в канал Redis,
+    фоновый поток каждого процесса применяет его к своему множеству;
+  - после переподключения к Redis и раз в BLOCKLIST_REFRESH_INTERVAL секунд
+    множество перечитывается из Postgres — пропущенные события не теряются.
+"""
+import threading
+import time
+
+from src.config import settings
+from src.logging import logger
+from src.storage.db import async_session_scope, session_scope
+from src.storage.redis_client import get_async_redis, get_redis
+from src.storage.repo import AsyncRepository, Repository
+
+_CHANNEL = "blocklist:events"
+# Пауза перед переподключением к Redis после ошибки (сек)
+_RECONNECT_DELAY = 5.0
+
+_banned: frozenset[int] = frozenset()
+_lock = threading.Lock()
+_listener: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def is_banned(telegram_id: int) -> bool:
+    """Забанен ли пользователь. Без блокировок и ввода-вывода."""
+    return telegram_id in _banned
+
+
+def _apply(telegram_id: int, banned: bool) -> None:
+    global _banned
+    with _lock:
+        _banned = (_banned | {telegram_id}) if banned else (_banned - {telegram_id})
+
+
+def reload_blocklist() -> int:
+    """Перечитать блоклист из Postgres. Возвращает число забаненных."""
+    global _banned
+    with session_scope() as session:
+        ids = Repository(session).banned_user_ids()
+    with _lock:
+        _banned = frozenset(ids)
+    return len(ids)
+
+
+def _on_event(data: str) -> None:
+    """Событие канала: 'ban:<telegram_id>' / 'unban:<telegram_id>'."""
+    action, _, raw_id = data.partition(":")
+    try:
+        telegram_id = int(raw_id)
+    except ValueError:
+        logger.warning("Malformed blocklist event: %r", data)
+        return
+    if action in ("ban", "unban"):
+        _apply(telegram_id, action == "ban")
+
+
+def _publish(telegram_id: int, banned: bool) -> None:
+    try:
+        get_redis().publish(_CHANNEL, f"{'ban' if banned else 'unban'}:{telegram_id}")
+    except Exception as e:
+        # Остальные процессы подхватят изменение при следующем перечитывании
+        logger.warning("Failed to publish blocklist event for user %d: %s", telegram_id, e)
+
+
+async def _publish_async(telegram_id: int, banned: bool) -> None:
+    try:
+        await get_async_redis().publish(_CHANNEL, f"{'ban' if banned else 'unban'}:{telegram_id}")
+    except Exception as e:
+        logger.warning("Failed to publish blocklist event for user %d: %s", telegram_id, e)
+
+
+def set_banned(telegram_id: int, banned: bool) -> None:
+    """Забанить / разбанить пользователя: Postgres, блоклист этого процесса и остальных."""
+    with session_scope() as session:
+        Repository(session).set_banned(telegram_id, banned)
+    _apply(telegram_id, banned)
+    _publish(telegram_id, banned)
+
+
+async def set_banned_async(telegram_id: int, banned: bool) -> None:
+    """Асинхронный вариант set_banned."""
+    async with async_session_scope() as session:
+        await AsyncRepository(session).set_banned(telegram_id, banned)
+    _apply(telegram_id, banned)
+    await _publish_async(telegram_id, banned)
+
+
+def _listen() -> None:
+    """Слушать канал событий; после (пере)подключения и периодически — перечитывать Postgres."""
+    while not _stop.is_set():
+        pubsub = None
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_CHANNEL)
+            # События, пропущенные без подписки, уже есть в Postgres
+            reload_blocklist()
+            refreshed_at = time.monotonic()
+            while not _stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None and message["type"] == "message":
+                    _on_event(message["data"])
+                if time.monotonic() - refreshed_at >= settings.blocklist_refresh_interval:
+                    reload_blocklist()
+                    refreshed_at = time.monotonic()
+        except Exception as e:
+            logger.warning("Blocklist sync error, reconnecting in %.0fs: %s", _RECONNECT_DELAY, e)
+            _stop.wait(_RECONNECT_DELAY)
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+def start_blocklist() -> None:
+    """Загрузить блоклист и запустить синхронизацию (один поток на процесс)."""
+    global _listener
+    if _listener is not None:
+        return
+    try:
+        count = reload_blocklist()
+        logger.info("Blocklist loaded: %d users", count)
+    except Exception as e:
+        # Поток синхронизации повторит загрузку
+        logger.error("DB error loading blocklist: %s", e)
+    _listener = threading.Thread(target=_listen, name="blocklist-sync", daemon=True)
+    _listener.start()
+
+
+def stop_blocklist() -> None:
+    global _listener
+    _stop.set()
+    if _listener is not None:
+        _listener.join(timeout=5)
+        _listener = None
@@ -0,0 +1,153 @@
+"""
+Дедупликация апдейтов по update_id.
+
+Если хендлеры отвечают медленно, Telegram повторно доставляет тот же апдейт.
+Повтор отбрасывается до любой работы с БД и Telegram API.
+
+Бэкенды (DEDUP_BACKEND):
+  - redis:  SET NX EX — общий для всех воркеров и контейнеров
+  - memory: ограниченное окно последних update_id в памяти процесса
+  - off:    без дедупликации
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Protocol
+
+from src.config import settings
+from src.logging import logger
+from src.storage.redis_client import get_async_redis, get_redis
+
+
+class Deduplicator(Protocol):
+    def claim(self, update_id: int) -> bool:
+        """Отметить апдейт как принятый. False — апдейт уже обрабатывался."""
+        ...
+
+    def release(self, update_id: int) -> None:
+        """Снять отметку (апдейт не обработан, повтор от Telegram нужно принять)."""
+        ...
+
+    async def claim_async(self, update_id: int) -> bool: ...
+
+    async def release_async(self, update_id: int) -> None: ...
+
+
+class MemoryDeduplicator:
+    """Последние max_size update_id с TTL в памяти процесса."""
+
+    def __init__(self, ttl: int, max_size: int):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._seen: OrderedDict[int, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, update_id: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._seen.get(update_id)
+            if expires_at is not None and expires_at > now:
+                return False
+            self._seen[update_id] = now + self._ttl
+            self._seen.move_to_end(update_id)
+            while len(self._seen) > self._max_size:
+                self._seen.popitem(last=False)
+        return True
+
+    def release(self, update_id: int) -> None:
+        with self._lock:
+            self._seen.pop(update_id, None)
+
+    async def claim_async(self, update_id: int) -> bool:
+        return self.claim(update_id)
+
+    async def release_async(self, update_id: int) -> None:
+        self.release(update_id)
+
+
+class RedisDeduplicator:
+    """Один ключ на update_id, SET NX EX."""
+
+    def __init__(self, ttl: int):
+        self._ttl = ttl
+
+    @staticmethod
+    def _key(update_id: int) -> str:
+        return f"dedup:update:{update_id}"
+
+    def claim(self, update_id: int) -> bool:
+        return bool(get_redis().set(self._key(update_id), "1", nx=True, ex=self._ttl))
+
+    def release(self, update_id: int) -> None:
+        get_redis().delete(self._key(update_id))
+
+    async def claim_async(self, update_id: int) -> bool:
+        return bool(await get_async_redis().set(self._key(update_id), "1", nx=True, ex=self._ttl))
+
+    async def release_async(self, update_id: int) -> None:
+        await get_async_redis().delete(self._key(update_id))
+
+
+_dedup: Deduplicator | None = None
+
+
+def get_deduplicator() -> Deduplicator | None:
+    """Получить (или создать) дедупликатор согласно DEDUP_BACKEND. None — выключено."""
+    global _dedup
+    if _dedup is None and settings.dedup_backend != "off":
+        if settings.dedup_backend == "redis":
+            _dedup = RedisDeduplicator(ttl=settings.dedup_ttl_seconds)
+        else:
+            _dedup = MemoryDeduplicator(ttl=settings.dedup_ttl_seconds, max_size=settings.dedup_memory_size)
+    return _dedup
+
+
+def claim_update(update_id: int) -> bool:
+    """
+    Проверить и отметить апдейт. False — повтор, обрабатывать не нужно.
+
+    При недоступности хранилища апдейт пропускается дальше: лучше редкий
+    дубль, чем потерянное сообщение.
+    """
+    dedup = get_deduplicator()
+    if dedup is None:
+        return True
+    try:
+        return dedup.claim(update_id)
+    except Exception as e:
+        logger.warning("Dedup check failed for update %d: %s", update_id, e)
+        return True
+
+
+def release_update(update_id: int) -> None:
+    """Снять отметку с апдейта, обработка которого упала."""
+    dedup = get_deduplicator()
+    if dedup is None:
+        return
+    try:
+        dedup.release(update_id)
+    except Exception as e:
+        logger.warning("Dedup release failed for update %d: %s", update_id, e)
+
+
+async def claim_update_async(update_id: int) -> bool:
+    """Асинхронный вариант claim_update."""
+    dedup = get_deduplicator()
+    if dedup is None:
+        return True
+    try:
+        return await dedup.claim_async(update_id)
+    except Exception as e:
+        logger.warning("Dedup check failed for update %d: %s", update_id, e)
+        return True
+
+
+async def release_update_async(update_id: int) -> None:
+    """Асинхронный вариант release_update."""
+    dedup = get_deduplicator()
+    if dedup is None:
+        return
+    try:
+        await dedup.release_async(update_id)
+    except Exception as e:
+        logger.warning("Dedup release failed for update %d: %s", update_id, e)
@@ -0,0 +1,95 @@
+"""
+Быстрый разбор webhook-апдейтов.
+
+Telegram присылает не только сообщения: правки, посты каналов, изменения
+участников и т.п. Хендлеры бота работают только с message, поэтому тело
+апдейта разбирается из байтов (orjson, если установлен), и лишние апдейты
+отбрасываются до создания объектов telebot:
+  - не message (edited_message, channel_post, my_chat_member ...)
+  - сообщения не из личного чата, кроме команд (/getid в группе)
+    и ответов на сообщения бота в группе автора (GROUP_CHAT_ID)
+  - сообщения забаненных пользователей (блоклист /block, см. blocklist.py)
+
+Горячие поля складываются в компактную запись UpdateRecord; полный
+telebot.types.Update строится из уже разобранного dict только для принятых
+апдейтов (to_update).
+"""
+import telebot
+
+from src import metrics
+from src.bot.blocklist import is_banned
+from src.config import settings
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    import json
+
+    _loads = json.loads
+
+
+class UpdateRecord:
+    """Горячие поля принятого апдейта и разобранный JSON для telebot."""
+
+    __slots__ = ("update_id", "chat_id", "chat_type", "user_id", "text", "data")
+
+    def __init__(self, update_id: int, chat_id: int, chat_type: str, user_id: int | None, text: str | None, data: dict):
+        self.update_id = update_id
+        self.chat_id = chat_id
+        self.chat_type = chat_type
+        self.user_id = user_id
+        self.text = text
+        self.data = data
+
+    def to_update(self) -> telebot.types.Update:
+        return telebot.types.Update.de_json(self.data)
+
+
+def _drop(reason: str) -> None:
+    metrics.UPDATES_DROPPED.labels(reason).inc()
+    return None
+
+
+def _is_group_reply(chat: dict, message: dict) -> bool:
+    """Ответ на сообщение бота в группе автора (ответ пользователю, см. reply_routing)."""
+    if settings.group_chat_id is None or chat.get("id") != settings.group_chat_id:
+        return False
+    original = message.get("reply_to_message")
+    return isinstance(original, dict) and bool((original.get("from") or {}).get("is_bot"))
+
+
+def parse_update(body: bytes | str) -> UpdateRecord | None:
+    """
+    Разобрать тело webhook-запроса. None — апдейт не нужен хендлерам.
+
+    ValueError — тело не JSON-объект апдейта.
+    """
+    data = _loads(body)
+    if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+        raise ValueError("Not a Telegram update")
+
+    message = data.get("message")
+    if not isinstance(message, dict):
+        return _drop("type")
+
+    chat = message.get("chat") or {}
+    chat_type = chat.get("type")
+    text = message.get("text")
+    if chat_type != "private" and not (text and text.startswith("/")) and not _is_group_reply(chat, message):
+        return _drop("chat")
+
+    user = message.get("from")
+    user_id = user.get("id") if isinstance(user, dict) else None
+    if user_id is not None and is_banned(user_id):
+        return _drop("banned")
+
+    return UpdateRecord(
+        update_id=data["update_id"],
+        chat_id=chat.get("id"),
+        chat_type=chat_type,
+        user_id=user_id,
+        text=text,
+        data=data,
+    )
@@ -0,0 +1,162 @@
+"""
+Общая логика хендлеров handlers.py (TeleBot) и async_handlers.py (AsyncTeleBot).
+
+Здесь всё, что не ходит в Telegram, Redis и Postgres: проверки прав,
+разбор команд, валидация сообщения пользователя, выбор ответа и поведение
+при недоступности БД. В модулях хендлеров остаются только вызовы
+ввода-вывода (sync или через await) в том порядке, который задают эти функции,
+поэтому оба режима сервера ведут себя одинаково.
+"""
+from typing import NamedTuple
+
+from telebot.types import Message
+
+from src.config import settings
+from src.logging import logger
+from src.bot.messages import (
+    AUTHOR_REPLY,
+    BLOCK_SELF,
+    BLOCK_USAGE,
+    BROADCAST_NONE,
+    BROADCAST_STOPPED,
+    CHAT_INFO,
+    EMPTY_MESSAGE,
+    RATE_LIMIT,
+    SENT_FAIL,
+    SENT_OK,
+    TOO_LONG,
+)
+from src.bot.router import extract_command
+from src.services.author_notify import DeliveryResult
+from src.services.media import CAPTION_MAX_LENGTH, CAPTION_TYPES, MEDIA_TYPES, MessageMedia, extract_media, media_rejection
+from src.services.outbox import wake_delivery_workers
+from src.services.rate_limit import RateLimitDecision
+from src.services.replay import defer_author_message, defer_write
+from src.storage.db import is_unavailable
+
+# Типы сообщений, которые получает Router.dispatch: кроме текста — вложения (services/media.py)
+CONTENT_TYPES = ["text", *MEDIA_TYPES]
+
+
+class AuthorReplyPlan(NamedTuple):
+    """Как доставить ответ автора пользователю."""
+    # Текст для send_message (перед копией вложения или вместо неё)
+    text: str | None
+    # Скопировать сообщение автора (copy_message) — ответ с вложением
+    copy: bool = False
+    # Подпись к копии; None — подпись оригинала
+    caption: str | None = None
+
+
+def is_admin_private(message: Message) -> bool:
+    """Команда админа в ЛС с ботом (/broadcast, /block, /export ...)."""
+    return message.from_user.id == settings.admin_id and message.chat.type == "private"
+
+
+def command_args(message: Message) -> str:
+    """Всё после имени команды: '/broadcast текст' -> 'текст'."""
+    parts = (message.text or "").split(maxsplit=1)
+    return parts[1] if len(parts) > 1 else ""
+
+
+def author_reply_plan(message: Message) -> AuthorReplyPlan:
+    """Ответ автора: текст — отдельным сообщением, вложение копируется на стороне Telegram (copy_message)."""
+    if message.text is not None:
+        return AuthorReplyPlan(AUTHOR_REPLY.format(text=message.text))
+    caption = AUTHOR_REPLY.format(text=message.caption or "").strip()
+    if message.content_type in CAPTION_TYPES and len(caption) <= CAPTION_MAX_LENGTH:
+        return AuthorReplyPlan(None, copy=True, caption=caption)
+    return AuthorReplyPlan(caption, copy=True)
+
+
+def chat_info(message: Message) -> str:
+    """Ответ на /getid."""
+    chat = message.chat
+    title = chat.title or chat.username or chat.first_name or "—"
+    return CHAT_INFO.format(chat_id=chat.id, chat_type=chat.type, title=title)
+
+
+def broadcast_stopped_text(stopped: list[int]) -> str:
+    return BROADCAST_STOPPED.format(ids=", ".join(f"#{i}" for i in stopped)) if stopped else BROADCAST_NONE
+
+
+def parse_block_command(text: str | None) -> tuple[int, bool]:
+    """
+    '/block 42' -> (42, True), '/unblock 42' -> (42, False).
+
+    ValueError с текстом ответа админу — неверный формат или попытка заблокировать себя.
+    """
+    parts = (text or "").split()
+    if len(parts) != 2 or not parts[1].lstrip("-").isdigit():
+        raise ValueError(BLOCK_USAGE)
+    target = int(parts[1])
+    banned = extract_command(parts[0]) == "block"
+    if banned and target == settings.admin_id:
+        raise ValueError(BLOCK_SELF)
+    return target, banned
+
+
+def rate_limit_text(decision: RateLimitDecision) -> str:
+    return RATE_LIMIT.format(minutes=decision.ttl // 60)
+
+
+def parse_user_message(message: Message) -> tuple[str, MessageMedia | None]:
+    """
+    Текст (или подпись) и вложение сообщения для автора.
+
+    ValueError с текстом ответа пользователю — сообщение пустое, слишком
+    длинное или вложение не принимается.
+    """
+    media = extract_media(message)
+    text = (message.text or message.caption or "").strip()
+    if not text and media is None:
+        raise ValueError(EMPTY_MESSAGE)
+    if len(text) > settings.max_message_length:
+        raise ValueError(TOO_LONG.format(length=len(text), max_len=settings.max_message_length))
+    rejection = media_rejection(media) if media is not None else None
+    if rejection is not None:
+        raise ValueError(rejection)
+    return text, media
+
+
+def hand_off_to_workers(message_id: int | None) -> bool:
+    """
+    Outbox / дайджест: сообщение уже в очереди на доставку, воркеры разбужены.
+
+    False — доставлять в хендлере: режим sync или запись в БД не удалась
+    (отправляем сразу, чтобы не потерять).
+    """
+    if settings.delivery_mode == "sync" or message_id is None:
+        return False
+    wake_delivery_workers()
+    return True
+
+
+def delivery_outcome(result: DeliveryResult) -> tuple[str, str | None]:
+    """Статус доставки и текст ошибки для author_messages (у delivered — ошибки по остальным адресатам)."""
+    if result.success:
+        return "delivered", result.error_summary or None
+    return "failed", result.error_summary or "Telegram API error"
+
+
+def sent_text(result: DeliveryResult) -> str:
+    return SENT_OK if result.success else SENT_FAIL
+
+
+def status_write_failed(message_id: int, status: str, error: str | None, e: Exception) -> None:
+    """Статус не записался: при недоступности Postgres запись повторится после восстановления."""
+    logger.error("DB error updating delivery status: %s", e)
+    if is_unavailable(e):
+        defer_write(f"status of message {message_id}", lambda repo: repo.set_delivery_status(message_id, status, error))
+
+
+def defer_unsaved_message(
+    message: Message,
+    text: str,
+    media: MessageMedia | None,
+    status: str,
+    error: str | None,
+) -> None:
+    """Postgres был недоступен при записи: сообщение уже отправлено, в БД — после восстановления."""
+    user = message.from_user
+    defer_author_message(user.id, user.username, user.first_name, user.last_name, text, status, error, media)
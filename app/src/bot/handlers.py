@@ -1,179 +1,375 @@
 import telebot
 
 from src.config import settings
-from src.logging import logger
+from src.logging import info_sampled, logger
 from src.bot.keyboards import main_keyboard
 from src.bot.messages import (
     START,
     BTN_WRITE,
     ASK_MESSAGE,
-    RATE_LIMIT,
-    EMPTY_MESSAGE,
-    TOO_LONG,
     SENT_OK,
     SENT_FAIL,
     UNKNOWN,
-    CHAT_INFO,
+    REPLY_SENT,
+    REPLY_FAIL,
+    REPLY_NO_SENDER,
+    BROADCAST_USAGE,
+    EXPORT_USAGE,
+    EXPORT_STARTED,
+    EXPORT_BUSY,
+    BLOCK_OK,
+    UNBLOCK_OK,
 )
+from src.bot.blocklist import set_banned
+from src.bot.handler_logic import (
+    CONTENT_TYPES,
+    author_reply_plan,
+    broadcast_stopped_text,
+    chat_info,
+    command_args,
+    defer_unsaved_message,
+    delivery_outcome,
+    hand_off_to_workers,
+    is_admin_private,
+    parse_block_command,
+    parse_user_message,
+    rate_limit_text,
+    sent_text,
+    status_write_failed,
+)
+from src.bot.webhook_reply import reply
+from src.bot.router import Router
 from src.bot.states import (
-    get_state,
     set_state,
     reset_state,
     STATE_WAITING_MESSAGE,
 )
-from src.services.rate_limit import can_send, get_ttl
-from src.services.author_notify import send_to_recipients
-from src.storage.db import get_session
+from src.services.rate_limit import check_rate_limit
+from src.services.author_notify import author_chat_ids, send_to_recipients
+from src.services.broadcast import launch_broadcast
+from src.services.export import finish_export, parse_export_command, start_export, try_start_export
+from src.services.reply_routing import find_sender
+from src.services.profile_cache import record_message, save_user
+from src.storage.db import is_unavailable, session_scope
 from src.storage.repo import Repository
 
 
-def register_handlers(bot: telebot.TeleBot) -> None:
-    """Регистрирует все хендлеры бота."""
+def register_handlers(bot: telebot.TeleBot) -> Router:
+    """
+    Регистрирует все хендлеры бота.
+
+    В telebot регистрируется один хендлер — Router.dispatch, который выбирает
+    нужный обработчик поиском по словарю (ответ автора / команда / текст кнопки / состояние).
+    Решения без ввода-вывода — в handler_logic.py (общие с async_handlers.py).
+    """
+    router = Router()
+
+    @router.reply(*author_chat_ids())
+    def handle_author_reply(message: telebot.types.Message, state: str | None) -> None:
+        """Автор ответил (reply) на пересланное сообщение — ответ уходит пользователю."""
+        chat_id = message.chat.id
+        try:
+            user_id = find_sender(chat_id, message.reply_to_message.message_id)
+        except Exception as e:
+            logger.error("DB error looking up reply target: %s", e)
+            user_id = None
+
+        if user_id is None:
+            # В группе ответы на прочие сообщения бота — обычная переписка
+            if chat_id == settings.admin_id:
+                reply(bot, chat_id, REPLY_NO_SENDER)
+            return
 
-    @bot.message_handler(commands=["start"])
-    def handle_start(message: telebot.types.Message) -> None:
+        plan = author_reply_plan(message)
+        try:
+            if plan.text is not None:
+                bot.send_message(user_id, plan.text)
+            if plan.copy:
+                bot.copy_message(user_id, chat_id, message.message_id, caption=plan.caption)
+        except Exception as e:
+            logger.error("Failed to deliver author reply to user %d: %s", user_id, e)
+            reply(
+                bot,
+                chat_id,
+                REPLY_FAIL.format(user_id=user_id, error=e),
+            )
+            return
+
+        logger.info("Author reply delivered to user %d from chat %d", user_id, chat_id)
+        reply(
+            bot,
+            chat_id,
+            REPLY_SENT.format(user_id=user_id),
+        )
+
+    @router.command("start")
+    def handle_start(message: telebot.types.Message, state: str | None) -> None:
         """Приветствие + сохранение пользователя."""
         user = message.from_user
-        logger.info("/start from user %d (%s)", user.id, user.username)
+        info_sampled("/start from user %d (%s)", user.id, user.username)
 
         # Сохраняем/обновляем пользователя в БД
         try:
-            session = get_session()
-            repo = Repository(session)
-            repo.upsert_user(
+            save_user(
                 telegram_id=user.id,
                 username=user.username,
                 first_name=user.first_name,
                 last_name=user.last_name,
             )
-            session.close()
         except Exception as e:
             logger.error("DB error on /start: %s", e)
 
         reset_state(user.id)
 
-        bot.send_message(
+        reply(
+            bot,
             message.chat.id,
             START,
             reply_markup=main_keyboard(),
         )
 
-    @bot.message_handler(commands=["getid"])
-    def handle_getid(message: telebot.types.Message) -> None:
+    @router.command("getid")
+    def handle_getid(message: telebot.types.Message, state: str | None) -> None:
         """Показать chat_id текущего чата. Доступно только админу."""
         user = message.from_user
         if user.id != settings.admin_id:
             return
 
         chat = message.chat
-        chat_type = chat.type
-        title = chat.title or chat.username or chat.first_name or "—"
-
-        bot.send_message(
+        reply(
+            bot,
             chat.id,
-            CHAT_INFO.format(chat_id=chat.id, chat_type=chat_type, title=title),
+            chat_info(message),
             parse_mode="HTML",
         )
-        logger.info("/getid by admin in chat %d (%s)", chat.id, chat_type)
+        logger.info("/getid by admin in chat %d (%s)", chat.id, chat.type)
+
+    @router.command("broadcast")
+    def handle_broadcast(message: telebot.types.Message, state: str | None) -> None:
+        """Рассылка всем пользователям. Только админ, только в ЛС с ботом."""
+        if not is_admin_private(message):
+            return
+
+        text = command_args(message)
+        if not text:
+            reply(
+                bot,
+                message.chat.id,
+                BROADCAST_USAGE,
+            )
+            return
+
+        try:
+            with session_scope() as session:
+                broadcast_id, total = Repository(session).create_broadcast(text, message.chat.id)
+        except Exception as e:
+            logger.error("DB error creating broadcast: %s", e)
+            reply(
+                bot,
+                message.chat.id,
+                SENT_FAIL,
+            )
+            return
+
+        logger.info("Broadcast %d created by admin: %d recipients", broadcast_id, total)
+        # Сообщение с прогрессом отправит сама рассылка
+        launch_broadcast(broadcast_id)
+
+    @router.command("broadcast_stop")
+    def handle_broadcast_stop(message: telebot.types.Message, state: str | None) -> None:
+        """Остановить идущие рассылки."""
+        if not is_admin_private(message):
+            return
+
+        try:
+            with session_scope() as session:
+                stopped = Repository(session).cancel_broadcasts()
+        except Exception as e:
+            logger.error("DB error stopping broadcasts: %s", e)
+            reply(
+                bot,
+                message.chat.id,
+                SENT_FAIL,
+            )
+            return
+
+        reply(
+            bot,
+            message.chat.id,
+            broadcast_stopped_text(stopped),
+        )
+
+    @router.command("block", "unblock")
+    def handle_block(message: telebot.types.Message, state: str | None) -> None:
+        """Забанить / разбанить пользователя по telegram_id. Только админ, только в ЛС с ботом."""
+        if not is_admin_private(message):
+            return
 
-    @bot.message_handler(func=lambda m: m.text == BTN_WRITE)
-    def handle_write_button(message: telebot.types.Message) -> None:
+        try:
+            target, banned = parse_block_command(message.text)
+        except ValueError as e:
+            reply(
+                bot,
+                message.chat.id,
+                str(e),
+            )
+            return
+
+        try:
+            set_banned(target, banned)
+        except Exception as e:
+            logger.error("DB error updating blocklist: %s", e)
+            reply(
+                bot,
+                message.chat.id,
+                SENT_FAIL,
+            )
+            return
+
+        logger.info("User %d %s by admin", target, "banned" if banned else "unbanned")
+        reply(
+            bot,
+            message.chat.id,
+            (BLOCK_OK if banned else UNBLOCK_OK).format(user_id=target),
+        )
+
+    @router.command("export")
+    def handle_export(message: telebot.types.Message, state: str | None) -> None:
+        """Выгрузка users / messages файлом. Только админ, только в ЛС с ботом."""
+        if not is_admin_private(message):
+            return
+
+        try:
+            request = parse_export_command(command_args(message))
+        except ValueError as e:
+            reply(
+                bot,
+                message.chat.id,
+                EXPORT_USAGE.format(error=e),
+            )
+            return
+
+        if not try_start_export():
+            reply(
+                bot,
+                message.chat.id,
+                EXPORT_BUSY,
+            )
+            return
+
+        logger.info("Export %s requested by admin", request.filename)
+        try:
+            # Файл собирается и отправляется в фоне — поток webhook не ждёт выгрузку
+            start_export(bot, message.chat.id, request)
+        except Exception:
+            finish_export()
+            raise
+        reply(
+            bot,
+            message.chat.id,
+            EXPORT_STARTED,
+        )
+
+    @router.text(BTN_WRITE)
+    def handle_write_button(message: telebot.types.Message, state: str | None) -> None:
         """Пользователь нажал кнопку 'Написать автору'."""
         user = message.from_user
-        logger.info("Write button pressed by user %d", user.id)
+        info_sampled("Write button pressed by user %d", user.id)
 
-        # Проверяем лимит до перехода в состояние ожидания
-        if user.id != settings.admin_id and not can_send(user.id):
-            ttl = get_ttl(user.id)
-            minutes = ttl // 60
-            bot.send_message(
+        # Проверяем лимит до перехода в состояние ожидания (админ не ограничен)
+        decision = check_rate_limit(user.id)
+        if not decision.allowed:
+            reply(
+                bot,
                 message.chat.id,
-                RATE_LIMIT.format(minutes=minutes),
+                rate_limit_text(decision),
                 reply_markup=main_keyboard(),
             )
             return
 
         set_state(user.id, STATE_WAITING_MESSAGE)
-        bot.send_message(
+        reply(
+            bot,
             message.chat.id,
             ASK_MESSAGE.format(max_len=settings.max_message_length),
         )
 
-    @bot.message_handler(func=lambda m: get_state(m.from_user.id) == STATE_WAITING_MESSAGE)
-    def handle_user_message(message: telebot.types.Message) -> None:
-        """Пользователь прислал текст сообщения для автора."""
+    @router.state(STATE_WAITING_MESSAGE)
+    def handle_user_message(message: telebot.types.Message, state: str | None) -> None:
+        """Пользователь прислал сообщение для автора: текст или вложение с подписью."""
         user = message.from_user
-        text = (message.text or "").strip()
 
         # Сброс состояния в любом случае
         reset_state(user.id)
 
         # Валидация
-        if not text:
-            bot.send_message(
-                message.chat.id,
-                EMPTY_MESSAGE,
-                reply_markup=main_keyboard(),
-            )
-            return
-
-        if len(text) > settings.max_message_length:
-            bot.send_message(
+        try:
+            text, media = parse_user_message(message)
+        except ValueError as e:
+            reply(
+                bot,
                 message.chat.id,
-                TOO_LONG.format(length=len(text), max_len=settings.max_message_length),
+                str(e),
                 reply_markup=main_keyboard(),
             )
             return
 
-        # Сохраняем в БД
-        msg_record = None
+        # Сохраняем в БД: запись сообщения (+ upsert пользователя, если профиль изменился) одним запросом
+        message_id = None
+        db_unavailable = False
         try:
-            session = get_session()
-            repo = Repository(session)
-            repo.upsert_user(
+            message_id = record_message(
                 telegram_id=user.id,
                 username=user.username,
                 first_name=user.first_name,
                 last_name=user.last_name,
+                text=text,
+                media=media,
             )
-            msg_record = repo.create_author_message(user_telegram_id=user.id, text=text)
         except Exception as e:
+            db_unavailable = is_unavailable(e)
             logger.error("DB error saving message: %s", e)
 
+        # Outbox / дайджест: доставят воркеры
+        if hand_off_to_workers(message_id):
+            reply(
+                bot,
+                message.chat.id,
+                SENT_OK,
+                reply_markup=main_keyboard(),
+            )
+            return
+
         # Отправляем адресатам (админ / группа / оба)
-        result = send_to_recipients(bot, user.id, user.username, user.first_name, text)
+        result = send_to_recipients(bot, user.id, user.username, user.first_name, text, media)
 
         # Обновляем статус доставки
-        if msg_record:
+        status, error = delivery_outcome(result)
+        if message_id is not None:
             try:
-                session = get_session()
-                repo = Repository(session)
-                if result.success:
-                    repo.mark_delivered(msg_record.id)
-                else:
-                    repo.mark_failed(msg_record.id, result.error_summary or "Telegram API error")
-                session.close()
+                with session_scope() as session:
+                    Repository(session).set_delivery_status(message_id, status, error)
             except Exception as e:
-                logger.error("DB error updating delivery status: %s", e)
+                status_write_failed(message_id, status, error, e)
+        elif db_unavailable:
+            defer_unsaved_message(message, text, media, status, error)
 
-        if result.success:
-            bot.send_message(
-                message.chat.id,
-                SENT_OK,
-                reply_markup=main_keyboard(),
-            )
-        else:
-            bot.send_message(
-                message.chat.id,
-                SENT_FAIL,
-                reply_markup=main_keyboard(),
-            )
+        reply(
+            bot,
+            message.chat.id,
+            sent_text(result),
+            reply_markup=main_keyboard(),
+        )
 
-    @bot.message_handler(func=lambda m: True)
-    def handle_unknown(message: telebot.types.Message) -> None:
+    @router.default
+    def handle_unknown(message: telebot.types.Message, state: str | None) -> None:
         """Обработка всех прочих сообщений."""
-        bot.send_message(
+        reply(
+            bot,
             message.chat.id,
             UNKNOWN,
             reply_markup=main_keyboard(),
         )
+
+    bot.register_message_handler(router.dispatch, content_types=CONTENT_TYPES)
+    return router
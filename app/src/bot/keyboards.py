@@ -1,10 +1,18 @@
+from functools import lru_cache
+
 from telebot.types import ReplyKeyboardMarkup, KeyboardButton
 
 from src.bot.messages import BTN_WRITE
 
 
-def main_keyboard() -> ReplyKeyboardMarkup:
-    """Главная клавиатура с кнопкой 'Написать автору'."""
+@lru_cache(maxsize=None)
+def main_keyboard() -> str:
+    """
+    Главная клавиатура с кнопкой 'Написать автору'.
+
+    Клавиатура не меняется, поэтому собирается и сериализуется в JSON один раз;
+    telebot принимает готовую строку в reply_markup как есть.
+    """
     markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False)
     markup.add(KeyboardButton(BTN_WRITE))
-    return markup
+    return markup.to_json()
@@ -18,6 +18,8 @@ RATE_LIMIT = "Вы уже отправляли сообщение недавно
 # Валидация
 EMPTY_MESSAGE = "Сообщение не может быть пустым. Попробуйте ещё раз."
 TOO_LONG = "Сообщение слишком длинное ({length} символов). Максимум — {max_len} символов."
+MEDIA_UNSUPPORTED = "Такие вложения не принимаются. Отправьте текст или другой тип файла."
+MEDIA_TOO_BIG = "Файл слишком большой. Максимум — {max_mb} МБ."
 
 # Результат отправки
 SENT_OK = "Ваше сообщение отправлено автору. Спасибо!"
@@ -39,3 +41,41 @@ FWD_HEADER = "✉️ Новое сообщение"
 FWD_USER_ID = "ID пользователя: {user_id}"
 FWD_USERNAME = " (@{username})"
 FWD_FIRST_NAME = " [{first_name}]"
+
+# Дайджест (DELIVERY_MODE=digest): несколько сообщений одним постом
+DIGEST_HEADER = "📬 Новые сообщения: {count}"
+DIGEST_SEPARATOR = "\n\n— — —\n\n"
+
+# Ответ автора пользователю (reply на пересланное сообщение)
+AUTHOR_REPLY = "💬 Ответ автора:\n\n{text}"
+REPLY_SENT = "✅ Ответ отправлен пользователю {user_id}."
+REPLY_FAIL = "❌ Не удалось отправить ответ пользователю {user_id}: {error}"
+REPLY_NO_SENDER = "Не удалось определить отправителя: ответьте на пересланное сообщение пользователя."
+
+# /broadcast (только админ)
+BROADCAST_USAGE = "Использование: /broadcast текст рассылки\nОстановить: /broadcast_stop"
+BROADCAST_PROGRESS = (
+    "📣 Рассылка #{id} — {status}\n"
+    "Обработано: {done} из ~{total}\n"
+    "✅ Доставлено: {sent}\n"
+    "🚫 Заблокировали бота: {blocked}\n"
+    "❌ Ошибки: {failed}"
+)
+BROADCAST_STATUS = {"running": "идёт", "done": "завершена", "cancelled": "остановлена"}
+BROADCAST_STOPPED = "Рассылка остановлена: {ids}"
+BROADCAST_NONE = "Нет идущих рассылок."
+
+BLOCK_USAGE = "Использование: /block <telegram_id>, /unblock <telegram_id>"
+BLOCK_OK = "🚫 Пользователь {user_id} заблокирован: его сообщения больше не обрабатываются."
+UNBLOCK_OK = "✅ Пользователь {user_id} разблокирован."
+BLOCK_SELF = "Нельзя заблокировать администратора."
+
+EXPORT_USAGE = (
+    "Использование: /export users|messages [csv|jsonl] [gz] "
+    "[from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] [status=pending|delivered|failed]\n"
+    "Ошибка: {error}"
+)
+EXPORT_STARTED = "⏳ Готовлю выгрузку, пришлю файлом."
+EXPORT_BUSY = "Уже идёт другая выгрузка, попробуйте позже."
+EXPORT_TOO_LARGE = "Выгрузка получилась {size_mb} МБ — больше лимита Telegram 50 МБ. Сузьте диапазон дат, добавьте gz или скачайте через GET /export."
+EXPORT_FAIL = "❌ Не удалось сделать выгрузку."
@@ -0,0 +1,149 @@
+"""
+Маршрутизация сообщений по словарям вместо линейного перебора хендлеров.
+
+Порядок разбора:
+  1. ответ (reply) на сообщение бота в чате автора — поиск по chat_id
+  2. команда (/start, /getid@bot ...) — поиск по имени команды
+  3. точный текст кнопки (BTN_WRITE) — поиск по тексту
+  4. FSM-состояние пользователя — поиск по состоянию
+  5. хендлер по умолчанию — только для текста: вложения (фото, стикеры ...)
+     вне ответа автора и состояния игнорируются без ответа
+
+Каждый шаг — один поиск в dict. Состояние запрашивается из хранилища не более
+одного раза на апдейт и только если сообщение не разобрано на шагах 1–3;
+оно передаётся в хендлер вторым аргументом (None, если не запрашивалось).
+"""
+from typing import Awaitable, Callable
+
+from telebot.types import Message
+
+from src import metrics
+from src.bot.states import get_state, get_state_async
+from src.profiler import span
+
+Handler = Callable[[Message, str | None], None]
+AsyncHandler = Callable[[Message, str | None], Awaitable[None]]
+
+
+def extract_command(text: str | None) -> str | None:
+    """'/start@my_bot arg' -> 'start'. None, если это не команда."""
+    if not text or not text.startswith("/"):
+        return None
+    return text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+
+
+class Router:
+    def __init__(self) -> None:
+        self._replies: dict[int, Handler] = {}
+        self._commands: dict[str, Handler] = {}
+        self._texts: dict[str, Handler] = {}
+        self._states: dict[str, Handler] = {}
+        self._default: Handler | None = None
+
+    def reply(self, *chat_ids: int) -> Callable[[Handler], Handler]:
+        """Хендлер ответов на сообщения бота в указанных чатах."""
+        def decorator(handler: Handler) -> Handler:
+            for chat_id in chat_ids:
+                self._replies[chat_id] = handler
+            return handler
+        return decorator
+
+    def command(self, *names: str) -> Callable[[Handler], Handler]:
+        def decorator(handler: Handler) -> Handler:
+            for name in names:
+                self._commands[name.lower()] = handler
+            return handler
+        return decorator
+
+    def text(self, value: str) -> Callable[[Handler], Handler]:
+        def decorator(handler: Handler) -> Handler:
+            self._texts[value] = handler
+            return handler
+        return decorator
+
+    def state(self, state: str) -> Callable[[Handler], Handler]:
+        def decorator(handler: Handler) -> Handler:
+            self._states[state] = handler
+            return handler
+        return decorator
+
+    def default(self, handler: Handler) -> Handler:
+        self._default = handler
+        return handler
+
+    def _match_static(self, message: Message) -> Handler | None:
+        """Шаги 1–3: ответ, команда и точный текст, без обращения к хранилищу состояний."""
+        original = message.reply_to_message
+        if original is not None and original.from_user is not None and original.from_user.is_bot:
+            handler = self._replies.get(message.chat.id)
+            if handler is not None:
+                return handler
+
+        text = message.text
+
+        command = extract_command(text)
+        if command is not None:
+            handler = self._commands.get(command)
+            if handler is not None:
+                return handler
+
+        if text is not None:
+            return self._texts.get(text)
+        return None
+
+    def _needs_state(self, message: Message) -> bool:
+        return bool(self._states) and message.from_user is not None
+
+    def _fallback(self, message: Message, state: str | None) -> Handler | None:
+        """Шаги 4–5: хендлер состояния или (для текста) хендлер по умолчанию."""
+        return self._states.get(state, self._default if message.content_type == "text" else None)
+
+    def resolve(self, message: Message) -> tuple[Handler | None, str | None]:
+        """Найти хендлер для сообщения. Возвращает (handler, state)."""
+        handler = self._match_static(message)
+        if handler is not None:
+            return handler, None
+
+        state = None
+        if self._needs_state(message):
+            state = get_state(message.from_user.id)
+        return self._fallback(message, state), state
+
+    def dispatch(self, message: Message) -> None:
+        """Точка входа для telebot: единственный зарегистрированный хендлер."""
+        handler, state = self.resolve(message)
+        if handler is None:
+            return
+        name = handler.__name__
+        try:
+            with metrics.timed(metrics.HANDLER_LATENCY, name), span("handler", name):
+                handler(message, state)
+        except Exception:
+            metrics.HANDLER_ERRORS.labels(name).inc()
+            raise
+
+
+class AsyncRouter(Router):
+    """Тот же разбор для AsyncTeleBot: хендлеры — корутины, состояние — через get_state_async."""
+
+    async def resolve_async(self, message: Message) -> tuple[AsyncHandler | None, str | None]:
+        handler = self._match_static(message)
+        if handler is not None:
+            return handler, None
+
+        state = None
+        if self._needs_state(message):
+            state = await get_state_async(message.from_user.id)
+        return self._fallback(message, state), state
+
+    async def dispatch(self, message: Message) -> None:
+        handler, state = await self.resolve_async(message)
+        if handler is None:
+            return
+        name = handler.__name__
+        try:
+            with metrics.timed(metrics.HANDLER_LATENCY, name), span("handler", name):
+                await handler(message, state)
+        except Exception:
+            metrics.HANDLER_ERRORS.labels(name).inc()
+            raise
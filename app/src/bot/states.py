@@ -1,23 +1,212 @@
 """
-Простая FSM-логика через словарь.
-Хранит состояния пользователей в памяти (для MVP достаточно).
+FSM-состояния пользователей.
+
+Хранилище подключаемое (STATE_BACKEND):
+  - redis:  общее для всех воркеров и контейнеров, ключи с TTL
+  - memory: словарь в памяти процесса (для тестов и локального запуска)
+
+Брошенные состояния истекают через STATE_TTL_SECONDS в обоих бэкендах.
+Для ASGI-режима у каждой функции есть асинхронный вариант (*_async).
+
+Пока Redis недоступен, redis-бэкенд пишет и читает состояния в памяти
+процесса (FallbackStateStore): диалог продолжается, если следующий апдейт
+пользователя попадёт в тот же воркер.
 """
+import threading
+import time
+from typing import Protocol
+
+from src.config import settings
+from src.logging import logger
+from src.storage.circuit_breaker import CircuitOpenError
+from src.storage.redis_client import get_async_redis, get_redis
 
 # Возможные состояния
 STATE_IDLE = "idle"
 STATE_WAITING_MESSAGE = "waiting_message"
 
-# user_id -> state
-_user_states: dict[int, str] = {}
+
+class StateStore(Protocol):
+    def get(self, user_id: int) -> str | None: ...
+
+    def set(self, user_id: int, state: str) -> None: ...
+
+    def reset(self, user_id: int) -> None: ...
+
+    async def get_async(self, user_id: int) -> str | None: ...
+
+    async def set_async(self, user_id: int, state: str) -> None: ...
+
+    async def reset_async(self, user_id: int) -> None: ...
+
+
+class MemoryStateStore:
+    """Состояния в памяти процесса: user_id -> (state, expires_at)."""
+
+    def __init__(self, ttl: int):
+        self._ttl = ttl
+        self._states: dict[int, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> str | None:
+        entry = self._states.get(user_id)
+        if entry is None:
+            return None
+        state, expires_at = entry
+        if expires_at <= time.monotonic():
+            with self._lock:
+                self._states.pop(user_id, None)
+            return None
+        return state
+
+    def set(self, user_id: int, state: str) -> None:
+        with self._lock:
+            self._states[user_id] = (state, time.monotonic() + self._ttl)
+
+    def reset(self, user_id: int) -> None:
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    # Память процесса не блокирует event loop — async-варианты просто делегируют
+    async def get_async(self, user_id: int) -> str | None:
+        return self.get(user_id)
+
+    async def set_async(self, user_id: int, state: str) -> None:
+        self.set(user_id, state)
+
+    async def reset_async(self, user_id: int) -> None:
+        self.reset(user_id)
+
+
+class RedisStateStore:
+    """Состояния в Redis: один ключ на пользователя, TTL на каждом ключе."""
+
+    def __init__(self, ttl: int):
+        self._ttl = ttl
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"fsm:state:{user_id}"
+
+    def get(self, user_id: int) -> str | None:
+        return get_redis().get(self._key(user_id))
+
+    def set(self, user_id: int, state: str) -> None:
+        get_redis().set(self._key(user_id), state, ex=self._ttl)
+
+    def reset(self, user_id: int) -> None:
+        get_redis().delete(self._key(user_id))
+
+    async def get_async(self, user_id: int) -> str | None:
+        return await get_async_redis().get(self._key(user_id))
+
+    async def set_async(self, user_id: int, state: str) -> None:
+        await get_async_redis().set(self._key(user_id), state, ex=self._ttl)
+
+    async def reset_async(self, user_id: int) -> None:
+        await get_async_redis().delete(self._key(user_id))
+
+
+def _warn(action: str, user_id: int, error: Exception) -> None:
+    # О разомкнутом breaker уже сообщено в логе при размыкании
+    if not isinstance(error, CircuitOpenError):
+        logger.warning("State %s for user %d falls back to memory: %s", action, user_id, error)
+
+
+class FallbackStateStore:
+    """Основное хранилище (Redis) с запасным в памяти процесса на время его недоступности."""
+
+    def __init__(self, primary: StateStore, fallback: MemoryStateStore):
+        self._primary = primary
+        self._fallback = fallback
+
+    def get(self, user_id: int) -> str | None:
+        try:
+            state = self._primary.get(user_id)
+        except Exception as e:
+            _warn("get", user_id, e)
+            state = None
+        return state or self._fallback.get(user_id)
+
+    def set(self, user_id: int, state: str) -> None:
+        try:
+            self._primary.set(user_id, state)
+        except Exception as e:
+            _warn("set", user_id, e)
+            self._fallback.set(user_id, state)
+
+    def reset(self, user_id: int) -> None:
+        self._fallback.reset(user_id)
+        try:
+            self._primary.reset(user_id)
+        except Exception as e:
+            _warn("reset", user_id, e)
+
+    async def get_async(self, user_id: int) -> str | None:
+        try:
+            state = await self._primary.get_async(user_id)
+        except Exception as e:
+            _warn("get", user_id, e)
+            state = None
+        return state or self._fallback.get(user_id)
+
+    async def set_async(self, user_id: int, state: str) -> None:
+        try:
+            await self._primary.set_async(user_id, state)
+        except Exception as e:
+            _warn("set", user_id, e)
+            self._fallback.set(user_id, state)
+
+    async def reset_async(self, user_id: int) -> None:
+        self._fallback.reset(user_id)
+        try:
+            await self._primary.reset_async(user_id)
+        except Exception as e:
+            _warn("reset", user_id, e)
+
+
+_store: StateStore | None = None
+
+
+def get_state_store() -> StateStore:
+    """Получить (или создать) хранилище состояний согласно STATE_BACKEND."""
+    global _store
+    if _store is None:
+        if settings.state_backend == "redis":
+            _store = FallbackStateStore(
+                RedisStateStore(ttl=settings.state_ttl_seconds),
+                MemoryStateStore(ttl=settings.state_ttl_seconds),
+            )
+        else:
+            _store = MemoryStateStore(ttl=settings.state_ttl_seconds)
+    return _store
+
+
+def set_state_store(store: StateStore) -> None:
+    """Подменить хранилище состояний (например, в тестах)."""
+    global _store
+    _store = store
 
 
 def get_state(user_id: int) -> str:
-    return _user_states.get(user_id, STATE_IDLE)
+    return get_state_store().get(user_id) or STATE_IDLE
 
 
 def set_state(user_id: int, state: str) -> None:
-    _user_states[user_id] = state
+    get_state_store().set(user_id, state)
 
 
 def reset_state(user_id: int) -> None:
-    _user_states.pop(user_id, None)
+    get_state_store().reset(user_id)
+
+
+async def get_state_async(user_id: int) -> str:
+    return await get_state_store().get_async(user_id) or STATE_IDLE
+
+
+async def set_state_async(user_id: int, state: str) -> None:
+    await get_state_store().set_async(user_id, state)
+
+
+async def reset_state_async(user_id: int) -> None:
+    await get_state_store().reset_async(user_id)
@@ -0,0 +1,152 @@
+"""
+Очередь апдейтов для фоновой обработки webhook.
+
+Эндпоинт кладёт принятый апдейт (UpdateRecord) в ограниченную очередь и сразу
+отвечает 200, а пул потоков-воркеров прогоняет апдейты через хендлеры.
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from src.logging import logger
+from src.bot.fast_update import UpdateRecord
+
+# Маркер остановки воркера
+_STOP = object()
+
+
+@dataclass
+class QueueStats:
+    """Снимок статистики очереди."""
+    depth: int
+    capacity: int
+    workers: int
+    enqueued: int
+    processed: int
+    failed: int
+    rejected: int
+    # Время ожидания в очереди и время обработки (мс)
+    avg_wait_ms: float
+    max_wait_ms: float
+    avg_process_ms: float
+
+
+class UpdateQueue:
+    """Ограниченная in-process очередь апдейтов с пулом воркеров."""
+
+    def __init__(self, handler: Callable[[UpdateRecord], None], maxsize: int, workers: int):
+        self._handler = handler
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._capacity = maxsize
+        self._workers_count = workers
+        self._threads: list[threading.Thread] = []
+        self._closed = False
+
+        self._lock = threading.Lock()
+        self._enqueued = 0
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._process_total = 0.0
+
+    def start(self) -> None:
+        """Запустить воркеры."""
+        for i in range(self._workers_count):
+            thread = threading.Thread(target=self._worker, name=f"update-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Update queue started: capacity=%d, workers=%d", self._capacity, self._workers_count)
+
+    def put(self, record: UpdateRecord) -> bool:
+        """
+        Положить апдейт в очередь без ожидания.
+
+        Возвращает False, если очередь переполнена или уже останавливается.
+        """
+        if self._closed:
+            with self._lock:
+                self._rejected += 1
+            return False
+        try:
+            self._queue.put_nowait((record, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            record, enqueued_at = item
+            started = time.monotonic()
+            ok = True
+            try:
+                self._handler(record)
+            except Exception as e:
+                ok = False
+                logger.error("Error processing queued update: %s", e)
+            finished = time.monotonic()
+
+            wait = started - enqueued_at
+            with self._lock:
+                self._processed += 1
+                if not ok:
+                    self._failed += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                self._process_total += finished - started
+            self._queue.task_done()
+
+    def stats(self) -> QueueStats:
+        """Текущая статистика очереди."""
+        with self._lock:
+            processed = self._processed
+            return QueueStats(
+                depth=self._queue.qsize(),
+                capacity=self._capacity,
+                workers=self._workers_count,
+                enqueued=self._enqueued,
+                processed=processed,
+                failed=self._failed,
+                rejected=self._rejected,
+                avg_wait_ms=(self._wait_total / processed * 1000) if processed else 0.0,
+                max_wait_ms=self._wait_max * 1000,
+                avg_process_ms=(self._process_total / processed * 1000) if processed else 0.0,
+            )
+
+    def shutdown(self, timeout: float) -> None:
+        """
+        Перестать принимать апдейты, дообработать очередь и остановить воркеры.
+
+        Маркеры остановки кладутся в конец очереди, поэтому всё, что уже
+        принято, будет обработано до выхода воркеров.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        logger.info("Draining update queue: %d pending", self._queue.qsize())
+
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(_STOP, timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout=max(deadline - time.monotonic(), 0))
+
+        left = self._queue.qsize()
+        if left:
+            logger.warning("Update queue drain timed out, %d updates left unprocessed", left)
+        logger.info("Update queue stopped: %s", self.stats())
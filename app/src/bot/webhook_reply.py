@@ -0,0 +1,71 @@
+"""
+Ответ пользователю в теле webhook-ответа (WEBHOOK_REPLY=true).
+
+Telegram позволяет вернуть в ответе на webhook один вызов Bot API — он
+выполняется без отдельного исходящего запроса. Хендлер отвечает через
+reply()/reply_async(): первый ответ за апдейт кладётся в слот текущего
+запроса, остальные (и все ответы вне слота — очередь, outbox) уходят обычным
+send_message.
+
+Результат такого вызова боту неизвестен (нет message_id, ошибка не видна),
+поэтому через слот идут только ответы пользователю, но не доставка автору.
+"""
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+import telebot
+from telebot.async_telebot import AsyncTeleBot
+
+from src.config import settings
+
+# Список, а не значение: AsyncTeleBot запускает хендлеры в отдельных задачах
+# с копией контекста, и запись должна быть видна вызывающему коду
+_slot: ContextVar[list[dict] | None] = ContextVar("webhook_reply", default=None)
+
+
+@contextmanager
+def capture_reply() -> Iterator[list[dict]]:
+    """Открыть слот для ответа на время обработки апдейта."""
+    slot: list[dict] = []
+    token = _slot.set(slot if settings.webhook_reply else None)
+    try:
+        yield slot
+    finally:
+        _slot.reset(token)
+
+
+def _take_slot(chat_id: int, text: str, kwargs: dict) -> bool:
+    slot = _slot.get()
+    if slot is None or slot:
+        return False
+    slot.append({"method": "sendMessage", "chat_id": chat_id, "text": text, **kwargs})
+    return True
+
+
+def reply(bot: telebot.TeleBot, chat_id: int, text: str, **kwargs) -> None:
+    """Ответить пользователю: в webhook-ответ, если слот свободен, иначе send_message."""
+    if not _take_slot(chat_id, text, kwargs):
+        bot.send_message(chat_id, text, **kwargs)
+
+
+async def reply_async(bot: AsyncTeleBot, chat_id: int, text: str, **kwargs) -> None:
+    """Асинхронный вариант reply."""
+    if not _take_slot(chat_id, text, kwargs):
+        await bot.send_message(chat_id, text, **kwargs)
+
+
+def render(slot: list[dict]) -> str | None:
+    """Тело webhook-ответа с вызовом из слота. None — слот пуст."""
+    if not slot:
+        return None
+    call = dict(slot[0])
+    # reply_markup уже сериализован (см. main_keyboard) — вставляем как есть
+    markup = call.pop("reply_markup", None)
+    body = json.dumps(call, ensure_ascii=False)
+    if markup is not None:
+        if not isinstance(markup, str):
+            markup = markup.to_json()
+        body = f'{body[:-1]}, "reply_markup": {markup}}}'
+    return body
@@ -1,23 +1,75 @@
+import hmac
+import json
+import time
+
 import telebot
-from flask import Flask, request, abort
+from flask import Flask, Response, abort, g, request
 
+from src import metrics
 from src.config import settings
-from src.logging import logger
+from src.logging import info_sampled, log_context, logger
+from src.profiler import profile_update, slow_updates
+from src.bot.dedup import claim_update, release_update
+from src.bot.fast_update import UpdateRecord, parse_update
+from src.bot.update_queue import UpdateQueue
+from src.bot.webhook_reply import capture_reply, render
+from src.services.export import finish_export, iter_export, parse_export_request, try_start_export
 
 app = Flask(__name__)
 
 # Экземпляр бота — устанавливается из main.py
 _bot: telebot.TeleBot | None = None
 
+# Очередь апдейтов (только при UPDATE_PROCESSING=queue)
+_queue: UpdateQueue | None = None
+
 
 def set_bot(bot: telebot.TeleBot) -> None:
     """Установить экземпляр бота для обработки апдейтов."""
-    global _bot
+    global _bot, _queue
     _bot = bot
 
+    if settings.update_processing == "queue" and _queue is None:
+        _queue = UpdateQueue(
+            _process_update,
+            maxsize=settings.update_queue_size,
+            workers=settings.update_workers,
+        )
+        _queue.start()
+        metrics.register_gauge("govorun_update_queue_depth", "Updates waiting in the queue", lambda: _queue.stats().depth)
+        metrics.register_gauge("govorun_update_queue_capacity", "Update queue capacity", lambda: _queue.stats().capacity)
+
+
+def get_update_queue() -> UpdateQueue | None:
+    """Очередь апдейтов, если включена фоновая обработка."""
+    return _queue
+
+
+def shutdown() -> None:
+    """Дообработать очередь апдейтов перед остановкой процесса."""
+    if _queue is not None:
+        _queue.shutdown(timeout=settings.update_queue_drain_timeout)
+
+
+def _process_update(record: UpdateRecord, received_at: float | None = None) -> None:
+    """Прогнать принятый апдейт через хендлеры. received_at — для профилировщика (см. src.profiler)."""
+    with log_context(record.update_id, record.user_id), profile_update(record.update_id, record.user_id, received_at):
+        # Повторная доставка того же апдейта — отбрасываем до любой работы
+        if not claim_update(record.update_id):
+            metrics.UPDATES_DROPPED.labels("duplicate").inc()
+            info_sampled("Duplicate update %d dropped", record.update_id)
+            return
+
+        try:
+            _bot.process_new_updates([record.to_update()])
+        except Exception:
+            # Дадим Telegram повторить доставку
+            release_update(record.update_id)
+            raise
+
 
 @app.route(f"/{settings.webhook_path}", methods=["POST"])
-def webhook() -> tuple[str, int]:
+def webhook() -> Response | tuple[str, int]:
     """Эндпоинт для приёма webhook-апдейтов от Telegram."""
     if _bot is None:
         logger.error("Bot instance not set")
@@ -34,14 +86,102 @@ def webhook() -> tuple[str, int]:
         logger.warning("Invalid content-type: %s", request.headers.get("content-type"))
         abort(400)
 
-    json_data = request.get_data(as_text=True)
-    update = telebot.types.Update.de_json(json_data)
-    _bot.process_new_updates([update])
+    # Ненужные хендлерам апдейты отбрасываются до создания объектов telebot
+    received_at = time.perf_counter()
+    try:
+        record = parse_update(request.get_data())
+    except ValueError:
+        logger.warning("Malformed update body")
+        abort(400)
+    if record is None:
+        return "OK", 200
 
+    if _queue is not None:
+        # Отвечаем сразу, обработка — в фоновых воркерах.
+        # При переполнении просим Telegram повторить доставку позже.
+        if not _queue.put(record):
+            logger.warning("Update queue is full, rejecting update")
+            abort(503)
+        return "OK", 200
+
+    # Ответ хендлера пользователю (если WEBHOOK_REPLY) уходит в теле ответа Telegram
+    with capture_reply() as slot:
+        _process_update(record, received_at)
+
+    body = render(slot)
+    if body is not None:
+        return Response(body, content_type="application/json")
     return "OK", 200
 
 
+@app.before_request
+def _start_timer() -> None:
+    g.started = time.perf_counter()
+
+
+@app.after_request
+def _observe_request(response: Response) -> Response:
+    started = g.get("started")
+    if started is not None:
+        metrics.observe_http(request.endpoint or "unknown", response.status_code, time.perf_counter() - started)
+    return response
+
+
+def require_internal_token() -> None:
+    """Проверить Bearer-токен служебных эндпоинтов (если INTERNAL_API_TOKEN задан)."""
+    if not settings.internal_api_token:
+        return
+    expected = f"Bearer {settings.internal_api_token}"
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+        abort(401)
+
+
 @app.route("/health", methods=["GET"])
 def health() -> tuple[str, int]:
     """Healthcheck эндпоинт."""
     return "OK", 200
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint() -> Response:
+    """Метрики в формате Prometheus."""
+    if not settings.metrics_enabled:
+        abort(404)
+    require_internal_token()
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/debug/slow-updates", methods=["GET"])
+def slow_updates_endpoint() -> Response:
+    """Трассы медленных апдейтов (PROFILE_SLOW_UPDATES_MS); только при заданном INTERNAL_API_TOKEN."""
+    if not settings.internal_api_token:
+        abort(404)
+    require_internal_token()
+    return Response(json.dumps(slow_updates(), ensure_ascii=False), content_type="application/json")
+
+
+@app.route("/export/<table>", methods=["GET"])
+def export_endpoint(table: str) -> Response:
+    """
+    Потоковая выгрузка users / messages (параметры — как у parse_export_request).
+
+    Отдаётся только при заданном INTERNAL_API_TOKEN: выгрузка содержит тексты
+    и данные пользователей.
+    """
+    if not settings.internal_api_token:
+        abort(404)
+    require_internal_token()
+    try:
+        export = parse_export_request(table, request.args)
+    except ValueError as e:
+        return Response(f"{e}\n", status=400, content_type="text/plain")
+    if not try_start_export():
+        return Response("Export already in progress\n", status=429, content_type="text/plain")
+
+    response = Response(iter_export(export), content_type=export.content_type)
+    response.headers["Content-Disposition"] = f'attachment; filename="{export.filename}"'
+    # Слот освобождается, когда тело отдано целиком или клиент отключился
+    response.call_on_close(finish_export)
+    logger.info("Export %s started over HTTP", export.filename)
+    return response
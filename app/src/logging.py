@@ -1,8 +1,96 @@
+"""
+Логирование.
+
+LOG_FORMAT:
+  - text: строки для человека
+  - json: одна JSON-строка на событие; у событий обработки апдейта есть
+    поля update_id и user_id (см. log_context)
+
+LOG_HANDLER:
+  - sync:  форматирование и запись в stdout в потоке вызова
+  - queue: вызов только кладёт запись в очередь (LOG_QUEUE_SIZE), форматирует
+    и пишет фоновый поток — медленный stdout не задерживает обработку апдейтов;
+    при переполнении очереди записи отбрасываются (govorun_log_records_dropped_total)
+
+Частые INFO-события (по одному на апдейт) пишутся через info_sampled: в лог
+попадает доля LOG_SAMPLE_RATE, для остальных не создаётся даже LogRecord.
+"""
+import atexit
+import json
 import logging
+import queue
+import random
 import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator
 
+from src import metrics
 from src.config import settings
 
+_update_id: ContextVar[int | None] = ContextVar("log_update_id", default=None)
+_user_id: ContextVar[int | None] = ContextVar("log_user_id", default=None)
+
+_sample_rate = settings.log_sample_rate
+
+
+class _ContextFilter(logging.Filter):
+    """Добавить к записи update_id и user_id текущего апдейта (в потоке вызова)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.update_id = _update_id.get()
+        record.user_id = _user_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        update_id = getattr(record, "update_id", None)
+        if update_id is not None:
+            entry["update_id"] = update_id
+        user_id = getattr(record, "user_id", None)
+        if user_id is not None:
+            entry["user_id"] = user_id
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(QueueHandler):
+    """Только кладёт запись в очередь; форматирование — в потоке QueueListener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+
+class _QueueListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Ждём места в очереди: при остановке записи дописываются, а не теряются
+        self.queue.put(self._sentinel)
+
+
+def _formatter() -> logging.Formatter:
+    if settings.log_format == "json":
+        return JsonFormatter()
+    return logging.Formatter(
+        fmt="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
 
 def setup_logging() -> logging.Logger:
     """Настройка единого логгера для приложения."""
@@ -12,14 +100,39 @@ def setup_logging() -> logging.Logger:
     if not logger.handlers:
         handler = logging.StreamHandler(sys.stdout)
         handler.setLevel(settings.log_level.upper())
-        formatter = logging.Formatter(
-            fmt="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S",
-        )
-        handler.setFormatter(formatter)
+        handler.setFormatter(_formatter())
+
+        if settings.log_handler == "queue":
+            records: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+            listener = _QueueListener(records, handler, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)
+            handler = _QueueHandler(records)
+            metrics.register_gauge("govorun_log_queue_depth", "Log records waiting to be written", records.qsize)
+
+        handler.addFilter(_ContextFilter())
         logger.addHandler(handler)
 
     return logger
 
 
+@contextmanager
+def log_context(update_id: int, user_id: int | None) -> Iterator[None]:
+    """Пометить события внутри блока (в этом потоке / задаче asyncio) апдейтом и пользователем."""
+    update_token = _update_id.set(update_id)
+    user_token = _user_id.set(user_id)
+    try:
+        yield
+    finally:
+        _update_id.reset(update_token)
+        _user_id.reset(user_token)
+
+
+def info_sampled(msg: str, *args: object) -> None:
+    """INFO-событие горячего пути: пишется с вероятностью LOG_SAMPLE_RATE."""
+    if _sample_rate < 1.0 and random.random() >= _sample_rate:
+        return
+    logger.info(msg, *args, stacklevel=2)
+
+
 logger = setup_logging()
@@ -1,60 +1,88 @@
-import time
-
 import telebot
+from telebot.async_telebot import AsyncTeleBot, ExceptionHandler
 
 from src.config import settings
 from src.logging import logger
+from src.services.http_client import install_async_http_client, install_http_client
+from src.services.broadcast import start_broadcasts, stop_broadcasts
+from src.services.outbox import start_delivery_workers, stop_delivery_workers
+from src.services.profile_cache import start_last_seen_flusher, stop_last_seen_flusher
+from src.services.reply_routing import start_forwards_flusher, stop_forwards_flusher
+from src.services.replay import start_replay, stop_replay
+from src.bot.blocklist import start_blocklist, stop_blocklist
 from src.bot.handlers import register_handlers
-from src.bot.webhook_server import app, set_bot
-from src.storage.db import engine
-from src.storage.models import Base
+from src.bot.async_handlers import register_async_handlers
+from src.bot.webhook_server import app, set_bot, shutdown
+from src.startup import run_startup
 
 
 def create_bot() -> telebot.TeleBot:
     """Создать и настроить экземпляр бота."""
+    install_http_client()
     bot = telebot.TeleBot(settings.bot_token, threaded=False)
     register_handlers(bot)
     return bot
 
 
-def setup_webhook(bot: telebot.TeleBot) -> None:
-    """Установить webhook в Telegram."""
-    logger.info("Removing old webhook...")
-    bot.delete_webhook(drop_pending_updates=True)
-    time.sleep(0.5)
+class _RaiseHandlerErrors(ExceptionHandler):
+    """AsyncTeleBot по умолчанию глотает исключения хендлеров — пробрасываем их наверх,
+    чтобы апдейт не считался обработанным (см. release_update_async)."""
 
-    logger.info("Setting webhook: %s", settings.webhook_url)
-    bot.set_webhook(
-        url=settings.webhook_url,
-        secret_token=settings.webhook_secret_token or None,
-    )
-    logger.info("Webhook set successfully")
+    async def handle(self, exception: Exception) -> bool:
+        raise exception
 
 
-def init_db() -> None:
-    """Создать таблицы, если их нет (для простоты MVP)."""
-    logger.info("Initializing database tables...")
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables ready")
+def create_async_bot() -> AsyncTeleBot:
+    """Создать асинхронный бот (SERVER_MODE=asgi)."""
+    install_async_http_client()
+    bot = AsyncTeleBot(settings.bot_token, exception_handler=_RaiseHandlerErrors())
+    register_async_handlers(bot)
+    return bot
 
 
 def main() -> None:
     logger.info("Starting govorun bot...")
 
-    # Инициализация БД
-    init_db()
+    if settings.server_mode == "asgi":
+        # Инициализация, webhook и остановка — в lifespan ASGI-приложения
+        import uvicorn
+
+        uvicorn.run("src.asgi:application", host=settings.app_host, port=settings.app_port)
+        return
 
     # Создание бота и регистрация хендлеров
     bot = create_bot()
+
+    # Миграции БД и webhook (пропускаются, если уже актуальны)
+    run_startup(bot)
     set_bot(bot)
 
-    # Установка webhook
-    setup_webhook(bot)
+    # Повтор записей в БД, отложенных на время недоступности Postgres
+    start_replay()
+    # Воркеры доставки (при DELIVERY_MODE=outbox / digest)
+    start_delivery_workers(bot)
+    # Рассылки, прерванные рестартом
+    start_broadcasts(bot)
+    # Отложенная запись last_seen_at
+    start_last_seen_flusher()
+    # Отложенная запись forwarded_messages (ответы автора)
+    start_forwards_flusher()
+    # Блоклист /block и его синхронизация между процессами
+    start_blocklist()
 
     logger.info("Starting webhook server on %s:%d", settings.app_host, settings.app_port)
 
     # Запуск Flask через gunicorn (в продакшене) или встроенный сервер
-    app.run(host=settings.app_host, port=settings.app_port)
+    try:
+        app.run(host=settings.app_host, port=settings.app_port)
+    finally:
+        shutdown()
+        stop_broadcasts()
+        stop_delivery_workers()
+        stop_last_seen_flusher()
+        stop_forwards_flusher()
+        stop_blocklist()
+        stop_replay()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+"""
+Prometheus-метрики приложения.
+
+Гистограммы и счётчики обновляются на горячем пути (одно perf_counter и одно
+observe на вызов), а gauge-значения (пул соединений, очередь апдейтов)
+вычисляются лениво — только в момент запроса /metrics.
+
+При нескольких процессах gunicorn задайте PROMETHEUS_MULTIPROC_DIR: тогда
+счётчики и гистограммы агрегируются по всем воркерам, а gauge-значения
+отдаёт процесс, обработавший запрос.
+"""
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from src.profiler import record_span
+
+# Бакеты под типичные задержки: от миллисекунд (Redis) до секунд (Telegram API)
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUESTS = Counter(
+    "govorun_http_requests_total",
+    "HTTP requests by endpoint and status code",
+    ["endpoint", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "govorun_http_request_duration_seconds",
+    "HTTP request handling time by endpoint",
+    ["endpoint"],
+    buckets=_BUCKETS,
+)
+UPDATES_DROPPED = Counter(
+    "govorun_updates_dropped_total",
+    "Webhook updates dropped before handlers by reason",
+    ["reason"],
+)
+HANDLER_LATENCY = Histogram(
+    "govorun_handler_duration_seconds",
+    "Bot handler execution time",
+    ["handler"],
+    buckets=_BUCKETS,
+)
+HANDLER_ERRORS = Counter(
+    "govorun_handler_errors_total",
+    "Bot handler exceptions",
+    ["handler"],
+)
+SEND_LATENCY = Histogram(
+    "govorun_send_duration_seconds",
+    "Delivery of a user message to one recipient",
+    ["recipient", "result"],
+    buckets=_BUCKETS,
+)
+BOT_API_LATENCY = Histogram(
+    "govorun_bot_api_duration_seconds",
+    "Telegram Bot API call time by method and HTTP status",
+    ["method", "status"],
+    buckets=_BUCKETS,
+)
+DB_LATENCY = Histogram(
+    "govorun_db_duration_seconds",
+    "Repository method execution time",
+    ["method"],
+    buckets=_BUCKETS,
+)
+DB_ERRORS = Counter(
+    "govorun_db_errors_total",
+    "Repository method exceptions",
+    ["method"],
+)
+REPLY_CACHE_LOOKUPS = Counter(
+    "govorun_reply_cache_lookups_total",
+    "Forwarded message -> sender lookups by result (hit / db / miss)",
+    ["result"],
+)
+PROFILE_CACHE_LOOKUPS = Counter(
+    "govorun_profile_cache_lookups_total",
+    "User profile checks by result (hit: upsert skipped / miss: written to Postgres)",
+    ["result"],
+)
+RATE_LIMIT_FALLBACKS = Counter(
+    "govorun_rate_limit_fallbacks_total",
+    "Rate limit checks decided by the local limiter because Redis was unavailable",
+)
+CIRCUIT_REJECTED = Counter(
+    "govorun_circuit_rejected_total",
+    "Calls failed fast because the storage circuit breaker is open",
+    ["breaker"],
+)
+REPLAY_WRITES = Counter(
+    "govorun_replay_writes_total",
+    "DB writes deferred during a Postgres outage, by result (queued / replayed / dropped)",
+    ["result"],
+)
+LOG_RECORDS_DROPPED = Counter(
+    "govorun_log_records_dropped_total",
+    "Log records dropped because the log queue (LOG_HANDLER=queue) was full",
+)
+LAST_SEEN_FLUSHED = Counter(
+    "govorun_last_seen_flushed_total",
+    "Users whose last_seen_at was written by the write-behind buffer",
+)
+RATE_LIMIT_LATENCY = Histogram(
+    "govorun_rate_limit_duration_seconds",
+    "Rate limit check time by result",
+    ["result"],
+    buckets=_BUCKETS,
+)
+
+
+class _LazyGauges(Collector):
+    """Gauge-метрики, значения которых считаются при сборе."""
+
+    def __init__(self) -> None:
+        self._gauges: dict[str, tuple[str, Callable[[], float | None]]] = {}
+
+    def add(self, name: str, documentation: str, getter: Callable[[], float | None]) -> None:
+        self._gauges[name] = (documentation, getter)
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        for name, (documentation, getter) in self._gauges.items():
+            try:
+                value = getter()
+            except Exception:
+                continue
+            if value is not None:
+                yield GaugeMetricFamily(name, documentation, value=value)
+
+
+_lazy_gauges = _LazyGauges()
+REGISTRY.register(_lazy_gauges)
+
+
+def register_gauge(name: str, documentation: str, getter: Callable[[], float | None]) -> None:
+    """Зарегистрировать gauge, значение которого вычисляется при сборе метрик."""
+    _lazy_gauges.add(name, documentation, getter)
+
+
+@contextmanager
+def timed(histogram: Histogram, *labels: str) -> Iterator[None]:
+    """Замерить время блока и записать в гистограмму."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.perf_counter() - started)
+
+
+def track_db(method: Callable) -> Callable:
+    """Декоратор для методов Repository: время и ошибки по имени метода."""
+    name = method.__name__
+    latency = DB_LATENCY.labels(name)
+    errors = DB_ERRORS.labels(name)
+
+    if inspect.iscoroutinefunction(method):
+        @wraps(method)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                latency.observe(elapsed)
+                record_span("db", name, elapsed)
+
+        return async_wrapper
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            latency.observe(elapsed)
+            record_span("db", name, elapsed)
+
+    return wrapper
+
+
+def observe_http(endpoint: str, status: int, duration: float) -> None:
+    HTTP_REQUESTS.labels(endpoint, str(status)).inc()
+    HTTP_LATENCY.labels(endpoint).observe(duration)
+
+
+def render() -> tuple[bytes, str]:
+    """Текст метрик в формате Prometheus и его content-type."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_lazy_gauges)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,116 @@
+"""
+Профилирование медленных апдейтов.
+
+При PROFILE_SLOW_UPDATES_MS > 0 обработка каждого апдейта собирает отрезки
+времени по фазам — parse (разбор тела webhook), redis, db, rate_limit,
+handler, send, bot_api — из тех же мест, где пишутся метрики. Трасса
+апдейта дольше порога сохраняется в кольцевой буфер (PROFILE_BUFFER_SIZE
+последних), остальные выбрасываются. Буфер отдаёт служебный эндпоинт
+/debug/slow-updates.
+
+other_ms в трассе — время вне Redis, Postgres и Bot API: Python, GIL,
+ожидание пула потоков и т.п.
+
+Выключенный профилировщик стоит одного ContextVar.get на отрезок.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Iterator
+
+from src.config import settings
+
+# Фазы ввода-вывода; остальное время апдейта попадает в other_ms
+_IO_PHASES = frozenset({"redis", "db", "bot_api"})
+
+
+class UpdateTrace:
+    __slots__ = ("update_id", "user_id", "started", "spans")
+
+    def __init__(self, update_id: int, user_id: int | None, started: float):
+        self.update_id = update_id
+        self.user_id = user_id
+        self.started = started
+        # (фаза, имя, начало от started, длительность), сек
+        self.spans: list[tuple[str, str, float, float]] = []
+
+    def to_dict(self, total: float) -> dict:
+        io = sorted((offset, offset + duration) for phase, _, offset, duration in self.spans if phase in _IO_PHASES)
+        io_time, covered_to = 0.0, 0.0
+        for start, end in io:
+            if end > covered_to:
+                io_time += end - max(start, covered_to)
+                covered_to = end
+        return {
+            "update_id": self.update_id,
+            "user_id": self.user_id,
+            "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "total_ms": round(total * 1000, 3),
+            "other_ms": round((total - io_time) * 1000, 3),
+            "spans": [
+                {"phase": phase, "name": name, "offset_ms": round(offset * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                for phase, name, offset, duration in self.spans
+            ],
+        }
+
+
+_current: ContextVar[UpdateTrace | None] = ContextVar("profile_trace", default=None)
+_traces: deque[dict] = deque(maxlen=settings.profile_buffer_size)
+_lock = threading.Lock()
+
+
+def record_span(phase: str, name: str, duration: float) -> None:
+    """Отрезок, закончившийся только что, в трассу текущего апдейта (если она собирается)."""
+    trace = _current.get()
+    if trace is not None:
+        offset = time.perf_counter() - duration - trace.started
+        trace.spans.append((phase, name, offset, duration))
+
+
+@contextmanager
+def span(phase: str, name: str) -> Iterator[None]:
+    """Записать время блока отрезком трассы текущего апдейта."""
+    if _current.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(phase, name, time.perf_counter() - started)
+
+
+@contextmanager
+def profile_update(update_id: int, user_id: int | None, received_at: float | None = None) -> Iterator[None]:
+    """
+    Собрать трассу обработки апдейта и сохранить её, если она дольше порога.
+
+    received_at — perf_counter() момента приёма webhook: время до начала
+    обработки (разбор тела) записывается фазой parse.
+    """
+    if settings.profile_slow_updates_ms <= 0:
+        yield
+        return
+
+    now = time.perf_counter()
+    trace = UpdateTrace(update_id, user_id, received_at if received_at is not None else now)
+    if received_at is not None:
+        trace.spans.append(("parse", "parse_update", 0.0, now - received_at))
+    token = _current.set(trace)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        total = time.perf_counter() - trace.started
+        if total * 1000 >= settings.profile_slow_updates_ms:
+            with _lock:
+                _traces.append(trace.to_dict(total))
+
+
+def slow_updates() -> list[dict]:
+    """Сохранённые трассы медленных апдейтов, новые первыми."""
+    with _lock:
+        return list(reversed(_traces))
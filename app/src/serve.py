@@ -0,0 +1,34 @@
+"""
+Запуск HTTP-сервера согласно SERVER_MODE (точка входа Docker-образа).
+
+  - wsgi: gunicorn + Flask (src.wsgi:application)
+  - asgi: uvicorn + AsyncTeleBot (src.asgi:application)
+
+Число процессов в обоих случаях задаётся WEB_CONCURRENCY.
+"""
+import os
+
+from src.config import settings
+
+
+def main() -> None:
+    if settings.server_mode == "asgi":
+        argv = [
+            "uvicorn",
+            "--host", settings.app_host,
+            "--port", str(settings.app_port),
+            "src.asgi:application",
+        ]
+    else:
+        argv = [
+            "gunicorn",
+            "--bind", f"{settings.app_host}:{settings.app_port}",
+            "--threads", "4",
+            "--timeout", "30",
+            "src.wsgi:application",
+        ]
+    os.execvp(argv[0], argv)
+
+
+if __name__ == "__main__":
+    main()
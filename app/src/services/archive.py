@@ -0,0 +1,152 @@
+"""
+Архивация старых партиций author_messages.
+
+Для каждой партиции старше ARCHIVE_KEEP_MONTHS полных месяцев:
+  1. ALTER TABLE ... DETACH PARTITION ... CONCURRENTLY — без долгой
+     блокировки author_messages: вставки и доставка продолжают работать;
+  2. строки отключённой таблицы потоково (серверный курсор) пишутся
+     в ARCHIVE_DIR/author_messages_pYYYYMM.jsonl.gz;
+  3. таблица удаляется.
+
+Заодно удаляются записи forwarded_messages старше той же границы.
+
+Прерванный запуск безопасно повторить: зависший DETACH завершается через
+FINALIZE, а уже отключённые таблицы архивируются и удаляются.
+
+Запуск (например, по cron раз в сутки):
+    python -m src.services.archive [--keep-months N] [--output-dir DIR] [--dry-run]
+"""
+import argparse
+import gzip
+import json
+import os
+from datetime import date, datetime
+from pathlib import Path
+
+from sqlalchemy import text
+
+from src.config import settings
+from src.logging import logger
+from src.storage.db import NO_STATEMENT_TIMEOUT, engine
+from src.storage.partitions import (
+    PARENT,
+    Partition,
+    add_months,
+    attached_partitions,
+    current_month,
+    detached_partitions,
+    ensure_partitions,
+)
+
+# Ключ pg_advisory_lock: одновременно работает только один архиватор
+_ARCHIVE_LOCK_KEY = 7_301_642_119
+_FETCH_SIZE = 1000
+
+
+def _json_default(value: object) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Unserializable value: {value!r}")
+
+
+def _detach(partition: Partition) -> None:
+    # DETACH ... CONCURRENTLY нельзя выполнять внутри транзакции
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        mode = "FINALIZE" if partition.detach_pending else "CONCURRENTLY"
+        logger.info("Detaching partition %s (%s)", partition.name, mode)
+        # Ждёт завершения текущих транзакций — без DB_STATEMENT_TIMEOUT_MS (SET LOCAL вне транзакции не действует)
+        conn.execute(text("SET statement_timeout = 0"))
+        try:
+            conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {partition.name} {mode}"))
+        finally:
+            conn.execute(text("RESET statement_timeout"))
+
+
+def _export(partition: Partition, output_dir: Path) -> tuple[Path, int]:
+    """Выгрузить отключённую партицию в gzip JSONL. Возвращает (файл, число строк)."""
+    target = output_dir / f"{partition.name}.jsonl.gz"
+    tmp = target.with_name(target.name + ".tmp")
+    rows = 0
+    with engine.connect().execution_options(stream_results=True, yield_per=_FETCH_SIZE) as conn:
+        conn.execute(NO_STATEMENT_TIMEOUT)
+        result = conn.execute(text(f"SELECT * FROM {partition.name} ORDER BY id"))
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for row in result.mappings():
+                f.write(json.dumps(dict(row), ensure_ascii=False, default=_json_default))
+                f.write("\n")
+                rows += 1
+            f.flush()
+            os.fsync(f.fileno())
+    # Файл появляется под итоговым именем только целиком
+    os.replace(tmp, target)
+    return target, rows
+
+
+def _drop(partition: Partition) -> None:
+    with engine.begin() as conn:
+        conn.execute(NO_STATEMENT_TIMEOUT)
+        conn.execute(text(f"DROP TABLE {partition.name}"))
+
+
+def _prune_forwards(cutoff: date) -> int:
+    with engine.begin() as conn:
+        conn.execute(NO_STATEMENT_TIMEOUT)
+        result = conn.execute(text("DELETE FROM forwarded_messages WHERE created_at < :cutoff"), {"cutoff": cutoff})
+        return result.rowcount
+
+
+def archive_partitions(keep_months: int, output_dir: Path, dry_run: bool = False) -> list[str]:
+    """Заархивировать партиции, целиком старше keep_months месяцев. Возвращает их имена."""
+    cutoff = add_months(current_month(), -keep_months)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with engine.connect() as lock_conn:
+        locked = lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _ARCHIVE_LOCK_KEY}).scalar()
+        if not locked:
+            logger.warning("Another archive run is in progress, skipping")
+            return []
+        try:
+            if not dry_run:
+                ensure_partitions(lock_conn, settings.partition_months_ahead)
+
+            attached = [p for p in attached_partitions(lock_conn) if p.upper <= cutoff]
+            leftovers = [p for p in detached_partitions(lock_conn) if p.upper <= cutoff]
+            lock_conn.commit()
+
+            archived = []
+            for partition in leftovers + attached:
+                if dry_run:
+                    logger.info("Would archive %s", partition.name)
+                    continue
+                if partition in attached:
+                    _detach(partition)
+                path, rows = _export(partition, output_dir)
+                _drop(partition)
+                logger.info("Archived %s: %d rows -> %s", partition.name, rows, path)
+                archived.append(partition.name)
+
+            if not dry_run:
+                pruned = _prune_forwards(cutoff)
+                if pruned:
+                    logger.info("Pruned %d forwarded message links older than %s", pruned, cutoff)
+            return archived
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ARCHIVE_LOCK_KEY})
+            lock_conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Архивация старых партиций author_messages")
+    parser.add_argument("--keep-months", type=int, default=settings.archive_keep_months,
+                        help="сколько полных месяцев оставить в БД")
+    parser.add_argument("--output-dir", type=Path, default=Path(settings.archive_dir),
+                        help="каталог для .jsonl.gz")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что будет заархивировано")
+    args = parser.parse_args()
+
+    archived = archive_partitions(args.keep_months, args.output_dir, dry_run=args.dry_run)
+    logger.info("Archive run finished: %d partitions", len(archived))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,37 @@
 from dataclasses import dataclass, field
+from typing import NamedTuple
+
+import asyncio
+import time
 
 import telebot
+from telebot import asyncio_helper
+from telebot.apihelper import ApiHTTPException, ApiTelegramException
+from telebot.async_telebot import AsyncTeleBot
 
-from src.bot.messages import FWD_HEADER, FWD_USER_ID, FWD_USERNAME, FWD_FIRST_NAME
+from src import metrics
+from src.bot.messages import DIGEST_HEADER, DIGEST_SEPARATOR, FWD_HEADER, FWD_USER_ID, FWD_USERNAME, FWD_FIRST_NAME
 from src.config import settings
-from src.logging import logger
+from src.logging import info_sampled, logger
+from src.profiler import record_span
+from src.services.media import CAPTION_MAX_LENGTH, CAPTION_TYPES, MessageMedia
+from src.services.reply_routing import remember_forwards, remember_forwards_async
+from src.storage.repo import PendingDelivery
+
+
+class ChatDelivery(NamedTuple):
+    """Результат отправки в один чат."""
+    ok: bool
+    error: str = ""
+    # Ошибка временная (429 / 5xx / сеть) — имеет смысл повторить
+    temporary: bool = False
+    # Сколько секунд Telegram просит подождать (из ответа 429)
+    retry_after: int | None = None
+    # message_id отправленного сообщения (для ответов автора, см. reply_routing)
+    message_id: int | None = None
+    # message_id заголовка, отправленного перед вложением без подписи (см. _send_to_chat);
+    # задан и при ok=False, если заголовок дошёл, а вложение — нет
+    header_message_id: int | None = None
 
 
 @dataclass
@@ -14,6 +41,10 @@ class DeliveryResult:
     success: bool = False
     # Детали по каждому адресату: chat_id -> (ok, error_text)
     details: dict[int, tuple[bool, str]] = field(default_factory=dict)
+    # Все адресаты не получили сообщение, но хотя бы одна ошибка временная
+    retryable: bool = False
+    # Максимальный retry_after среди ответов 429
+    retry_after: int | None = None
 
     @property
     def error_summary(self) -> str:
@@ -22,26 +53,215 @@ class DeliveryResult:
         return "; ".join(errors) if errors else ""
 
 
-def format_message(user_id: int, username: str | None, first_name: str | None, text: str) -> str:
-    """Форматирует сообщение для пересылки."""
+def _user_info(user_id: int, username: str | None, first_name: str | None) -> str:
     user_info = FWD_USER_ID.format(user_id=user_id)
     if username:
         user_info += FWD_USERNAME.format(username=username)
     if first_name:
         user_info += FWD_FIRST_NAME.format(first_name=first_name)
+    return user_info
+
+
+def format_message(user_id: int, username: str | None, first_name: str | None, text: str) -> str:
+    """Форматирует сообщение для пересылки. Пустой текст (вложение без подписи) — только заголовок."""
+    header = f"{FWD_HEADER}\n\n{_user_info(user_id, username, first_name)}"
+    return f"{header}\n\n{text}" if text else header
+
+
+def pending_media(item: PendingDelivery) -> MessageMedia | None:
+    """Вложение сообщения из outbox."""
+    if item.media_type is None or item.file_id is None:
+        return None
+    return MessageMedia(item.media_type, item.file_id)
+
+
+def _digest_entry(item: PendingDelivery) -> str:
+    return f"{_user_info(item.user_telegram_id, item.username, item.first_name)}\n\n{item.text}"
+
+
+def format_digest(items: list[PendingDelivery]) -> str:
+    """Сводный пост из нескольких сообщений. Одно сообщение — в обычном формате."""
+    if len(items) == 1:
+        item = items[0]
+        return format_message(item.user_telegram_id, item.username, item.first_name, item.text)
+    entries = DIGEST_SEPARATOR.join(_digest_entry(item) for item in items)
+    return f"{DIGEST_HEADER.format(count=len(items))}\n\n{entries}"
+
+
+def pack_digests(items: list[PendingDelivery], max_chars: int) -> list[list[PendingDelivery]]:
+    """
+    Разложить сообщения по постам не длиннее max_chars, сохраняя порядок.
+
+    Сообщение, которое не помещается даже в отдельный пост, и сообщение с
+    вложением отправляются по одному (как в обычном режиме).
+    """
+    posts: list[list[PendingDelivery]] = []
+    current: list[PendingDelivery] = []
+    for item in items:
+        if item.file_id is not None:
+            if current:
+                posts.append(current)
+                current = []
+            posts.append([item])
+            continue
+        if current and len(format_digest(current + [item])) > max_chars:
+            posts.append(current)
+            current = []
+        current.append(item)
+    if current:
+        posts.append(current)
+    return posts
+
+
+def classify_error(e: Exception) -> tuple[bool, int | None]:
+    """Определить, временная ли ошибка, и достать retry_after. Возвращает (temporary, retry_after)."""
+    if isinstance(e, (ApiTelegramException, asyncio_helper.ApiTelegramException)):
+        if e.error_code == 429:
+            params = e.result_json.get("parameters") or {}
+            return True, params.get("retry_after")
+        return e.error_code >= 500, None
+    if isinstance(e, (ApiHTTPException, asyncio_helper.ApiHTTPException)):
+        # requests.Response / aiohttp.ClientResponse
+        status = getattr(e.result, "status_code", None) or getattr(e.result, "status", 0)
+        return status >= 500 or status == 429, None
+    # Сетевые ошибки, таймауты и т.п.
+    return True, None
+
+
+def _observe_send(label: str, result: str, started: float) -> None:
+    elapsed = time.perf_counter() - started
+    metrics.SEND_LATENCY.labels(label, result).observe(elapsed)
+    record_span("send", label, elapsed)
 
-    return f"{FWD_HEADER}\n\n{user_info}\n\n{text}"
 
+def _as_caption(media: MessageMedia, formatted: str) -> bool:
+    """Текст уходит подписью к вложению, а не отдельным сообщением перед ним."""
+    return media.media_type in CAPTION_TYPES and len(formatted) <= CAPTION_MAX_LENGTH
+
+
+def _send_to_chat(
+    bot: telebot.TeleBot,
+    chat_id: int,
+    formatted: str,
+    label: str,
+    source: str,
+    media: MessageMedia | None = None,
+) -> ChatDelivery:
+    """
+    Отправить сообщение в конкретный чат. source — для логов («user 42», «digest of 5»).
 
-def _send_to_chat(bot: telebot.TeleBot, chat_id: int, formatted: str, label: str, user_id: int) -> tuple[bool, str]:
-    """Отправить сообщение в конкретный чат. Возвращает (ok, error_text)."""
+    Вложение отправляется по file_id (send_photo / send_voice / ...) с текстом
+    в подписи; если подписи у типа нет или текст в неё не помещается —
+    сначала текст отдельным сообщением, затем вложение. Если заголовок дошёл,
+    а вложение нет, ошибка не повторяется (иначе заголовок дублировался бы
+    при каждой попытке), а заголовок запоминается для ответов автора.
+    """
+    started = time.perf_counter()
+    header_id = None
+    try:
+        if media is None:
+            sent = bot.send_message(chat_id, formatted)
+        else:
+            send = getattr(bot, f"send_{media.media_type}")
+            if _as_caption(media, formatted):
+                sent = send(chat_id, media.file_id, caption=formatted)
+            else:
+                header_id = bot.send_message(chat_id, formatted).message_id
+                sent = send(chat_id, media.file_id)
+        _observe_send(label, "ok", started)
+        info_sampled("Message delivered to %s (chat %d) from %s", label, chat_id, source)
+        return ChatDelivery(ok=True, message_id=sent.message_id, header_message_id=header_id)
+    except Exception as e:
+        _observe_send(label, "error", started)
+        temporary, retry_after = classify_error(e)
+        if header_id is not None:
+            logger.error("Attachment to %s (chat %d) from %s not delivered after header: %s", label, chat_id, source, e)
+            return ChatDelivery(
+                ok=False, error=f"attachment not delivered: {e}", retry_after=retry_after, header_message_id=header_id,
+            )
+        logger.error("Failed to deliver message to %s (chat %d) from %s: %s", label, chat_id, source, e)
+        return ChatDelivery(ok=False, error=str(e), temporary=temporary, retry_after=retry_after)
+
+
+async def _send_to_chat_async(
+    bot: AsyncTeleBot,
+    chat_id: int,
+    formatted: str,
+    label: str,
+    source: str,
+    media: MessageMedia | None = None,
+) -> ChatDelivery:
+    """Асинхронный вариант _send_to_chat."""
+    started = time.perf_counter()
+    header_id = None
     try:
-        bot.send_message(chat_id, formatted)
-        logger.info("Message delivered to %s (chat %d) from user %d", label, chat_id, user_id)
-        return True, ""
+        if media is None:
+            sent = await bot.send_message(chat_id, formatted)
+        else:
+            send = getattr(bot, f"send_{media.media_type}")
+            if _as_caption(media, formatted):
+                sent = await send(chat_id, media.file_id, caption=formatted)
+            else:
+                header_id = (await bot.send_message(chat_id, formatted)).message_id
+                sent = await send(chat_id, media.file_id)
+        _observe_send(label, "ok", started)
+        info_sampled("Message delivered to %s (chat %d) from %s", label, chat_id, source)
+        return ChatDelivery(ok=True, message_id=sent.message_id, header_message_id=header_id)
     except Exception as e:
-        logger.error("Failed to deliver message to %s (chat %d) from user %d: %s", label, chat_id, user_id, e)
-        return False, str(e)
+        _observe_send(label, "error", started)
+        temporary, retry_after = classify_error(e)
+        if header_id is not None:
+            logger.error("Attachment to %s (chat %d) from %s not delivered after header: %s", label, chat_id, source, e)
+            return ChatDelivery(
+                ok=False, error=f"attachment not delivered: {e}", retry_after=retry_after, header_message_id=header_id,
+            )
+        logger.error("Failed to deliver message to %s (chat %d) from %s: %s", label, chat_id, source, e)
+        return ChatDelivery(ok=False, error=str(e), temporary=temporary, retry_after=retry_after)
+
+
+def _targets() -> list[tuple[int, str]]:
+    """Адресаты согласно NOTIFY_MODE: [(chat_id, label)]."""
+    targets: list[tuple[int, str]] = []
+    if settings.notify_mode in ("admin", "both"):
+        targets.append((settings.admin_id, "admin"))
+    if settings.notify_mode in ("group", "both") and settings.group_chat_id:
+        targets.append((settings.group_chat_id, "group"))
+    return targets
+
+
+def author_chat_ids() -> list[int]:
+    """Чаты автора, куда пересылаются сообщения и откуда приходят ответы."""
+    return [chat_id for chat_id, _ in _targets()]
+
+
+def _forwards(deliveries: list[tuple[int, ChatDelivery]]) -> list[tuple[int, int]]:
+    """Доставленные копии и заголовки вложений (даже если само вложение не дошло): [(chat_id, message_id)]."""
+    return [
+        (chat_id, message_id)
+        for chat_id, d in deliveries
+        for message_id in (d.header_message_id, d.message_id if d.ok else None) if message_id is not None
+    ]
+
+
+def _collect(deliveries: list[tuple[int, ChatDelivery]]) -> DeliveryResult:
+    """Свести результаты по адресатам в один DeliveryResult."""
+    result = DeliveryResult()
+    temporary_errors = False
+    reached = False
+    for chat_id, delivery in deliveries:
+        result.details[chat_id] = (delivery.ok, delivery.error)
+        if not delivery.ok and delivery.temporary:
+            temporary_errors = True
+        if delivery.retry_after is not None:
+            result.retry_after = max(result.retry_after or 0, delivery.retry_after)
+        # Дошёл хотя бы заголовок вложения — автор видит отправителя и текст
+        reached = reached or delivery.ok or delivery.header_message_id is not None
+
+    # Считаем успехом, если хотя бы один адресат получил
+    result.success = reached
+    # Повтор имеет смысл, только если никто не получил (иначе будет дубль)
+    result.retryable = not result.success and temporary_errors
+    return result
 
 
 def send_to_recipients(
@@ -50,29 +270,61 @@ def send_to_recipients(
     username: str | None,
     first_name: str | None,
     text: str,
+    media: MessageMedia | None = None,
 ) -> DeliveryResult:
     """
-    Отправить сообщение адресатам согласно NOTIFY_MODE.
+    Отправить сообщение (и вложение, если есть) адресатам согласно NOTIFY_MODE.
 
     Режимы:
       - admin: только в ЛС админу (ADMIN_ID)
       - group: только в группу (GROUP_CHAT_ID)
       - both:  и туда, и туда
+
+    Доставленные копии запоминаются, чтобы ответ автора на них ушёл пользователю.
     """
     formatted = format_message(user_id, username, first_name, text)
-    result = DeliveryResult()
+    deliveries = [
+        (chat_id, _send_to_chat(bot, chat_id, formatted, label, f"user {user_id}", media))
+        for chat_id, label in _targets()
+    ]
+    remember_forwards(user_id, _forwards(deliveries))
+    return _collect(deliveries)
 
-    # Собираем список адресатов
-    targets: list[tuple[int, str]] = []
-    if settings.notify_mode in ("admin", "both"):
-        targets.append((settings.admin_id, "admin"))
-    if settings.notify_mode in ("group", "both") and settings.group_chat_id:
-        targets.append((settings.group_chat_id, "group"))
 
-    for chat_id, label in targets:
-        ok, err = _send_to_chat(bot, chat_id, formatted, label, user_id)
-        result.details[chat_id] = (ok, err)
+def send_digest(bot: telebot.TeleBot, items: list[PendingDelivery]) -> DeliveryResult:
+    """
+    Отправить сводный пост (см. pack_digests) адресатам согласно NOTIFY_MODE.
 
-    # Считаем успехом, если хотя бы один адресат получил
-    result.success = any(ok for ok, _ in result.details.values())
-    return result
+    Результат общий для всех сообщений поста. Ответить автору можно только
+    на пост из одного сообщения — у сводного поста нет единственного отправителя.
+    """
+    formatted = format_digest(items)
+    source = f"user {items[0].user_telegram_id}" if len(items) == 1 else f"digest of {len(items)}"
+    # Сообщение с вложением pack_digests всегда кладёт в пост одно
+    media = pending_media(items[0]) if len(items) == 1 else None
+    deliveries = [
+        (chat_id, _send_to_chat(bot, chat_id, formatted, label, source, media))
+        for chat_id, label in _targets()
+    ]
+    if len(items) == 1:
+        remember_forwards(items[0].user_telegram_id, _forwards(deliveries))
+    return _collect(deliveries)
+
+
+async def send_to_recipients_async(
+    bot: AsyncTeleBot,
+    user_id: int,
+    username: str | None,
+    first_name: str | None,
+    text: str,
+    media: MessageMedia | None = None,
+) -> DeliveryResult:
+    """Асинхронный вариант send_to_recipients: адресатам отправляется параллельно."""
+    formatted = format_message(user_id, username, first_name, text)
+    targets = _targets()
+    results = await asyncio.gather(*(
+        _send_to_chat_async(bot, chat_id, formatted, label, f"user {user_id}", media) for chat_id, label in targets
+    ))
+    deliveries = [(chat_id, delivery) for (chat_id, _), delivery in zip(targets, results)]
+    await remember_forwards_async(user_id, _forwards(deliveries))
+    return _collect(deliveries)
@@ -0,0 +1,209 @@
+"""
+Рассылка /broadcast всем пользователям.
+
+Получатели читаются из users пачками по BROADCAST_CHUNK_SIZE (keyset по
+telegram_id, без is_blocked) и отправляются пулом из BROADCAST_WORKERS потоков.
+Темп задаёт общая корзина токенов (BROADCAST_RATE сообщений в секунду — ниже
+глобального лимита Telegram ~30/с); ответ 429 приостанавливает всю корзину на
+retry_after. На 403 (бот заблокирован) пользователю ставится is_blocked.
+
+После каждой пачки в broadcasts записываются счётчики и last_user_id, а
+сообщение с прогрессом у админа редактируется (не чаще раза в несколько
+секунд). Рассылку ведёт один процесс — тот, что взял advisory-лок по её id;
+после рестарта идущие рассылки продолжаются с last_user_id (повторно может
+уйти не больше одной пачки).
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+from sqlalchemy import text
+from telebot.apihelper import ApiTelegramException
+
+from src.bot.messages import BROADCAST_PROGRESS, BROADCAST_STATUS
+from src.config import settings
+from src.logging import logger
+from src.services.author_notify import classify_error
+from src.services.token_bucket import TokenBucket
+from src.storage.db import engine, session_scope
+from src.storage.repo import BroadcastState, Repository
+
+# pg_try_advisory_lock(класс, id рассылки): рассылку ведёт только один процесс
+_BROADCAST_LOCK_CLASS = 7_301_642
+# Как часто (сек) обновлять сообщение с прогрессом
+_PROGRESS_INTERVAL = 5.0
+# Попыток на одного получателя при временных ошибках
+_MAX_ATTEMPTS = 3
+
+_bot: telebot.TeleBot | None = None
+_bucket: TokenBucket | None = None
+_executor: ThreadPoolExecutor | None = None
+_threads: list[threading.Thread] = []
+_stop = threading.Event()
+
+
+def _send_one(user_id: int, message_text: str) -> str:
+    """Отправить рассылку одному пользователю. Результат: sent / blocked / failed."""
+    for _ in range(_MAX_ATTEMPTS):
+        _bucket.acquire()
+        try:
+            _bot.send_message(user_id, message_text)
+            return "sent"
+        except Exception as e:
+            if isinstance(e, ApiTelegramException) and e.error_code == 403:
+                return "blocked"
+            temporary, retry_after = classify_error(e)
+            if not temporary:
+                logger.warning("Broadcast to user %d failed: %s", user_id, e)
+                return "failed"
+            if retry_after is not None:
+                # 429 относится ко всему боту — притормаживаем все потоки
+                _bucket.pause(retry_after)
+    logger.warning("Broadcast to user %d failed after %d attempts", user_id, _MAX_ATTEMPTS)
+    return "failed"
+
+
+def _progress_text(broadcast: BroadcastState) -> str:
+    return BROADCAST_PROGRESS.format(
+        id=broadcast.id,
+        status=BROADCAST_STATUS.get(broadcast.status, broadcast.status),
+        done=broadcast.sent + broadcast.blocked + broadcast.failed,
+        total=broadcast.total,
+        sent=broadcast.sent,
+        blocked=broadcast.blocked,
+        failed=broadcast.failed,
+    )
+
+
+def _show_progress(broadcast: BroadcastState) -> None:
+    """Создать или обновить сообщение с прогрессом у админа."""
+    try:
+        if broadcast.progress_message_id is None:
+            sent = _bot.send_message(broadcast.progress_chat_id, _progress_text(broadcast))
+            with session_scope() as session:
+                Repository(session).set_broadcast_progress_message(broadcast.id, sent.message_id)
+            broadcast.progress_message_id = sent.message_id
+        else:
+            _bot.edit_message_text(
+                _progress_text(broadcast),
+                chat_id=broadcast.progress_chat_id,
+                message_id=broadcast.progress_message_id,
+            )
+    except Exception as e:
+        # «message is not modified» и т.п. не должны останавливать рассылку
+        logger.warning("Failed to update progress of broadcast %d: %s", broadcast.id, e)
+
+
+def _run_broadcast(broadcast_id: int) -> None:
+    with session_scope() as session:
+        broadcast = Repository(session).get_broadcast(broadcast_id)
+    if broadcast is None or broadcast.status != "running":
+        return
+
+    logger.info("Broadcast %d: starting after user %d", broadcast_id, broadcast.last_user_id)
+    _show_progress(broadcast)
+    shown_at = time.monotonic()
+
+    while not _stop.is_set():
+        with session_scope() as session:
+            recipients = Repository(session).broadcast_recipients(broadcast.last_user_id, settings.broadcast_chunk_size)
+        if not recipients:
+            with session_scope() as session:
+                Repository(session).finish_broadcast(broadcast_id)
+            broadcast.status = "done"
+            break
+
+        results = list(_executor.map(lambda user_id: _send_one(user_id, broadcast.text), recipients))
+        blocked = [user_id for user_id, result in zip(recipients, results) if result == "blocked"]
+
+        with session_scope() as session:
+            repo = Repository(session)
+            if blocked:
+                repo.block_users(blocked)
+            broadcast = repo.checkpoint_broadcast(
+                broadcast_id,
+                last_user_id=recipients[-1],
+                sent=results.count("sent"),
+                blocked=len(blocked),
+                failed=results.count("failed"),
+            )
+
+        if broadcast.status != "running":
+            break
+        if time.monotonic() - shown_at >= _PROGRESS_INTERVAL:
+            _show_progress(broadcast)
+            shown_at = time.monotonic()
+
+    _show_progress(broadcast)
+    logger.info(
+        "Broadcast %d: %s (sent %d, blocked %d, failed %d)",
+        broadcast_id, broadcast.status, broadcast.sent, broadcast.blocked, broadcast.failed,
+    )
+
+
+def _run(broadcast_id: int) -> None:
+    """Вести рассылку, если её не ведёт другой процесс."""
+    try:
+        with engine.connect() as lock_conn:
+            params = {"cls": _BROADCAST_LOCK_CLASS, "id": broadcast_id}
+            locked = lock_conn.execute(text("SELECT pg_try_advisory_lock(:cls, :id)"), params).scalar()
+            lock_conn.commit()
+            if not locked:
+                return
+            try:
+                _run_broadcast(broadcast_id)
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:cls, :id)"), params)
+                lock_conn.commit()
+    except Exception as e:
+        if _stop.is_set():
+            # Остановка процесса не дождалась конца пачки — продолжит следующий старт
+            logger.warning("Broadcast %d interrupted by shutdown: %s", broadcast_id, e)
+            return
+        logger.error("Broadcast %d stopped by error: %s", broadcast_id, e)
+
+
+def launch_broadcast(broadcast_id: int) -> None:
+    """Запустить рассылку в фоновом потоке этого процесса."""
+    if _bot is None:
+        logger.error("Broadcast %d not started: broadcasts are not initialized", broadcast_id)
+        return
+    thread = threading.Thread(target=_run, args=(broadcast_id,), name=f"broadcast-{broadcast_id}", daemon=True)
+    thread.start()
+    _threads[:] = [t for t in _threads if t.is_alive()] + [thread]
+
+
+def start_broadcasts(bot: telebot.TeleBot) -> None:
+    """Подготовить пул отправки и продолжить рассылки, прерванные рестартом."""
+    global _bot, _bucket, _executor
+    if _bot is not None:
+        return
+    _bot = bot
+    _bucket = TokenBucket(rate=settings.broadcast_rate)
+    _executor = ThreadPoolExecutor(max_workers=settings.broadcast_workers, thread_name_prefix="broadcast-send")
+
+    try:
+        with session_scope() as session:
+            running = Repository(session).running_broadcast_ids()
+    except Exception as e:
+        logger.error("DB error loading running broadcasts: %s", e)
+        return
+    for broadcast_id in running:
+        launch_broadcast(broadcast_id)
+
+
+def stop_broadcasts() -> None:
+    """
+    Остановить рассылки после текущей пачки; продолжит следующий старт.
+
+    Пул отправки закрывается только после выхода потоков рассылок: закрытый
+    раньше пул уронил бы идущую пачку (executor.map после shutdown).
+    """
+    _stop.set()
+    # Пачка при темпе BROADCAST_RATE и запас на последний checkpoint
+    timeout = settings.broadcast_chunk_size / settings.broadcast_rate + 5
+    for thread in _threads:
+        thread.join(timeout=timeout)
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,260 @@
+"""
+Потоковая выгрузка users и author_messages в CSV / JSONL (опционально gzip).
+
+Строки читаются серверным курсором (Repository.stream_*), сериализуются и
+сжимаются по мере чтения и отдаются кусками по ~64 КБ — память не зависит
+от размера таблицы.
+
+Выгрузок одновременно не больше EXPORT_MAX_CONCURRENT на процесс: HTTP-выгрузка
+занимает поток gunicorn на всё время отдачи, и лимит оставляет остальные
+потоки webhook-запросам. Команда /export работает в фоне, не в потоке
+webhook-запроса, и присылает файл документом.
+"""
+import asyncio
+import csv
+import io
+import json
+import tempfile
+import threading
+import zlib
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import BinaryIO, Iterator, Literal, Mapping
+
+import telebot
+from telebot.async_telebot import AsyncTeleBot
+
+from src.bot.messages import EXPORT_FAIL, EXPORT_TOO_LARGE
+from src.config import settings
+from src.logging import logger
+from src.storage.db import session_scope
+from src.storage.repo import Repository
+
+TABLES = ("users", "messages")
+FORMATS = ("csv", "jsonl")
+STATUSES = ("pending", "delivered", "failed")
+
+_CHUNK_SIZE = 64 * 1024
+# Лимит Bot API на отправку файла ботом
+_MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+_UPLOAD_TIMEOUT = 300
+
+_slots = threading.BoundedSemaphore(settings.export_max_concurrent)
+
+
+@dataclass(frozen=True)
+class ExportRequest:
+    table: Literal["users", "messages"]
+    fmt: Literal["csv", "jsonl"] = "csv"
+    compress: bool = False
+    # Границы по created_at (UTC): с date_from по date_to включительно
+    date_from: date | None = None
+    date_to: date | None = None
+    status: str | None = None
+
+    @property
+    def filename(self) -> str:
+        name = f"{self.table}_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.{self.fmt}"
+        return name + ".gz" if self.compress else name
+
+    @property
+    def content_type(self) -> str:
+        if self.compress:
+            return "application/gzip"
+        return "text/csv; charset=utf-8" if self.fmt == "csv" else "application/x-ndjson"
+
+
+def _parse_date(value: str | None, name: str) -> date | None:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name}: expected YYYY-MM-DD, got {value!r}") from None
+
+
+def parse_export_request(table: str, params: Mapping[str, str]) -> ExportRequest:
+    """
+    Разобрать параметры выгрузки: format=csv|jsonl, gzip=1, from/to=YYYY-MM-DD, status=...
+
+    ValueError — с текстом для пользователя.
+    """
+    if table not in TABLES:
+        raise ValueError(f"table: expected one of {', '.join(TABLES)}")
+    fmt = params.get("format", "csv")
+    if fmt not in FORMATS:
+        raise ValueError(f"format: expected one of {', '.join(FORMATS)}")
+    status = params.get("status") or None
+    if status is not None:
+        if table != "messages":
+            raise ValueError("status: only for messages")
+        if status not in STATUSES:
+            raise ValueError(f"status: expected one of {', '.join(STATUSES)}")
+    return ExportRequest(
+        table=table,
+        fmt=fmt,
+        compress=params.get("gzip", "") in ("1", "true", "yes"),
+        date_from=_parse_date(params.get("from"), "from"),
+        date_to=_parse_date(params.get("to"), "to"),
+        status=status,
+    )
+
+
+def parse_export_command(args: str) -> ExportRequest:
+    """Аргументы /export: users|messages [csv|jsonl] [gz] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [status=...]."""
+    tokens = args.split()
+    if not tokens:
+        raise ValueError("table: expected one of " + ", ".join(TABLES))
+    params = {}
+    for token in tokens[1:]:
+        if token in FORMATS:
+            params["format"] = token
+        elif token in ("gz", "gzip"):
+            params["gzip"] = "1"
+        elif "=" in token:
+            key, value = token.split("=", 1)
+            params[key] = value
+        else:
+            raise ValueError(f"unknown argument {token!r}")
+    return parse_export_request(tokens[0], params)
+
+
+def try_start_export() -> bool:
+    """Занять слот выгрузки. False — достигнут EXPORT_MAX_CONCURRENT."""
+    return _slots.acquire(blocking=False)
+
+
+def finish_export() -> None:
+    _slots.release()
+
+
+def _bounds(request: ExportRequest) -> tuple[datetime | None, datetime | None]:
+    start = datetime.combine(request.date_from, time.min, timezone.utc) if request.date_from else None
+    end = datetime.combine(request.date_to + timedelta(days=1), time.min, timezone.utc) if request.date_to else None
+    return start, end
+
+
+def _json_default(value: object) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Unserializable value: {value!r}")
+
+
+def _lines(request: ExportRequest, rows: Iterator[Mapping]) -> Iterator[str]:
+    """Строки файла: заголовок CSV и по строке на запись."""
+    if request.fmt == "jsonl":
+        for row in rows:
+            yield json.dumps(dict(row), ensure_ascii=False, default=_json_default) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for row in rows:
+        if not header_written:
+            writer.writerow(row.keys())
+            header_written = True
+        writer.writerow(value.isoformat() if isinstance(value, datetime) else value for value in row.values())
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def iter_export(request: ExportRequest) -> Iterator[bytes]:
+    """Файл выгрузки кусками по ~64 КБ. Сессия БД открыта, пока итератор не исчерпан или не закрыт."""
+    created_from, created_to = _bounds(request)
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if request.compress else None
+    pending: list[bytes] = []
+    pending_size = 0
+
+    with session_scope() as session:
+        repo = Repository(session)
+        if request.table == "users":
+            rows = repo.stream_users(created_from, created_to)
+        else:
+            rows = repo.stream_messages(created_from, created_to, request.status)
+
+        for line in _lines(request, rows):
+            data = line.encode("utf-8")
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                pending.append(data)
+                pending_size += len(data)
+            if pending_size >= _CHUNK_SIZE:
+                yield b"".join(pending)
+                pending.clear()
+                pending_size = 0
+
+    if compressor is not None:
+        pending.append(compressor.flush())
+    tail = b"".join(pending)
+    if tail:
+        yield tail
+
+
+def _write_export_file(request: ExportRequest) -> tuple[BinaryIO, int]:
+    """Выгрузка во временный файл на диске. Возвращает (файл в начале, размер)."""
+    file = tempfile.TemporaryFile()
+    size = 0
+    for chunk in iter_export(request):
+        file.write(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return file, size
+
+
+def send_export(bot: telebot.TeleBot, chat_id: int, request: ExportRequest) -> None:
+    """Выгрузить и прислать файл документом (в фоновом потоке). Слот занимает вызывающий."""
+    try:
+        file, size = _write_export_file(request)
+        with file:
+            if size > _MAX_DOCUMENT_SIZE:
+                bot.send_message(chat_id, EXPORT_TOO_LARGE.format(size_mb=size // (1024 * 1024)))
+                return
+            bot.send_document(chat_id, file, visible_file_name=request.filename, timeout=_UPLOAD_TIMEOUT)
+        logger.info("Export %s sent to chat %d: %d bytes", request.filename, chat_id, size)
+    except Exception as e:
+        logger.error("Export %s failed: %s", request.table, e)
+        try:
+            bot.send_message(chat_id, EXPORT_FAIL)
+        except Exception:
+            pass
+    finally:
+        finish_export()
+
+
+def start_export(bot: telebot.TeleBot, chat_id: int, request: ExportRequest) -> None:
+    """Запустить send_export в фоновом потоке."""
+    thread = threading.Thread(target=send_export, args=(bot, chat_id, request), name="export", daemon=True)
+    thread.start()
+
+
+async def send_export_async(bot: AsyncTeleBot, chat_id: int, request: ExportRequest) -> None:
+    """Асинхронный вариант send_export: чтение БД и запись файла — в отдельном потоке."""
+    try:
+        file, size = await asyncio.to_thread(_write_export_file, request)
+        with file:
+            if size > _MAX_DOCUMENT_SIZE:
+                await bot.send_message(chat_id, EXPORT_TOO_LARGE.format(size_mb=size // (1024 * 1024)))
+                return
+            await bot.send_document(chat_id, file, visible_file_name=request.filename, timeout=_UPLOAD_TIMEOUT)
+        logger.info("Export %s sent to chat %d: %d bytes", request.filename, chat_id, size)
+    except Exception as e:
+        logger.error("Export %s failed: %s", request.table, e)
+        try:
+            await bot.send_message(chat_id, EXPORT_FAIL)
+        except Exception:
+            pass
+    finally:
+        finish_export()
+
+
+_tasks: set[asyncio.Task] = set()
+
+
+def start_export_async(bot: AsyncTeleBot, chat_id: int, request: ExportRequest) -> None:
+    """Запустить send_export_async фоновой задачей, не задерживая ответ на webhook."""
+    task = asyncio.create_task(send_export_async(bot, chat_id, request))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
@@ -0,0 +1,126 @@
+"""
+Общий HTTP-клиент для исходящих запросов к Telegram Bot API.
+
+По умолчанию telebot держит отдельную requests.Session на каждый поток и
+пересоздаёт её раз в 10 минут: каждый поток gunicorn, воркер очереди и
+воркер outbox открывает свои TLS-соединения к api.telegram.org. Здесь одна
+сессия на процесс с ограниченным пулом keep-alive соединений — TLS-рукопожатие
+выполняется один раз на соединение, а не на сообщение. Если все соединения
+заняты, поток ждёт свободное, а не открывает лишнее.
+
+Для AsyncTeleBot (SERVER_MODE=asgi) то же делает aiohttp-сессия с
+ограниченным коннектором.
+
+Каждый вызов Bot API проходит через хуки add_timing_hook(hook):
+hook(method, status, duration), где status — HTTP-код или None при сетевой ошибке.
+"""
+import time
+from typing import Callable
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper, asyncio_helper
+
+from src import metrics
+from src.config import settings
+from src.profiler import record_span
+
+TimingHook = Callable[[str, int | None, float], None]
+
+_hooks: list[TimingHook] = []
+
+
+def add_timing_hook(hook: TimingHook) -> None:
+    """Добавить хук, вызываемый после каждого запроса к Bot API."""
+    _hooks.append(hook)
+
+
+def _run_hooks(url: str, status: int | None, duration: float) -> None:
+    # .../bot<token>/sendMessage -> sendMessage
+    method = url.rsplit("/", 1)[-1]
+    for hook in _hooks:
+        hook(method, status, duration)
+
+
+def _observe(method: str, status: int | None, duration: float) -> None:
+    metrics.BOT_API_LATENCY.labels(method, str(status) if status is not None else "error").observe(duration)
+
+
+add_timing_hook(_observe)
+add_timing_hook(lambda method, status, duration: record_span("bot_api", method, duration))
+
+
+class BotApiClient:
+    """requests.Session с ограниченным пулом соединений, общая для всех потоков процесса."""
+
+    def __init__(self, pool_size: int):
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Сигнатура apihelper.CUSTOM_REQUEST_SENDER (timeout — пара (connect, read))."""
+        started = time.perf_counter()
+        try:
+            response = self._session.request(method, url, **kwargs)
+        except Exception:
+            _run_hooks(url, None, time.perf_counter() - started)
+            raise
+        _run_hooks(url, response.status_code, time.perf_counter() - started)
+        return response
+
+
+class _PooledSessionManager(asyncio_helper.SessionManager):
+    """aiohttp-сессия AsyncTeleBot с ограниченным пулом и хуками на каждый запрос."""
+
+    async def create_session(self) -> aiohttp.ClientSession:
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(_on_request_start)
+        trace.on_request_end.append(_on_request_end)
+        trace.on_request_exception.append(_on_request_exception)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.bot_api_pool_size, ssl=self.ssl_context),
+            trace_configs=[trace],
+        )
+        return self.session
+
+
+async def _on_request_start(session, ctx, params: aiohttp.TraceRequestStartParams) -> None:
+    ctx.started = time.perf_counter()
+
+
+async def _on_request_end(session, ctx, params: aiohttp.TraceRequestEndParams) -> None:
+    _run_hooks(params.url.path, params.response.status, time.perf_counter() - ctx.started)
+
+
+async def _on_request_exception(session, ctx, params: aiohttp.TraceRequestExceptionParams) -> None:
+    _run_hooks(params.url.path, None, time.perf_counter() - ctx.started)
+
+
+_client: BotApiClient | None = None
+
+
+def install_http_client() -> BotApiClient:
+    """Направить все запросы telebot.TeleBot через общий клиент (идемпотентно)."""
+    global _client
+    if _client is None:
+        _client = BotApiClient(pool_size=settings.bot_api_pool_size)
+        apihelper.CONNECT_TIMEOUT = settings.bot_api_connect_timeout
+        apihelper.READ_TIMEOUT = settings.bot_api_read_timeout
+        apihelper.CUSTOM_REQUEST_SENDER = _client.request
+    return _client
+
+
+def install_async_http_client() -> None:
+    """
+    То же для AsyncTeleBot.
+
+    asyncio_helper задаёт на каждый запрос только общий таймаут, поэтому
+    отдельного таймаута на соединение здесь нет: общий = connect + read.
+    """
+    if not isinstance(asyncio_helper.session_manager, _PooledSessionManager):
+        asyncio_helper.session_manager = _PooledSessionManager()
+        asyncio_helper.REQUEST_TIMEOUT = settings.bot_api_connect_timeout + settings.bot_api_read_timeout
+
@@ -0,0 +1,70 @@
+"""
+Медиа в сообщениях пользователей: фото, видео, голосовые, документы и т.п.
+
+Файлы не скачиваются и не загружаются заново: в author_messages пишутся
+только file_id и метаданные из апдейта, а адресатам уходит тот же file_id
+(send_photo / send_voice / ...) — Telegram копирует файл у себя, через
+процесс бота проходят только идентификаторы. Поэтому лимит Bot API на
+скачивание (20 МБ) не действует, а сообщение можно доставить и позже
+(outbox), даже если пользователь удалил оригинал.
+
+Размер проверяется по file_size из апдейта; лимиты по типам — MEDIA_MAX_MB,
+типы, которых там нет, не принимаются.
+"""
+from dataclasses import asdict, dataclass
+
+from telebot.types import Message
+
+from src.bot.messages import MEDIA_TOO_BIG, MEDIA_UNSUPPORTED
+from src.config import settings
+
+# Типы в порядке проверки (у сообщения заполнен ровно один)
+MEDIA_TYPES = ("photo", "video", "animation", "document", "audio", "voice", "video_note", "sticker")
+# Типы с подписью: у video_note и sticker её нет
+CAPTION_TYPES = frozenset({"photo", "video", "animation", "document", "audio", "voice"})
+# Лимит длины подписи в Telegram
+CAPTION_MAX_LENGTH = 1024
+
+
+@dataclass(frozen=True)
+class MessageMedia:
+    """Вложение сообщения: file_id и метаданные (колонки author_messages)."""
+    media_type: str
+    file_id: str
+    file_unique_id: str | None = None
+    file_size: int | None = None
+    mime_type: str | None = None
+    file_name: str | None = None
+
+    def columns(self) -> dict:
+        return asdict(self)
+
+
+def extract_media(message: Message) -> MessageMedia | None:
+    """Вложение сообщения или None (текст / неподдерживаемый тип)."""
+    for media_type in MEDIA_TYPES:
+        attachment = getattr(message, media_type, None)
+        if attachment is None:
+            continue
+        if media_type == "photo":
+            # Список размеров одного фото — пересылаем самый крупный
+            attachment = attachment[-1]
+        return MessageMedia(
+            media_type=media_type,
+            file_id=attachment.file_id,
+            file_unique_id=attachment.file_unique_id,
+            file_size=getattr(attachment, "file_size", None),
+            mime_type=getattr(attachment, "mime_type", None),
+            file_name=getattr(attachment, "file_name", None),
+        )
+    return None
+
+
+def media_rejection(media: MessageMedia) -> str | None:
+    """Текст отказа пользователю, если тип не принимается или файл больше лимита; None — можно отправлять."""
+    max_mb = settings.media_max_mb.get(media.media_type)
+    if max_mb is None:
+        return MEDIA_UNSUPPORTED
+    if media.file_size is not None and media.file_size > max_mb * 1024 * 1024:
+        return MEDIA_TOO_BIG.format(max_mb=f"{max_mb:g}")
+    return None
@@ -0,0 +1,234 @@
+"""
+Outbox доставки сообщений автору.
+
+Хендлер только вставляет строку в author_messages (status = pending), а пул
+воркеров забирает готовые к отправке сообщения пачками через
+SELECT ... FOR UPDATE SKIP LOCKED и доставляет их. Временные ошибки
+(429 / 5xx / сеть) повторяются с экспоненциальной задержкой, которая
+не меньше retry_after из ответа Telegram. Ответ 429 относится ко всему
+боту, поэтому на retry_after приостанавливаются и все воркеры процесса,
+а не только повтор этого сообщения.
+
+В режиме DELIVERY_MODE=digest те же строки author_messages служат буфером
+дайджеста: воркер копит сообщения, пока самое старое не прождёт DIGEST_INTERVAL
+секунд или их текст не наберёт на полный пост (DIGEST_MAX_CHARS), и отправляет
+сводный пост — один вызов Bot API на пост вместо одного на сообщение. За раз
+уходит один пост, следующий — не раньше чем через DIGEST_INTERVAL, так что
+накопившаяся очередь разбирается постепенно, а не залпом. Статус доставки
+по-прежнему ведётся для каждого сообщения.
+"""
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import telebot
+
+from src.config import settings
+from src.logging import logger
+from src.services.author_notify import DeliveryResult, pack_digests, pending_media, send_digest, send_to_recipients
+from src.storage.db import session_scope
+from src.storage.repo import PendingDelivery, Repository
+
+
+def backoff_delay(attempts: int, retry_after: int | None = None) -> float:
+    """Задержка перед следующей попыткой: экспонента с джиттером, не меньше retry_after."""
+    delay = min(settings.delivery_backoff_base * (2 ** (attempts - 1)), settings.delivery_backoff_max)
+    delay *= random.uniform(0.5, 1.0)
+    if retry_after is not None:
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+class DeliveryWorkerPool:
+    """Пул потоков, разбирающих outbox."""
+
+    def __init__(self, bot: telebot.TeleBot, workers: int):
+        self._bot = bot
+        self._workers_count = workers
+        self._threads: list[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        # До этого момента (time.monotonic) воркеры не отправляют: пауза после 429
+        self._resume_at = 0.0
+        self._pause_lock = threading.Lock()
+
+    def start(self) -> None:
+        for i in range(self._workers_count):
+            thread = threading.Thread(target=self._run, name=f"delivery-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Delivery workers started: %d", self._workers_count)
+
+    def wake(self) -> None:
+        """Разбудить воркеры, не дожидаясь интервала опроса."""
+        self._wakeup.set()
+
+    def shutdown(self, timeout: float) -> None:
+        """Остановить воркеры после текущей пачки."""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        logger.info("Delivery workers stopped")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = self._claim()
+            except Exception as e:
+                logger.error("DB error claiming outbox messages: %s", e)
+                batch = []
+
+            if not batch:
+                self._wakeup.wait(settings.delivery_poll_interval)
+                self._wakeup.clear()
+                continue
+
+            for item in batch:
+                if not self._wait_pause():
+                    # Остановка во время паузы: остальные сообщения пачки вернутся после аренды
+                    break
+                self._deliver(item)
+
+    def _pause(self, seconds: float) -> None:
+        """Telegram ответил 429: не отправлять ничего seconds секунд."""
+        with self._pause_lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+        logger.warning("Delivery paused for %ss after 429", seconds)
+
+    def _wait_pause(self) -> bool:
+        """Дождаться конца паузы. False — воркеры останавливаются."""
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            self._stop.wait(delay)
+        return not self._stop.is_set()
+
+    def _claim(self) -> list[PendingDelivery]:
+        with session_scope() as session:
+            return Repository(session).claim_pending_messages(
+                limit=settings.delivery_batch_size,
+                lease_seconds=settings.delivery_lease_seconds,
+            )
+
+    def _deliver(self, item: PendingDelivery) -> None:
+        result = send_to_recipients(
+            self._bot, item.user_telegram_id, item.username, item.first_name, item.text, pending_media(item),
+        )
+        if result.retry_after is not None:
+            self._pause(result.retry_after)
+        try:
+            self._record(item, result)
+        except Exception as e:
+            logger.error("DB error updating delivery status for message %d: %s", item.message_id, e)
+
+    def _record(self, item: PendingDelivery, result: DeliveryResult) -> None:
+        with session_scope() as session:
+            repo = Repository(session)
+            attempts = item.attempts + 1
+            error = result.error_summary or "Telegram API error"
+
+            if result.success:
+                repo.set_delivery_status(item.message_id, "delivered", result.error_summary or None)
+            elif result.retryable and attempts < settings.delivery_max_attempts:
+                delay = backoff_delay(attempts, result.retry_after)
+                repo.schedule_retry(item.message_id, attempts, delay, error)
+                logger.warning(
+                    "Delivery of message %d failed (attempt %d), retry in %.1fs",
+                    item.message_id, attempts, delay,
+                )
+            else:
+                repo.mark_failed(item.message_id, error)
+                logger.error("Delivery of message %d failed permanently after %d attempts", item.message_id, attempts)
+
+
+class DigestWorkerPool(DeliveryWorkerPool):
+    """Воркер дайджеста: сообщения из outbox уходят сводными постами."""
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = self._claim() if self._is_due() else []
+            except Exception as e:
+                logger.error("DB error claiming outbox messages: %s", e)
+                batch = []
+
+            if not batch:
+                self._wakeup.wait(settings.delivery_poll_interval)
+                self._wakeup.clear()
+                continue
+
+            # Один пост за раз: не поместившееся в него уйдёт следующим постом после паузы
+            post, *rest = pack_digests(batch, settings.digest_max_chars)
+            self._release([item for later in rest for item in later])
+            self._deliver_post(post)
+            self._stop.wait(settings.digest_interval)
+            self._wait_pause()
+
+    def _claim(self) -> list[PendingDelivery]:
+        with session_scope() as session:
+            return Repository(session).claim_pending_messages(
+                limit=settings.digest_batch_size,
+                lease_seconds=settings.delivery_lease_seconds,
+            )
+
+    def _release(self, items: list[PendingDelivery]) -> None:
+        if not items:
+            return
+        try:
+            with session_scope() as session:
+                Repository(session).release_messages([item.message_id for item in items])
+        except Exception as e:
+            # Сообщения не потеряются: снова станут доступны после истечения аренды
+            logger.error("DB error releasing %d outbox messages: %s", len(items), e)
+
+    def _is_due(self) -> bool:
+        """Пора отправлять: самое старое сообщение ждёт DIGEST_INTERVAL или набралось на полный пост."""
+        with session_scope() as session:
+            count, oldest, chars = Repository(session).pending_stats()
+        if count == 0:
+            return False
+        waited_enough = oldest <= datetime.now(timezone.utc) - timedelta(seconds=settings.digest_interval)
+        return waited_enough or chars >= settings.digest_max_chars
+
+    def _deliver_post(self, post: list[PendingDelivery]) -> None:
+        result = send_digest(self._bot, post)
+        if result.retry_after is not None:
+            self._pause(result.retry_after)
+        try:
+            if result.success:
+                with session_scope() as session:
+                    Repository(session).mark_delivered_many([item.message_id for item in post])
+                return
+            for item in post:
+                self._record(item, result)
+        except Exception as e:
+            ids = ", ".join(str(item.message_id) for item in post)
+            logger.error("DB error updating delivery status for messages %s: %s", ids, e)
+
+
+_pool: DeliveryWorkerPool | None = None
+
+
+def start_delivery_workers(bot: telebot.TeleBot) -> None:
+    """Запустить воркеры доставки (при DELIVERY_MODE=outbox / digest)."""
+    global _pool
+    if settings.delivery_mode == "sync" or _pool is not None:
+        return
+    if settings.delivery_mode == "digest":
+        # Один воркер на процесс: параллельные воркеры дробили бы дайджест на мелкие посты
+        _pool = DigestWorkerPool(bot, workers=1)
+    else:
+        _pool = DeliveryWorkerPool(bot, workers=settings.delivery_workers)
+    _pool.start()
+
+
+def wake_delivery_workers() -> None:
+    """Сообщить воркерам о новом сообщении в outbox."""
+    if _pool is not None:
+        _pool.wake()
+
+
+def stop_delivery_workers() -> None:
+    if _pool is not None:
+        _pool.shutdown(timeout=settings.delivery_poll_interval + 5)
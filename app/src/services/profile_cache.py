@@ -0,0 +1,350 @@
+"""
+Кэш профилей пользователей и отложенная запись last_seen_at.
+
+Каждый /start и каждое сообщение раньше делали upsert пользователя, хотя
+username, имя и фамилия почти никогда не меняются. Теперь для каждого
+пользователя запоминается отпечаток профиля (после успешной записи в БД):
+
+  - отпечаток совпал — профиль в users актуален, upsert пропускается,
+    а время апдейта кладётся в буфер last_seen;
+  - не совпал (или неизвестен) — обычный upsert, отпечаток обновляется.
+
+Отпечатки хранятся в LRU процесса на PROFILE_CACHE_SIZE записей; при
+PROFILE_CACHE_BACKEND=redis — ещё и в Redis с TTL, чтобы новый воркер не
+переписывал профили заново.
+
+Буфер last_seen (telegram_id -> время последнего апдейта) раз в
+LAST_SEEN_FLUSH_INTERVAL секунд сбрасывается в Postgres одним UPDATE на всю
+пачку; заодно снимается is_blocked, как и при upsert. При ошибке записи
+пачка возвращается в буфер; при остановке процесса буфер дописывается.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from sqlalchemy.exc import IntegrityError
+
+from src import metrics
+from src.config import settings
+from src.logging import logger
+from src.services.media import MessageMedia
+from src.services.replay import defer_write
+from src.storage.db import async_session_scope, is_unavailable, session_scope
+from src.storage.redis_client import get_async_redis, get_redis
+from src.storage.repo import AsyncRepository, Repository
+
+
+def fingerprint(username: str | None, first_name: str | None, last_name: str | None) -> str:
+    """Короткий отпечаток полей профиля, которые пишет upsert_user."""
+    raw = "\0".join(value or "" for value in (username, first_name, last_name))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ProfileCache:
+    """LRU отпечатков в памяти процесса, опционально — с общим кэшем в Redis."""
+
+    def __init__(self, max_size: int, redis_ttl: int | None = None):
+        self._max_size = max_size
+        self._redis_ttl = redis_ttl
+        self._profiles: OrderedDict[int, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(telegram_id: int) -> str:
+        return f"profile:{telegram_id}"
+
+    def _local_get(self, telegram_id: int) -> str | None:
+        with self._lock:
+            value = self._profiles.get(telegram_id)
+            if value is not None:
+                self._profiles.move_to_end(telegram_id)
+            return value
+
+    def _local_put(self, telegram_id: int, value: str) -> None:
+        with self._lock:
+            self._profiles[telegram_id] = value
+            self._profiles.move_to_end(telegram_id)
+            while len(self._profiles) > self._max_size:
+                self._profiles.popitem(last=False)
+
+    def _local_forget(self, telegram_id: int) -> None:
+        with self._lock:
+            self._profiles.pop(telegram_id, None)
+
+    def is_current(self, telegram_id: int, value: str) -> bool:
+        if self._local_get(telegram_id) == value:
+            return True
+        if self._redis_ttl is None:
+            return False
+        if get_redis().get(self._key(telegram_id)) != value:
+            return False
+        self._local_put(telegram_id, value)
+        return True
+
+    def remember(self, telegram_id: int, value: str) -> None:
+        self._local_put(telegram_id, value)
+        if self._redis_ttl is not None:
+            get_redis().set(self._key(telegram_id), value, ex=self._redis_ttl)
+
+    def forget(self, telegram_id: int) -> None:
+        self._local_forget(telegram_id)
+        if self._redis_ttl is not None:
+            get_redis().delete(self._key(telegram_id))
+
+    async def is_current_async(self, telegram_id: int, value: str) -> bool:
+        if self._local_get(telegram_id) == value:
+            return True
+        if self._redis_ttl is None:
+            return False
+        if await get_async_redis().get(self._key(telegram_id)) != value:
+            return False
+        self._local_put(telegram_id, value)
+        return True
+
+    async def remember_async(self, telegram_id: int, value: str) -> None:
+        self._local_put(telegram_id, value)
+        if self._redis_ttl is not None:
+            await get_async_redis().set(self._key(telegram_id), value, ex=self._redis_ttl)
+
+    async def forget_async(self, telegram_id: int) -> None:
+        self._local_forget(telegram_id)
+        if self._redis_ttl is not None:
+            await get_async_redis().delete(self._key(telegram_id))
+
+
+class LastSeenBuffer:
+    """Последнее время апдейта по пользователям, ожидающее записи в Postgres."""
+
+    def __init__(self):
+        self._seen: dict[int, datetime] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, telegram_id: int) -> None:
+        with self._lock:
+            self._seen[telegram_id] = datetime.now(timezone.utc)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def flush(self) -> int:
+        """Записать накопленное одним UPDATE. Возвращает число пользователей."""
+        with self._lock:
+            seen, self._seen = self._seen, {}
+        if not seen:
+            return 0
+        try:
+            with session_scope() as session:
+                Repository(session).touch_users(seen)
+        except Exception as e:
+            logger.error("DB error flushing last_seen_at for %d users: %s", len(seen), e)
+            # Вернуть пачку в буфер, не затирая более свежие отметки
+            with self._lock:
+                for telegram_id, seen_at in seen.items():
+                    self._seen.setdefault(telegram_id, seen_at)
+            return 0
+        metrics.LAST_SEEN_FLUSHED.inc(len(seen))
+        return len(seen)
+
+
+_cache: ProfileCache | None = None
+_buffer = LastSeenBuffer()
+_flusher: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def get_profile_cache() -> ProfileCache:
+    """Получить (или создать) кэш согласно PROFILE_CACHE_BACKEND."""
+    global _cache
+    if _cache is None:
+        redis_ttl = settings.profile_cache_ttl_seconds if settings.profile_cache_backend == "redis" else None
+        _cache = ProfileCache(max_size=settings.profile_cache_size, redis_ttl=redis_ttl)
+    return _cache
+
+
+def _is_current(telegram_id: int, value: str) -> bool:
+    try:
+        return get_profile_cache().is_current(telegram_id, value)
+    except Exception as e:
+        logger.warning("Profile cache lookup failed for user %d: %s", telegram_id, e)
+        return False
+
+
+def _remember(telegram_id: int, value: str) -> None:
+    try:
+        get_profile_cache().remember(telegram_id, value)
+    except Exception as e:
+        logger.warning("Profile cache update failed for user %d: %s", telegram_id, e)
+
+
+def _forget(telegram_id: int) -> None:
+    try:
+        get_profile_cache().forget(telegram_id)
+    except Exception as e:
+        logger.warning("Profile cache invalidation failed for user %d: %s", telegram_id, e)
+
+
+async def _is_current_async(telegram_id: int, value: str) -> bool:
+    try:
+        return await get_profile_cache().is_current_async(telegram_id, value)
+    except Exception as e:
+        logger.warning("Profile cache lookup failed for user %d: %s", telegram_id, e)
+        return False
+
+
+async def _remember_async(telegram_id: int, value: str) -> None:
+    try:
+        await get_profile_cache().remember_async(telegram_id, value)
+    except Exception as e:
+        logger.warning("Profile cache update failed for user %d: %s", telegram_id, e)
+
+
+async def _forget_async(telegram_id: int) -> None:
+    try:
+        await get_profile_cache().forget_async(telegram_id)
+    except Exception as e:
+        logger.warning("Profile cache invalidation failed for user %d: %s", telegram_id, e)
+
+
+def _defer_upsert(telegram_id: int, username: str | None, first_name: str | None, last_name: str | None) -> None:
+    # Профиль не запоминается в кэше: следующий апдейт снова попробует upsert
+    logger.warning("Postgres unavailable, deferring profile of user %d", telegram_id)
+    defer_write(
+        f"profile of user {telegram_id}",
+        lambda repo: repo.upsert_user(telegram_id, username, first_name, last_name),
+    )
+
+
+def save_user(telegram_id: int, username: str | None, first_name: str | None, last_name: str | None) -> None:
+    """Upsert пользователя, если профиль изменился; иначе только отметка last_seen."""
+    value = fingerprint(username, first_name, last_name)
+    if _is_current(telegram_id, value):
+        metrics.PROFILE_CACHE_LOOKUPS.labels("hit").inc()
+        _buffer.touch(telegram_id)
+        return
+
+    metrics.PROFILE_CACHE_LOOKUPS.labels("miss").inc()
+    try:
+        with session_scope() as session:
+            Repository(session).upsert_user(telegram_id, username, first_name, last_name)
+    except Exception as e:
+        if not is_unavailable(e):
+            raise
+        _defer_upsert(telegram_id, username, first_name, last_name)
+        return
+    _remember(telegram_id, value)
+
+
+async def save_user_async(telegram_id: int, username: str | None, first_name: str | None, last_name: str | None) -> None:
+    """Асинхронный вариант save_user."""
+    value = fingerprint(username, first_name, last_name)
+    if await _is_current_async(telegram_id, value):
+        metrics.PROFILE_CACHE_LOOKUPS.labels("hit").inc()
+        _buffer.touch(telegram_id)
+        return
+
+    metrics.PROFILE_CACHE_LOOKUPS.labels("miss").inc()
+    try:
+        async with async_session_scope() as session:
+            await AsyncRepository(session).upsert_user(telegram_id, username, first_name, last_name)
+    except Exception as e:
+        if not is_unavailable(e):
+            raise
+        _defer_upsert(telegram_id, username, first_name, last_name)
+        return
+    await _remember_async(telegram_id, value)
+
+
+def record_message(
+    telegram_id: int,
+    username: str | None,
+    first_name: str | None,
+    last_name: str | None,
+    text: str,
+    media: MessageMedia | None = None,
+) -> int:
+    """
+    Записать сообщение автору. Возвращает id записи.
+
+    Профиль не менялся — простой INSERT сообщения; иначе upsert профиля
+    и вставка одним запросом (record_author_message).
+    """
+    columns = media.columns() if media else None
+    value = fingerprint(username, first_name, last_name)
+    if _is_current(telegram_id, value):
+        try:
+            with session_scope() as session:
+                message_id = Repository(session).create_author_message(telegram_id, text, columns)
+        except IntegrityError:
+            # Строки пользователя нет (БД пересоздана и т.п.) — кэш устарел
+            logger.warning("Cached profile of user %d not found in DB, upserting", telegram_id)
+            _forget(telegram_id)
+        else:
+            metrics.PROFILE_CACHE_LOOKUPS.labels("hit").inc()
+            _buffer.touch(telegram_id)
+            return message_id
+
+    metrics.PROFILE_CACHE_LOOKUPS.labels("miss").inc()
+    with session_scope() as session:
+        message_id = Repository(session).record_author_message(telegram_id, username, first_name, last_name, text, columns)
+    _remember(telegram_id, value)
+    return message_id
+
+
+async def record_message_async(
+    telegram_id: int,
+    username: str | None,
+    first_name: str | None,
+    last_name: str | None,
+    text: str,
+    media: MessageMedia | None = None,
+) -> int:
+    """Асинхронный вариант record_message."""
+    columns = media.columns() if media else None
+    value = fingerprint(username, first_name, last_name)
+    if await _is_current_async(telegram_id, value):
+        try:
+            async with async_session_scope() as session:
+                message_id = await AsyncRepository(session).create_author_message(telegram_id, text, columns)
+        except IntegrityError:
+            logger.warning("Cached profile of user %d not found in DB, upserting", telegram_id)
+            await _forget_async(telegram_id)
+        else:
+            metrics.PROFILE_CACHE_LOOKUPS.labels("hit").inc()
+            _buffer.touch(telegram_id)
+            return message_id
+
+    metrics.PROFILE_CACHE_LOOKUPS.labels("miss").inc()
+    async with async_session_scope() as session:
+        message_id = await AsyncRepository(session).record_author_message(
+            telegram_id, username, first_name, last_name, text, columns,
+        )
+    await _remember_async(telegram_id, value)
+    return message_id
+
+
+def _flush_loop() -> None:
+    while not _stop.wait(settings.last_seen_flush_interval):
+        _buffer.flush()
+
+
+def start_last_seen_flusher() -> None:
+    """Запустить фоновый сброс буфера last_seen (один поток на процесс)."""
+    global _flusher
+    if _flusher is not None:
+        return
+    _flusher = threading.Thread(target=_flush_loop, name="last-seen-flush", daemon=True)
+    _flusher.start()
+    metrics.register_gauge("govorun_last_seen_buffer_size", "Users waiting for last_seen_at write", lambda: len(_buffer))
+
+
+def stop_last_seen_flusher() -> None:
+    """Остановить фоновый сброс и дописать буфер."""
+    global _flusher
+    _stop.set()
+    if _flusher is not None:
+        _flusher.join(timeout=settings.last_seen_flush_interval + 5)
+        _flusher = None
+    flushed = _buffer.flush()
+    if flushed:
+        logger.info("Flushed last_seen_at for %d users on shutdown", flushed)
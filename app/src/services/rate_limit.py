@@ -1,41 +1,296 @@
-import redis
+"""
+Rate limiting сообщений автору.
 
+Каждая политика — Lua-скрипт, который за один запрос к Redis проверяет лимит,
+обновляет счётчик и возвращает (allowed, remaining, ttl):
+  - fixed:        фиксированное окно (INCR + EXPIRE)
+  - sliding:      скользящее окно (лог отправок в sorted set)
+  - token_bucket: корзина токенов с запасом RATE_LIMIT_BURST
+
+Для ASGI-режима те же скрипты выполняются через redis.asyncio (check_rate_limit_async).
+
+Пока Redis недоступен (ошибка или разомкнутый redis_breaker), лимит считает
+LocalRateLimiter — корзины токенов в памяти процесса с тем же темпом. Лимит
+при этом действует на процесс, а не на весь бот: в худшем случае пользователь
+получит по лимиту на каждый воркер.
+"""
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from redis.commands.core import AsyncScript, Script
+
+from src import metrics
 from src.config import settings
-from src.logging import logger
+from src.logging import info_sampled, logger
+from src.profiler import record_span
+from src.services.token_bucket import TokenBucket
+from src.storage.circuit_breaker import CircuitOpenError
+from src.storage.redis_client import get_async_redis, get_redis
 
-_redis_client: redis.Redis | None = None
+# Сколько пользователей помнит запасной лимитер (LRU)
+_LOCAL_MAX_USERS = 100_000
 
+# KEYS[1] — ключ; ARGV: limit, window_sec
+_FIXED_WINDOW_LUA = """
+local count = redis.call('INCR', KEYS[1])
+local ttl = redis.call('TTL', KEYS[1])
+if ttl < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    ttl = tonumber(ARGV[2])
+end
+local limit = tonumber(ARGV[1])
+if count > limit then
+    return {0, 0, ttl}
+end
+return {1, limit - count, ttl}
+"""
 
-def get_redis() -> redis.Redis:
-    """Получить (или создать) клиент Redis."""
-    global _redis_client
-    if _redis_client is None:
-        _redis_client = redis.from_url(settings.redis_dsn, decode_responses=True)
-    return _redis_client
+# KEYS[1] — ключ; ARGV: limit, window_ms, now_ms, member
+_SLIDING_WINDOW_LUA = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+local allowed = 0
+if count < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], window)
+    count = count + 1
+    allowed = 1
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+local ttl = 0
+if oldest[2] then
+    ttl = math.ceil((tonumber(oldest[2]) + window - now) / 1000)
+end
+return {allowed, limit - count, ttl}
+"""
 
+# KEYS[1] — ключ; ARGV: capacity, refill_ms (мс на один токен), now_ms
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1])
+local ts = tonumber(data[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) / refill)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) * refill) + 1000)
+local ttl = 0
+if tokens < 1 then
+    ttl = math.ceil((1 - tokens) * refill / 1000)
+end
+return {allowed, math.floor(tokens), ttl}
+"""
 
-def can_send(user_id: int) -> bool:
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    """Результат проверки лимита."""
+    allowed: bool
+    # Сколько ещё сообщений можно отправить сейчас
+    remaining: int
+    # Через сколько секунд станет доступно следующее сообщение (при allowed — сброс окна)
+    ttl: int
+
+
+class RateLimiter:
+    """Базовый лимитер: один Lua-скрипт, один запрос к Redis на проверку."""
+
+    lua: str = ""
+    key_prefix: str = ""
+
+    def __init__(self, limit: int, window: int):
+        self.limit = limit
+        self.window = window
+        self._script: Script | None = None
+        self._async_script: AsyncScript | None = None
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.key_prefix}:{user_id}"
+
+    def _args(self) -> list:
+        raise NotImplementedError
+
+    @staticmethod
+    def _decision(raw: list) -> RateLimitDecision:
+        allowed, remaining, ttl = raw
+        return RateLimitDecision(allowed=bool(allowed), remaining=max(int(remaining), 0), ttl=max(int(ttl), 0))
+
+    def check(self, user_id: int) -> RateLimitDecision:
+        if self._script is None:
+            self._script = get_redis().register_script(self.lua)
+        return self._decision(self._script(keys=[self._key(user_id)], args=self._args()))
+
+    async def check_async(self, user_id: int) -> RateLimitDecision:
+        if self._async_script is None:
+            self._async_script = get_async_redis().register_script(self.lua)
+        return self._decision(await self._async_script(keys=[self._key(user_id)], args=self._args()))
+
+
+class FixedWindowLimiter(RateLimiter):
+    """limit сообщений на окно в window секунд, окно стартует с первого сообщения."""
+
+    lua = _FIXED_WINDOW_LUA
+    key_prefix = "rl:msg_to_author"
+
+    def _args(self) -> list:
+        return [self.limit, self.window]
+
+
+class SlidingWindowLimiter(RateLimiter):
+    """Не больше limit сообщений за любые window секунд."""
+
+    lua = _SLIDING_WINDOW_LUA
+    key_prefix = "rl:sliding:msg_to_author"
+
+    def _args(self) -> list:
+        now_ms = int(time.time() * 1000)
+        return [self.limit, self.window * 1000, now_ms, f"{now_ms}-{uuid.uuid4().hex[:8]}"]
+
+
+class TokenBucketLimiter(RateLimiter):
+    """Корзина на burst токенов, пополняется на limit токенов за window секунд."""
+
+    lua = _TOKEN_BUCKET_LUA
+    key_prefix = "rl:bucket:msg_to_author"
+
+    def __init__(self, limit: int, window: int, burst: int):
+        super().__init__(limit, window)
+        self.burst = burst
+
+    def _args(self) -> list:
+        refill_ms = self.window * 1000 / self.limit
+        return [self.burst, refill_ms, int(time.time() * 1000)]
+
+
+class LocalRateLimiter:
+    """Запасной лимитер на время недоступности Redis: корзина токенов на пользователя в памяти процесса."""
+
+    def __init__(self, limit: int, window: int, burst: int):
+        self._rate = limit / window
+        self._burst = burst
+        self._buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(rate=self._rate, capacity=self._burst)
+                while len(self._buckets) > _LOCAL_MAX_USERS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+            return bucket
+
+    def check(self, user_id: int) -> RateLimitDecision:
+        bucket = self._bucket(user_id)
+        wait = bucket.try_acquire()
+        return RateLimitDecision(allowed=wait == 0, remaining=int(bucket.available()), ttl=math.ceil(wait))
+
+
+_limiter: RateLimiter | None = None
+_local_limiter: LocalRateLimiter | None = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Получить (или создать) лимитер согласно RATE_LIMIT_POLICY."""
+    global _limiter
+    if _limiter is None:
+        limit, window = settings.rate_limit_max_messages, settings.rate_limit_seconds
+        if settings.rate_limit_policy == "sliding":
+            _limiter = SlidingWindowLimiter(limit, window)
+        elif settings.rate_limit_policy == "token_bucket":
+            _limiter = TokenBucketLimiter(limit, window, burst=settings.rate_limit_burst)
+        else:
+            _limiter = FixedWindowLimiter(limit, window)
+    return _limiter
+
+
+def get_local_rate_limiter() -> LocalRateLimiter:
+    """Запасной лимитер: тот же темп, запас — RATE_LIMIT_BURST (token_bucket) или весь лимит окна."""
+    global _local_limiter
+    if _local_limiter is None:
+        limit, window = settings.rate_limit_max_messages, settings.rate_limit_seconds
+        burst = settings.rate_limit_burst if settings.rate_limit_policy == "token_bucket" else limit
+        _local_limiter = LocalRateLimiter(limit, window, burst)
+    return _local_limiter
+
+
+def _fallback(user_id: int, error: Exception, started: float) -> RateLimitDecision:
+    if not isinstance(error, CircuitOpenError):
+        # О разомкнутом breaker уже сообщено в логе при размыкании
+        logger.warning("Rate limit check for user %d falls back to local limiter: %s", user_id, error)
+    metrics.RATE_LIMIT_FALLBACKS.inc()
+    decision = get_local_rate_limiter().check(user_id)
+    _record(user_id, decision, started)
+    return decision
+
+
+def _admin_decision() -> RateLimitDecision:
+    return RateLimitDecision(allowed=True, remaining=settings.rate_limit_max_messages, ttl=0)
+
+
+def _record(user_id: int, decision: RateLimitDecision, started: float) -> None:
+    result = "allowed" if decision.allowed else "limited"
+    elapsed = time.perf_counter() - started
+    metrics.RATE_LIMIT_LATENCY.labels(result).observe(elapsed)
+    record_span("rate_limit", result, elapsed)
+    if decision.allowed:
+        info_sampled("Rate limit OK for user %d, remaining=%d", user_id, decision.remaining)
+    else:
+        info_sampled("Rate limit HIT for user %d, ttl=%d", user_id, decision.ttl)
+
+
+def check_rate_limit(user_id: int) -> RateLimitDecision:
     """
     Проверить, может ли пользователь отправить сообщение автору.
 
-    Использует SET NX EX — атомарная проверка + установка TTL.
-    Возвращает True, если лимит не исчерпан (ключ успешно установлен).
+    Админ не ограничивается и не тратит запрос к Redis. При ошибке Redis
+    решение принимает запасной LocalRateLimiter.
     """
-    r = get_redis()
-    key = f"rl:msg_to_author:{user_id}"
-    result = r.set(key, "1", nx=True, ex=settings.rate_limit_seconds)
-    if result:
-        logger.info("Rate limit OK for user %d", user_id)
-        return True
-    else:
-        ttl = r.ttl(key)
-        logger.info("Rate limit HIT for user %d, ttl=%d", user_id, ttl)
-        return False
+    if user_id == settings.admin_id:
+        return _admin_decision()
+
+    started = time.perf_counter()
+    try:
+        decision = get_rate_limiter().check(user_id)
+    except Exception as e:
+        return _fallback(user_id, e, started)
+    _record(user_id, decision, started)
+    return decision
+
 
+async def check_rate_limit_async(user_id: int) -> RateLimitDecision:
+    """Асинхронный вариант check_rate_limit."""
+    if user_id == settings.admin_id:
+        return _admin_decision()
 
-def get_ttl(user_id: int) -> int:
-    """Получить оставшееся время до сброса лимита (в секундах)."""
-    r = get_redis()
-    key = f"rl:msg_to_author:{user_id}"
-    ttl = r.ttl(key)
-    return max(ttl, 0)
+    started = time.perf_counter()
+    try:
+        decision = await get_rate_limiter().check_async(user_id)
+    except Exception as e:
+        return _fallback(user_id, e, started)
+    _record(user_id, decision, started)
+    return decision
+
+
+def can_send(user_id: int) -> bool:
+    """Может ли пользователь отправить сообщение автору (см. check_rate_limit)."""
+    return check_rate_limit(user_id).allowed
@@ -0,0 +1,140 @@
+"""
+Отложенные записи в БД на время недоступности Postgres.
+
+Если запись не удалась из-за недоступности Postgres (разомкнутый
+postgres_breaker, нет соединения, таймаут), хендлер не ждёт и не падает:
+сообщение уже отправлено автору, а запись кладётся в очередь процесса
+(не больше REPLAY_QUEUE_SIZE, при переполнении теряются самые старые).
+Фоновый поток повторяет записи по порядку, как только Postgres снова
+отвечает; первая же запись служит пробным вызовом breaker.
+
+Записи, упавшие не из-за недоступности (например, внешний ключ: ссылки на
+пересланные сообщения раньше пользователя), возвращаются в конец очереди
+и повторяются ещё до _MAX_ATTEMPTS раз. Очередь живёт в памяти: при
+остановке процесса то, что не успело записаться, теряется (в лог пишется число).
+"""
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable
+
+from src import metrics
+from src.config import settings
+from src.logging import logger
+from src.services.media import MessageMedia
+from src.storage.db import is_unavailable, session_scope
+from src.storage.repo import Repository
+
+# Как часто (сек) проверять очередь
+_INTERVAL = 1.0
+# Попыток на запись при ошибках, не связанных с недоступностью Postgres
+_MAX_ATTEMPTS = 3
+
+
+@dataclass
+class _Write:
+    description: str
+    apply: Callable[[Repository], None]
+    attempts: int = 0
+
+
+_queue: deque[_Write] = deque()
+_lock = threading.Lock()
+_worker: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def defer_write(description: str, apply: Callable[[Repository], None]) -> None:
+    """Поставить запись в очередь повтора. apply получает Repository и должен сам закоммитить."""
+    with _lock:
+        if len(_queue) >= settings.replay_queue_size:
+            dropped = _queue.popleft()
+            metrics.REPLAY_WRITES.labels("dropped").inc()
+            logger.error("Replay queue is full, dropping %s", dropped.description)
+        _queue.append(_Write(description, apply))
+    metrics.REPLAY_WRITES.labels("queued").inc()
+
+
+def defer_author_message(
+    telegram_id: int,
+    username: str | None,
+    first_name: str | None,
+    last_name: str | None,
+    text: str,
+    status: str,
+    error: str | None = None,
+    media: MessageMedia | None = None,
+) -> None:
+    """Записать сообщение автору (уже отправленное или нет) с исходным временем — после восстановления БД."""
+    created_at = datetime.now(timezone.utc)
+    columns = media.columns() if media else None
+    defer_write(
+        f"message of user {telegram_id}",
+        lambda repo: repo.restore_author_message(
+            telegram_id, username, first_name, last_name, text, created_at, status, error, columns,
+        ),
+    )
+
+
+def replay_pending() -> int:
+    """Повторить накопленные записи по порядку. Возвращает число записанных."""
+    done = 0
+    with _lock:
+        budget = len(_queue)
+    while budget > 0 and not _stop.is_set():
+        budget -= 1
+        with _lock:
+            if not _queue:
+                break
+            write = _queue.popleft()
+        try:
+            with session_scope() as session:
+                write.apply(Repository(session))
+        except Exception as e:
+            with _lock:
+                if is_unavailable(e):
+                    # Postgres всё ещё недоступен — запись остаётся первой, ждём следующего круга
+                    _queue.appendleft(write)
+                    break
+                write.attempts += 1
+                if write.attempts < _MAX_ATTEMPTS:
+                    _queue.append(write)
+                    continue
+            metrics.REPLAY_WRITES.labels("dropped").inc()
+            logger.error("Replay of %s failed, dropping: %s", write.description, e)
+            continue
+        done += 1
+        metrics.REPLAY_WRITES.labels("replayed").inc()
+    if done:
+        logger.info("Replayed %d deferred DB writes, %d left", done, len(_queue))
+    return done
+
+
+def _replay_loop() -> None:
+    while not _stop.wait(_INTERVAL):
+        if _queue:
+            replay_pending()
+
+
+def start_replay() -> None:
+    """Запустить фоновый повтор отложенных записей (один поток на процесс)."""
+    global _worker
+    if _worker is not None:
+        return
+    _worker = threading.Thread(target=_replay_loop, name="db-replay", daemon=True)
+    _worker.start()
+    metrics.register_gauge("govorun_replay_queue_depth", "DB writes waiting for Postgres", lambda: len(_queue))
+
+
+def stop_replay() -> None:
+    """Остановить повтор; последняя попытка записать очередь перед выходом."""
+    global _worker
+    if _worker is not None:
+        _stop.set()
+        _worker.join(timeout=_INTERVAL + 5)
+        _worker = None
+        _stop.clear()
+        replay_pending()
+    if _queue:
+        logger.error("Stopping with %d deferred DB writes not replayed", len(_queue))
@@ -0,0 +1,274 @@
+"""
+Ответы автора пользователям.
+
+Каждое сообщение, пересланное автору (ЛС админа / группа), запоминается как
+(chat_id, message_id) -> telegram_id отправителя: в таблице forwarded_messages
+(поиск по первичному ключу) и в кэше перед ней. Когда автор отвечает (reply)
+на пересланное сообщение, отправитель находится в кэше — один GET в Redis или
+dict в памяти процесса; Postgres читается только при промахе.
+
+Таблица нужна только для надёжности (кэш заполняется сразу), поэтому доставка
+её не ждёт: пары копятся в буфере процесса и раз в REPLY_FLUSH_INTERVAL секунд
+пишутся одним INSERT фоновым потоком. Пока пара в буфере, поиск находит её там.
+Пачка, которую не удалось записать, уходит в очередь повтора (services/replay).
+
+Бэкенды кэша (REPLY_CACHE_BACKEND):
+  - redis:  ключ на сообщение с TTL — общий для всех воркеров и контейнеров
+  - memory: LRU на REPLY_CACHE_SIZE записей в памяти процесса
+"""
+import threading
+from collections import OrderedDict
+from typing import Protocol
+
+from src import metrics
+from src.config import settings
+from src.logging import logger
+from src.services.replay import defer_write
+from src.storage.db import async_session_scope, session_scope
+from src.storage.redis_client import get_async_redis, get_redis
+from src.storage.repo import AsyncRepository, Repository
+
+class SenderCache(Protocol):
+    def get(self, chat_id: int, message_id: int) -> int | None: ...
+
+    def put(self, user_id: int, forwards: list[tuple[int, int]]) -> None: ...
+
+    async def get_async(self, chat_id: int, message_id: int) -> int | None: ...
+
+    async def put_async(self, user_id: int, forwards: list[tuple[int, int]]) -> None: ...
+
+
+class MemorySenderCache:
+    """LRU последних max_size пересланных сообщений в памяти процесса."""
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._senders: OrderedDict[tuple[int, int], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id: int, message_id: int) -> int | None:
+        key = (chat_id, message_id)
+        with self._lock:
+            user_id = self._senders.get(key)
+            if user_id is not None:
+                self._senders.move_to_end(key)
+            return user_id
+
+    def put(self, user_id: int, forwards: list[tuple[int, int]]) -> None:
+        with self._lock:
+            for key in forwards:
+                self._senders[key] = user_id
+                self._senders.move_to_end(key)
+            while len(self._senders) > self._max_size:
+                self._senders.popitem(last=False)
+
+    async def get_async(self, chat_id: int, message_id: int) -> int | None:
+        return self.get(chat_id, message_id)
+
+    async def put_async(self, user_id: int, forwards: list[tuple[int, int]]) -> None:
+        self.put(user_id, forwards)
+
+
+class RedisSenderCache:
+    """Один ключ на пересланное сообщение, SET EX."""
+
+    def __init__(self, ttl: int):
+        self._ttl = ttl
+
+    @staticmethod
+    def _key(chat_id: int, message_id: int) -> str:
+        return f"reply:sender:{chat_id}:{message_id}"
+
+    def get(self, chat_id: int, message_id: int) -> int | None:
+        value = get_redis().get(self._key(chat_id, message_id))
+        return int(value) if value is not None else None
+
+    def put(self, user_id: int, forwards: list[tuple[int, int]]) -> None:
+        pipe = get_redis().pipeline(transaction=False)
+        for chat_id, message_id in forwards:
+            pipe.set(self._key(chat_id, message_id), user_id, ex=self._ttl)
+        pipe.execute()
+
+    async def get_async(self, chat_id: int, message_id: int) -> int | None:
+        value = await get_async_redis().get(self._key(chat_id, message_id))
+        return int(value) if value is not None else None
+
+    async def put_async(self, user_id: int, forwards: list[tuple[int, int]]) -> None:
+        pipe = get_async_redis().pipeline(transaction=False)
+        for chat_id, message_id in forwards:
+            pipe.set(self._key(chat_id, message_id), user_id, ex=self._ttl)
+        await pipe.execute()
+
+
+_cache: SenderCache | None = None
+
+
+def get_sender_cache() -> SenderCache:
+    """Получить (или создать) кэш согласно REPLY_CACHE_BACKEND."""
+    global _cache
+    if _cache is None:
+        if settings.reply_cache_backend == "redis":
+            _cache = RedisSenderCache(ttl=settings.reply_cache_ttl_seconds)
+        else:
+            _cache = MemorySenderCache(max_size=settings.reply_cache_size)
+    return _cache
+
+
+def _cache_get(chat_id: int, message_id: int) -> int | None:
+    try:
+        return get_sender_cache().get(chat_id, message_id)
+    except Exception as e:
+        logger.warning("Reply cache lookup failed for %d/%d: %s", chat_id, message_id, e)
+        return None
+
+
+def _cache_put(user_id: int, forwards: list[tuple[int, int]]) -> None:
+    try:
+        get_sender_cache().put(user_id, forwards)
+    except Exception as e:
+        logger.warning("Reply cache update failed for user %d: %s", user_id, e)
+
+
+async def _cache_get_async(chat_id: int, message_id: int) -> int | None:
+    try:
+        return await get_sender_cache().get_async(chat_id, message_id)
+    except Exception as e:
+        logger.warning("Reply cache lookup failed for %d/%d: %s", chat_id, message_id, e)
+        return None
+
+
+async def _cache_put_async(user_id: int, forwards: list[tuple[int, int]]) -> None:
+    try:
+        await get_sender_cache().put_async(user_id, forwards)
+    except Exception as e:
+        logger.warning("Reply cache update failed for user %d: %s", user_id, e)
+
+
+class ForwardsBuffer:
+    """Пересланные сообщения, ожидающие записи в forwarded_messages."""
+
+    def __init__(self):
+        self._senders: dict[tuple[int, int], int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, user_id: int, forwards: list[tuple[int, int]]) -> None:
+        with self._lock:
+            for forward in forwards:
+                self._senders[forward] = user_id
+
+    def get(self, chat_id: int, message_id: int) -> int | None:
+        with self._lock:
+            return self._senders.get((chat_id, message_id))
+
+    def __len__(self) -> int:
+        return len(self._senders)
+
+    def flush(self) -> int:
+        """Записать накопленное одним INSERT. Возвращает число сообщений."""
+        with self._lock:
+            senders = dict(self._senders)
+        if not senders:
+            return 0
+        try:
+            with session_scope() as session:
+                Repository(session).record_forwards(senders)
+        except Exception as e:
+            # Без потери: повтор по порядку после отложенных сообщений (внешний ключ на users)
+            logger.error("DB error saving %d forwards: %s", len(senders), e)
+            defer_write(f"{len(senders)} forwards", lambda repo: repo.record_forwards(senders))
+        with self._lock:
+            for forward in senders:
+                if self._senders.get(forward) == senders[forward]:
+                    del self._senders[forward]
+        return len(senders)
+
+
+_buffer = ForwardsBuffer()
+_flusher: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def remember_forwards(user_id: int, forwards: list[tuple[int, int]]) -> None:
+    """
+    Запомнить отправителя пересланных сообщений [(chat_id, message_id)].
+
+    Сразу — в кэш; в forwarded_messages — фоновым сбросом буфера. Ошибки
+    кэша только логируются: сообщение автору уже доставлено.
+    """
+    if not forwards:
+        return
+    _cache_put(user_id, forwards)
+    _buffer.add(user_id, forwards)
+
+
+async def remember_forwards_async(user_id: int, forwards: list[tuple[int, int]]) -> None:
+    """Асинхронный вариант remember_forwards."""
+    if not forwards:
+        return
+    await _cache_put_async(user_id, forwards)
+    _buffer.add(user_id, forwards)
+
+
+def _flush_loop() -> None:
+    while not _stop.wait(settings.reply_flush_interval):
+        _buffer.flush()
+
+
+def start_forwards_flusher() -> None:
+    """Запустить фоновую запись forwarded_messages (один поток на процесс)."""
+    global _flusher
+    if _flusher is not None:
+        return
+    _flusher = threading.Thread(target=_flush_loop, name="forwards-flush", daemon=True)
+    _flusher.start()
+    metrics.register_gauge("govorun_forwards_buffer_size", "Forwarded messages waiting for DB write", lambda: len(_buffer))
+
+
+def stop_forwards_flusher() -> None:
+    """Остановить фоновую запись и дописать буфер."""
+    global _flusher
+    _stop.set()
+    if _flusher is not None:
+        _flusher.join(timeout=settings.reply_flush_interval + 5)
+        _flusher = None
+    flushed = _buffer.flush()
+    if flushed:
+        logger.info("Flushed %d forwards on shutdown", flushed)
+
+
+def find_sender(chat_id: int, message_id: int) -> int | None:
+    """telegram_id отправителя сообщения, пересланного в chat_id. None — не наше сообщение."""
+    user_id = _cache_get(chat_id, message_id)
+    if user_id is None:
+        user_id = _buffer.get(chat_id, message_id)
+    if user_id is not None:
+        metrics.REPLY_CACHE_LOOKUPS.labels("hit").inc()
+        return user_id
+
+    with session_scope() as session:
+        user_id = Repository(session).get_forward_sender(chat_id, message_id)
+    if user_id is None:
+        metrics.REPLY_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+    metrics.REPLY_CACHE_LOOKUPS.labels("db").inc()
+    _cache_put(user_id, [(chat_id, message_id)])
+    return user_id
+
+
+async def find_sender_async(chat_id: int, message_id: int) -> int | None:
+    """Асинхронный вариант find_sender."""
+    user_id = await _cache_get_async(chat_id, message_id)
+    if user_id is None:
+        user_id = _buffer.get(chat_id, message_id)
+    if user_id is not None:
+        metrics.REPLY_CACHE_LOOKUPS.labels("hit").inc()
+        return user_id
+
+    async with async_session_scope() as session:
+        user_id = await AsyncRepository(session).get_forward_sender(chat_id, message_id)
+    if user_id is None:
+        metrics.REPLY_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+    metrics.REPLY_CACHE_LOOKUPS.labels("db").inc()
+    await _cache_put_async(user_id, [(chat_id, message_id)])
+    return user_id
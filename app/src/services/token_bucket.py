@@ -0,0 +1,58 @@
+"""
+Корзина токенов в памяти процесса.
+
+Темп исходящих вызовов, которые не должны превышать лимиты Telegram
+(рассылка: около 30 сообщений в секунду на бота), и запасной rate limit
+пользователей на время недоступности Redis. Потокобезопасна:
+acquire() ждёт токен вне блокировки, поэтому потоки пула отправки
+выстраиваются в равномерный поток без busy-wait.
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        # rate — токенов в секунду; capacity — запас на всплеск (по умолчанию секунда работы)
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        # Раньше этого момента токены не выдаются (пауза после 429)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Взять токен. 0 — токен получен, иначе сколько секунд подождать до следующей попытки."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self._rate
+
+    def available(self) -> float:
+        """Сколько токенов в корзине сейчас."""
+        with self._lock:
+            self._refill(max(time.monotonic(), self._updated))
+            return self._tokens
+
+    def acquire(self) -> None:
+        """Дождаться и взять токен."""
+        while (wait := self.try_acquire()) > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать токены seconds секунд и сбросить запас (Telegram ответил 429)."""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
@@ -0,0 +1,150 @@
+"""
+Подготовка окружения при старте: миграции БД и регистрация webhook.
+
+Каждый воркер gunicorn/uvicorn вызывает run_startup(), но работу делает
+только один — под advisory-локом Postgres; остальные ждут его и затем
+видят, что делать нечего. Повторный старт (рестарт, новые воркеры) проходит
+по быстрому пути: два запроса к Postgres (alembic_version и наличие
+партиций author_messages на PARTITION_MONTHS_AHEAD вперёд), один GET в Redis
+и getWebhookInfo — отпечаток в Redis не заметит, что webhook сбросили
+или переставили в обход бота (другой экземпляр, ручной deleteWebhook).
+
+Webhook не удаляется и апдейты не сбрасываются: setWebhook заменяет
+старый адрес, а накопившиеся апдейты обрабатываются после старта.
+"""
+import hashlib
+from pathlib import Path
+
+import telebot
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect, text
+
+from src.config import settings
+from src.logging import logger
+from src.storage.db import NO_STATEMENT_TIMEOUT, engine
+from src.storage.partitions import ensure_partitions, partitions_are_current
+from src.storage.redis_client import get_redis
+
+_APP_DIR = Path(__file__).resolve().parent.parent
+
+# Ключ pg_advisory_lock (произвольная константа, общая для всех процессов)
+_STARTUP_LOCK_KEY = 7_301_642_118
+_WEBHOOK_KEY = "startup:webhook"
+
+
+def _alembic_config() -> Config:
+    config = Config(str(_APP_DIR / "alembic.ini"))
+    # script_location в alembic.ini относительный — не зависим от текущего каталога
+    config.set_main_option("script_location", str(_APP_DIR / "src" / "storage" / "migrations"))
+    # Логирование уже настроено приложением — не перетирать его fileConfig из alembic.ini
+    config.attributes["configure_logger"] = False
+    return config
+
+
+def _schema_is_current(config: Config) -> bool:
+    heads = set(ScriptDirectory.from_config(config).get_heads())
+    with engine.connect() as conn:
+        return set(MigrationContext.configure(conn).get_current_heads()) == heads
+
+
+def _legacy_revision() -> str | None:
+    """
+    Ревизия для БД, созданной через create_all без Alembic (ранние версии бота).
+
+    None — таблиц нет или Alembic уже ведёт схему.
+    """
+    tables = set(inspect(engine).get_table_names())
+    if "alembic_version" in tables or "author_messages" not in tables:
+        return None
+    columns = {c["name"] for c in inspect(engine).get_columns("author_messages")}
+    return "002_outbox" if "attempts" in columns else "001_initial"
+
+
+def migrate_db(config: Config) -> None:
+    """Применить миграции Alembic до head."""
+    legacy = _legacy_revision()
+    if legacy is not None:
+        logger.info("Existing schema without alembic_version, stamping %s", legacy)
+        command.stamp(config, legacy)
+    logger.info("Applying database migrations...")
+    command.upgrade(config, "head")
+    logger.info("Database schema is up to date")
+
+
+def _webhook_fingerprint() -> str:
+    return hashlib.sha256(f"{settings.webhook_url}\n{settings.webhook_secret_token}".encode()).hexdigest()
+
+
+def _webhook_is_current(bot: telebot.TeleBot) -> bool:
+    """Отпечаток последней установки совпадает и Telegram шлёт апдейты на наш адрес."""
+    try:
+        if get_redis().get(_WEBHOOK_KEY) != _webhook_fingerprint():
+            return False
+    except Exception as e:
+        logger.warning("Webhook fingerprint check failed: %s", e)
+        return False
+    try:
+        return bot.get_webhook_info().url == settings.webhook_url
+    except Exception as e:
+        logger.warning("getWebhookInfo failed: %s", e)
+        return False
+
+
+def ensure_webhook(bot: telebot.TeleBot) -> None:
+    """
+    Установить webhook, если адрес или secret token изменились.
+
+    getWebhookInfo не возвращает secret token, поэтому отпечаток
+    адреса и токена последней установки хранится в Redis.
+    """
+    if _webhook_is_current(bot):
+        logger.info("Webhook is up to date: %s", settings.webhook_url)
+        return
+
+    logger.info("Setting webhook: %s", settings.webhook_url)
+    bot.set_webhook(
+        url=settings.webhook_url,
+        secret_token=settings.webhook_secret_token or None,
+    )
+    try:
+        get_redis().set(_WEBHOOK_KEY, _webhook_fingerprint())
+    except Exception as e:
+        logger.warning("Failed to store webhook fingerprint: %s", e)
+    logger.info("Webhook set successfully")
+
+
+def _partitions_are_current() -> bool:
+    with engine.connect() as conn:
+        return partitions_are_current(conn, settings.partition_months_ahead)
+
+
+def run_startup(bot: telebot.TeleBot) -> None:
+    """Привести схему БД, партиции и webhook в актуальное состояние (один раз на деплой)."""
+    config = _alembic_config()
+    if _schema_is_current(config) and _partitions_are_current() and _webhook_is_current(bot):
+        logger.info("Startup: schema, partitions and webhook are up to date")
+        return
+
+    with engine.connect() as lock_conn:
+        logger.info("Startup: waiting for startup lock...")
+        # Миграции другого воркера могут идти дольше DB_STATEMENT_TIMEOUT_MS
+        lock_conn.execute(NO_STATEMENT_TIMEOUT)
+        lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _STARTUP_LOCK_KEY})
+        try:
+            if not _schema_is_current(config):
+                migrate_db(config)
+            ensure_partitions(lock_conn, settings.partition_months_ahead)
+            ensure_webhook(bot)
+        finally:
+            try:
+                # После ошибки транзакция прервана — без rollback unlock упадёт
+                # с InFailedSqlTransaction и скроет исходную ошибку
+                lock_conn.rollback()
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _STARTUP_LOCK_KEY})
+                lock_conn.commit()
+            except Exception as e:
+                # Сессионный лок всё равно снимется при закрытии соединения
+                logger.warning("Failed to release startup lock: %s", e)
@@ -0,0 +1,91 @@
+"""
+Circuit breaker для Redis и Postgres.
+
+Пока хранилище отвечает, breaker закрыт и только считает ошибки подряд.
+После BREAKER_FAILURE_THRESHOLD ошибок подключения / таймаутов он
+открывается: вызовы сразу получают CircuitOpenError, не дожидаясь таймаута,
+и код переходит на запасной путь (локальный rate limit, состояния в памяти,
+отложенная запись в БД). Через BREAKER_RESET_TIMEOUT секунд один вызов
+пропускается пробным: успех закрывает breaker, ошибка — снова открывает.
+"""
+import threading
+import time
+
+from src import metrics
+from src.config import settings
+from src.logging import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Хранилище помечено недоступным — вызов не выполнялся."""
+
+    def __init__(self, name: str):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        metrics.register_gauge(
+            f"govorun_{name}_circuit_open",
+            f"1 if the {name} circuit breaker is open or half-open",
+            lambda: 0 if self._state == CLOSED else 1,
+        )
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов. В открытом состоянии — только один пробный раз в reset_timeout."""
+        if self._state == CLOSED:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self._state == CLOSED:
+                return True
+            if now - self._opened_at < self._reset_timeout:
+                metrics.CIRCUIT_REJECTED.labels(self.name).inc()
+                return False
+            # Пробный вызов; следующий — не раньше чем через reset_timeout, если этот не отчитается
+            self._state = HALF_OPEN
+            self._opened_at = now
+            return True
+
+    def check(self) -> None:
+        """allow() или CircuitOpenError."""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+
+    def record_success(self) -> None:
+        if self._state == CLOSED and self._failures == 0:
+            return
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("%s circuit closed: storage is available again", self.name)
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self._failure_threshold:
+                if self._state != OPEN:
+                    logger.error("%s circuit opened after %d failures: %s", self.name, self._failures, error)
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+
+redis_breaker = CircuitBreaker("redis", settings.breaker_failure_threshold, settings.breaker_reset_timeout)
+postgres_breaker = CircuitBreaker("postgres", settings.breaker_failure_threshold, settings.breaker_reset_timeout)
@@ -1,12 +1,130 @@
-from sqlalchemy import create_engine
+"""
+Подключение к Postgres.
+
+Все сессии приложения (session_scope / async_session_scope) проходят через
+postgres_breaker: пока Postgres недоступен, сессия сразу падает с
+CircuitOpenError, а не ждёт подключения или свободного соединения из пула.
+Таймауты подключения, пула и запроса (DB_*_TIMEOUT) ограничивают, сколько
+стоит каждый неудачный вызов до размыкания.
+"""
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 
+from src import metrics
 from src.config import settings
+from src.storage.circuit_breaker import CircuitOpenError, postgres_breaker
+
+
+def _engine_options() -> dict:
+    connect_args = {"connect_timeout": settings.db_connect_timeout}
+    if settings.db_statement_timeout_ms:
+        connect_args["options"] = f"-c statement_timeout={settings.db_statement_timeout_ms}"
+    return {
+        "echo": False,
+        "pool_pre_ping": True,
+        "pool_timeout": settings.db_pool_timeout,
+        "connect_args": connect_args,
+    }
+
+
+engine = create_engine(settings.postgres_dsn, **_engine_options())
 
-engine = create_engine(settings.postgres_dsn, echo=False, pool_pre_ping=True)
+# Снять DB_STATEMENT_TIMEOUT_MS до конца транзакции — для заведомо долгих запросов
+# (ожидание advisory-лока, архивация, потоковая выгрузка)
+NO_STATEMENT_TIMEOUT = text("SET LOCAL statement_timeout = 0")
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+metrics.register_gauge("govorun_db_pool_size", "DB connection pool size", lambda: engine.pool.size())
+metrics.register_gauge("govorun_db_pool_checked_out", "DB connections in use", lambda: engine.pool.checkedout())
+metrics.register_gauge("govorun_db_pool_overflow", "DB connections above pool size", lambda: engine.pool.overflow())
+
 
 def get_session() -> Session:
     """Создать новую сессию БД."""
     return SessionLocal()
+
+
+def is_unavailable(error: BaseException) -> bool:
+    """Ошибка недоступности Postgres (нет соединения, таймаут), а не ошибка данных или запроса."""
+    return isinstance(error, (CircuitOpenError, OperationalError, InterfaceError, PoolTimeoutError))
+
+
+def _record(error: BaseException | None) -> None:
+    if error is not None and is_unavailable(error):
+        if not isinstance(error, CircuitOpenError):
+            postgres_breaker.record_failure(error)
+    else:
+        postgres_breaker.record_success()
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    Сессия БД как контекстный менеджер.
+
+    Незакоммиченная транзакция откатывается при ошибке, а соединение
+    всегда возвращается в пул. При разомкнутом postgres_breaker — сразу CircuitOpenError.
+    """
+    postgres_breaker.check()
+    session = SessionLocal()
+    try:
+        yield session
+    except Exception as e:
+        _record(e)
+        try:
+            session.rollback()
+        except Exception:
+            # Соединение уже потеряно — откат не нужен, close() вернёт его в пул
+            pass
+        raise
+    else:
+        _record(None)
+    finally:
+        session.close()
+
+
+# Асинхронный движок (SERVER_MODE=asgi) создаётся лениво: в WSGI-режиме он не нужен
+_async_engine: AsyncEngine | None = None
+_AsyncSessionLocal: async_sessionmaker[AsyncSession] | None = None
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        _async_engine = create_async_engine(settings.postgres_dsn, **_engine_options())
+        _AsyncSessionLocal = async_sessionmaker(bind=_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncIterator[AsyncSession]:
+    """Асинхронный вариант session_scope."""
+    postgres_breaker.check()
+    get_async_engine()
+    session = _AsyncSessionLocal()
+    try:
+        yield session
+    except Exception as e:
+        _record(e)
+        try:
+            await session.rollback()
+        except Exception:
+            pass
+        raise
+    else:
+        _record(None)
+    finally:
+        await session.close()
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _AsyncSessionLocal = None
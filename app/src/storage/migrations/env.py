@@ -9,7 +9,8 @@ from src.storage.models import Base
 # Alembic Config
 config = context.config
 
-if config.config_file_name is not None:
+# При запуске из приложения (src/startup.py) логирование уже настроено
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
     fileConfig(config.config_file_name)
 
 # Подставляем DSN из нашего конфига
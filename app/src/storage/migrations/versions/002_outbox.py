@@ -0,0 +1,36 @@
+"""Outbox: attempts / next_attempt_at in author_messages
+
+Revision ID: 002_outbox
+Revises: 001_initial
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "002_outbox"
+down_revision = "001_initial"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "author_messages",
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "author_messages",
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index(
+        "ix_author_messages_pending",
+        "author_messages",
+        ["next_attempt_at"],
+        postgresql_where=sa.text("delivery_status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_author_messages_pending", table_name="author_messages")
+    op.drop_column("author_messages", "next_attempt_at")
+    op.drop_column("author_messages", "attempts")
@@ -0,0 +1,124 @@
+"""Range-partition author_messages by created_at (monthly), undelivered index
+
+Revision ID: 003_partition_author_messages
+Revises: 002_outbox
+Create Date: 2026-10-17
+"""
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "003_partition_author_messages"
+down_revision = "002_outbox"
+branch_labels = None
+depends_on = None
+
+_COLUMNS = (
+    "id, user_telegram_id, text, created_at, delivered_at, delivery_status, error, attempts, next_attempt_at"
+)
+# Сколько месяцев вперёд создать партиции (дальше их создаёт src/storage/partitions.py)
+_MONTHS_AHEAD = 3
+
+
+def _add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_indexes() -> None:
+    op.create_index("ix_author_messages_user_telegram_id", "author_messages", ["user_telegram_id"])
+    op.create_index(
+        "ix_author_messages_pending",
+        "author_messages",
+        ["next_attempt_at"],
+        postgresql_where=sa.text("delivery_status = 'pending'"),
+    )
+
+
+def upgrade() -> None:
+    # Старая таблица уходит под другим именем вместе с индексами и PK
+    op.rename_table("author_messages", "author_messages_legacy")
+    op.execute("ALTER INDEX ix_author_messages_user_telegram_id RENAME TO ix_author_messages_legacy_user_telegram_id")
+    op.execute("ALTER INDEX ix_author_messages_pending RENAME TO ix_author_messages_legacy_pending")
+    op.execute("ALTER TABLE author_messages_legacy RENAME CONSTRAINT author_messages_pkey TO author_messages_legacy_pkey")
+    op.execute(
+        "ALTER TABLE author_messages_legacy "
+        "RENAME CONSTRAINT author_messages_user_telegram_id_fkey TO author_messages_legacy_user_telegram_id_fkey"
+    )
+
+    # Ключ партиционирования обязан входить в PK; id по-прежнему из той же последовательности
+    op.execute("""
+        CREATE TABLE author_messages (
+            id INTEGER NOT NULL DEFAULT nextval('author_messages_id_seq'),
+            user_telegram_id BIGINT NOT NULL REFERENCES users (telegram_id),
+            text TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            delivered_at TIMESTAMPTZ,
+            delivery_status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE author_messages_id_seq OWNED BY author_messages.id")
+
+    # Помесячные партиции: от самого старого сообщения до _MONTHS_AHEAD месяцев вперёд
+    oldest = op.get_bind().execute(sa.text("SELECT min(created_at) FROM author_messages_legacy")).scalar()
+    now = datetime.now(timezone.utc)
+    month = (oldest or now).astimezone(timezone.utc).date().replace(day=1)
+    last = _add_months(now.date().replace(day=1), _MONTHS_AHEAD)
+    while month <= last:
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE author_messages_p{month:%Y%m} PARTITION OF author_messages "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+        )
+        month = upper
+
+    _create_indexes()
+    # Недоставленные сообщения по статусу и времени: «failed за последний час», «pending старше 5 минут»
+    op.create_index(
+        "ix_author_messages_undelivered",
+        "author_messages",
+        ["delivery_status", "created_at"],
+        postgresql_where=sa.text("delivery_status <> 'delivered'"),
+    )
+
+    op.execute(f"INSERT INTO author_messages ({_COLUMNS}) SELECT {_COLUMNS} FROM author_messages_legacy")
+    op.drop_table("author_messages_legacy")
+
+
+def downgrade() -> None:
+    op.rename_table("author_messages", "author_messages_partitioned")
+    op.execute(
+        "ALTER TABLE author_messages_partitioned RENAME CONSTRAINT author_messages_pkey TO author_messages_partitioned_pkey"
+    )
+    op.execute(
+        "ALTER TABLE author_messages_partitioned "
+        "RENAME CONSTRAINT author_messages_user_telegram_id_fkey TO author_messages_partitioned_user_telegram_id_fkey"
+    )
+    op.drop_index("ix_author_messages_undelivered", table_name="author_messages_partitioned")
+    op.drop_index("ix_author_messages_pending", table_name="author_messages_partitioned")
+    op.drop_index("ix_author_messages_user_telegram_id", table_name="author_messages_partitioned")
+
+    op.create_table(
+        "author_messages",
+        sa.Column("id", sa.Integer(), server_default=sa.text("nextval('author_messages_id_seq')"), nullable=False),
+        sa.Column("user_telegram_id", sa.BigInteger(), nullable=False),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("delivered_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("delivery_status", sa.String(20), server_default="pending", nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.ForeignKeyConstraint(["user_telegram_id"], ["users.telegram_id"]),
+    )
+    op.execute("ALTER SEQUENCE author_messages_id_seq OWNED BY author_messages.id")
+    _create_indexes()
+
+    op.execute(f"INSERT INTO author_messages ({_COLUMNS}) SELECT {_COLUMNS} FROM author_messages_partitioned")
+    op.drop_table("author_messages_partitioned")
@@ -0,0 +1,29 @@
+"""forwarded_messages: forwarded message -> sender, for author replies
+
+Revision ID: 004_forwarded_messages
+Revises: 003_partition_author_messages
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "004_forwarded_messages"
+down_revision = "003_partition_author_messages"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "forwarded_messages",
+        sa.Column("chat_id", sa.BigInteger(), nullable=False),
+        sa.Column("message_id", sa.BigInteger(), nullable=False),
+        sa.Column("user_telegram_id", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint("chat_id", "message_id"),
+        sa.ForeignKeyConstraint(["user_telegram_id"], ["users.telegram_id"]),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("forwarded_messages")
@@ -0,0 +1,29 @@
+"""users.is_banned: admin blocklist (/block, /unblock)
+
+Revision ID: 006_user_bans
+Revises: 005_broadcasts
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "006_user_bans"
+down_revision = "005_broadcasts"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("users", sa.Column("is_banned", sa.Boolean(), server_default="false", nullable=False))
+    # Блоклист целиком читается при старте каждого процесса — частичный индекс только по забаненным
+    op.create_index(
+        "ix_users_banned",
+        "users",
+        ["telegram_id"],
+        postgresql_where=sa.text("is_banned"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_banned", table_name="users")
+    op.drop_column("users", "is_banned")
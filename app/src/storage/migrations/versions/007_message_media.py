@@ -0,0 +1,30 @@
+"""author_messages: media attachments (file_id and metadata only)
+
+Revision ID: 007_message_media
+Revises: 006_user_bans
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "007_message_media"
+down_revision = "006_user_bans"
+branch_labels = None
+depends_on = None
+
+_COLUMNS = ("file_name", "mime_type", "file_size", "file_unique_id", "file_id", "media_type")
+
+
+def upgrade() -> None:
+    # ALTER родительской таблицы распространяется на все партиции; колонки NULL — без перезаписи строк
+    op.add_column("author_messages", sa.Column("media_type", sa.String(20), nullable=True))
+    op.add_column("author_messages", sa.Column("file_id", sa.Text(), nullable=True))
+    op.add_column("author_messages", sa.Column("file_unique_id", sa.String(64), nullable=True))
+    op.add_column("author_messages", sa.Column("file_size", sa.BigInteger(), nullable=True))
+    op.add_column("author_messages", sa.Column("mime_type", sa.String(255), nullable=True))
+    op.add_column("author_messages", sa.Column("file_name", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    for name in _COLUMNS:
+        op.drop_column("author_messages", name)
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import BigInteger, String, Text, DateTime, Boolean, ForeignKey, func
+from sqlalchemy import BigInteger, Integer, String, Text, DateTime, Boolean, ForeignKey, Index, func, text as sql_text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -16,18 +16,86 @@ class User(Base):
     username: Mapped[str | None] = mapped_column(String(255), nullable=True)
     first_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
     last_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # Пользователь заблокировал бота (403 при рассылке); снимается, когда он снова пишет
     is_blocked: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
+    # Админ заблокировал пользователя (/block): апдейты отбрасываются до любой работы
+    is_banned: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     last_seen_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        Index("ix_users_banned", "telegram_id", postgresql_where=sql_text("is_banned")),
+    )
+
 
 class AuthorMessage(Base):
     __tablename__ = "author_messages"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_telegram_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.telegram_id"), nullable=False, index=True)
+    # Для медиа — подпись (может быть пустой)
     text: Mapped[str] = mapped_column(Text, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # Вложение (см. src/services/media.py): только file_id и метаданные из апдейта, сам файл не хранится
+    media_type: Mapped[str | None] = mapped_column(String(20), nullable=True)
+    file_id: Mapped[str | None] = mapped_column(Text, nullable=True)
+    file_unique_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    file_size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    mime_type: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    file_name: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Ключ помесячного партиционирования (см. src/storage/partitions.py), поэтому входит в PK
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     delivered_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     delivery_status: Mapped[str] = mapped_column(String(20), default="pending", server_default="pending")
     error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Outbox: число попыток доставки и время следующей попытки
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index(
+            "ix_author_messages_pending",
+            "next_attempt_at",
+            postgresql_where=sql_text("delivery_status = 'pending'"),
+        ),
+        Index(
+            "ix_author_messages_undelivered",
+            "delivery_status",
+            "created_at",
+            postgresql_where=sql_text("delivery_status <> 'delivered'"),
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+class ForwardedMessage(Base):
+    """Сообщение, пересланное автору (ЛС админа / группа), и его отправитель — для ответов."""
+
+    __tablename__ = "forwarded_messages"
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    message_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_telegram_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class Broadcast(Base):
+    """Рассылка /broadcast: текст, счётчики и точка продолжения после рестарта."""
+
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    # running / done / cancelled
+    status: Mapped[str] = mapped_column(String(20), default="running", server_default="running")
+    # Получатели идут по возрастанию users.telegram_id: всё до last_user_id включительно уже обработано
+    last_user_id: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
+    # Число получателей на момент запуска (для прогресса)
+    total: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    sent: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    blocked: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    failed: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # Сообщение с прогрессом у админа (редактируется по ходу рассылки)
+    progress_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    progress_message_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
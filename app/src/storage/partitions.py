@@ -0,0 +1,115 @@
+"""
+Помесячные партиции author_messages.
+
+Партиция на месяц M называется author_messages_pYYYYMM и содержит строки
+с created_at в [1-е число M, 1-е число M+1) по UTC. Партиции по умолчанию
+нет (с ней невозможен DETACH PARTITION CONCURRENTLY), поэтому партиции
+создаются заранее — на PARTITION_MONTHS_AHEAD месяцев вперёд — при старте
+бота и при каждом запуске архивации.
+"""
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from src.logging import logger
+
+PARENT = "author_messages"
+_NAME_RE = re.compile(r"^author_messages_p(\d{4})(\d{2})$")
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    # Первое число месяца (нижняя граница, включительно)
+    month: date
+    # Партиция в процессе DETACH CONCURRENTLY (прерванного)
+    detach_pending: bool = False
+
+    @property
+    def upper(self) -> date:
+        return add_months(self.month, 1)
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def current_month() -> date:
+    return datetime.now(timezone.utc).date().replace(day=1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_p{month:%Y%m}"
+
+
+def _month_from_name(name: str) -> date | None:
+    match = _NAME_RE.match(name)
+    if match is None:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def attached_partitions(conn: Connection) -> list[Partition]:
+    """Партиции, подключённые к author_messages, от старых к новым."""
+    rows = conn.execute(text("""
+        SELECT c.relname, i.inhdetachpending
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = CAST(:parent AS regclass)
+    """), {"parent": PARENT}).all()
+    partitions = []
+    for name, detach_pending in rows:
+        month = _month_from_name(name)
+        if month is not None:
+            partitions.append(Partition(name, month, detach_pending))
+    return sorted(partitions, key=lambda p: p.month)
+
+
+def detached_partitions(conn: Connection) -> list[Partition]:
+    """Бывшие партиции, уже отключённые, но ещё не удалённые (прерванная архивация)."""
+    rows = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind = 'r'
+          AND n.nspname = current_schema()
+          AND c.relname LIKE 'author\\_messages\\_p%'
+          AND NOT c.relispartition
+    """)).scalars().all()
+    partitions = []
+    for name in rows:
+        month = _month_from_name(name)
+        if month is not None:
+            partitions.append(Partition(name, month))
+    return sorted(partitions, key=lambda p: p.month)
+
+
+def partitions_are_current(conn: Connection, months_ahead: int) -> bool:
+    """Есть ли партиция на самый дальний нужный месяц."""
+    last = partition_name(add_months(current_month(), months_ahead))
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": last}).scalar()
+
+
+def ensure_partitions(conn: Connection, months_ahead: int) -> list[str]:
+    """Создать недостающие партиции с текущего месяца на months_ahead вперёд."""
+    created = []
+    month = current_month()
+    for _ in range(months_ahead + 1):
+        name = partition_name(month)
+        upper = add_months(month, 1)
+        exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+        if not exists:
+            conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {PARENT} "
+                f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+            ))
+            created.append(name)
+        month = upper
+    conn.commit()
+    if created:
+        logger.info("Created partitions: %s", ", ".join(created))
+    return created
@@ -0,0 +1,118 @@
+"""
+Клиенты Redis.
+
+Каждая команда и каждый pipeline проходят через redis_breaker (pubsub — нет,
+у него свои переподключения): при недоступном Redis команды
+сразу получают CircuitOpenError вместо ожидания таймаута (REDIS_SOCKET_TIMEOUT),
+а вызывающий код переходит на запасной путь.
+"""
+import time
+
+import redis
+import redis.asyncio
+import redis.asyncio.client
+import redis.client
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from src.config import settings
+from src.profiler import record_span
+from src.storage.circuit_breaker import redis_breaker
+
+_redis_client: redis.Redis | None = None
+_async_redis_client: redis.asyncio.Redis | None = None
+
+
+class _GuardedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error: bool = True):
+        redis_breaker.check()
+        started = time.perf_counter()
+        try:
+            result = super().execute(raise_on_error)
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            redis_breaker.record_failure(e)
+            raise
+        finally:
+            record_span("redis", "pipeline", time.perf_counter() - started)
+        redis_breaker.record_success()
+        return result
+
+
+class _GuardedAsyncPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        redis_breaker.check()
+        started = time.perf_counter()
+        try:
+            result = await super().execute(raise_on_error)
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            redis_breaker.record_failure(e)
+            raise
+        finally:
+            record_span("redis", "pipeline", time.perf_counter() - started)
+        redis_breaker.record_success()
+        return result
+
+
+class _GuardedRedis(redis.Redis):
+    def execute_command(self, *args, **options):
+        redis_breaker.check()
+        started = time.perf_counter()
+        try:
+            result = super().execute_command(*args, **options)
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            redis_breaker.record_failure(e)
+            raise
+        finally:
+            record_span("redis", args[0], time.perf_counter() - started)
+        redis_breaker.record_success()
+        return result
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> redis.client.Pipeline:
+        return _GuardedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _GuardedAsyncRedis(redis.asyncio.Redis):
+    async def execute_command(self, *args, **options):
+        redis_breaker.check()
+        started = time.perf_counter()
+        try:
+            result = await super().execute_command(*args, **options)
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            redis_breaker.record_failure(e)
+            raise
+        finally:
+            record_span("redis", args[0], time.perf_counter() - started)
+        redis_breaker.record_success()
+        return result
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> redis.asyncio.client.Pipeline:
+        return _GuardedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def _timeouts() -> dict:
+    return {
+        "socket_timeout": settings.redis_socket_timeout,
+        "socket_connect_timeout": settings.redis_socket_timeout,
+    }
+
+
+def get_redis() -> redis.Redis:
+    """Получить (или создать) общий клиент Redis."""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = _GuardedRedis.from_url(settings.redis_dsn, decode_responses=True, **_timeouts())
+    return _redis_client
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """Получить (или создать) асинхронный клиент Redis (режим SERVER_MODE=asgi)."""
+    global _async_redis_client
+    if _async_redis_client is None:
+        _async_redis_client = _GuardedAsyncRedis.from_url(settings.redis_dsn, decode_responses=True, **_timeouts())
+    return _async_redis_client
+
+
+async def close_async_redis() -> None:
+    global _async_redis_client
+    if _async_redis_client is not None:
+        await _async_redis_client.aclose()
+        _async_redis_client = None
@@ -1,62 +1,623 @@
-from datetime import datetime, timezone
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
 
-from sqlalchemy import select
+from sqlalchemy import (
+    BigInteger,
+    DateTime,
+    Insert,
+    RowMapping,
+    Select,
+    Update,
+    column,
+    func,
+    insert,
+    literal,
+    literal_column,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.logging import logger
-from src.storage.models import User, AuthorMessage
+from src.logging import info_sampled, logger
+from src.metrics import track_db
+from src.storage.db import NO_STATEMENT_TIMEOUT
+from src.storage.models import User, AuthorMessage, Broadcast, ForwardedMessage
+
+# Сколько строк серверный курсор отдаёт за один FETCH при потоковом чтении
+_STREAM_BATCH = 1000
+
+
+@dataclass
+class PendingDelivery:
+    """Сообщение из outbox, захваченное воркером доставки."""
+    message_id: int
+    user_telegram_id: int
+    username: str | None
+    first_name: str | None
+    text: str
+    attempts: int
+    # Вложение (см. services/media.py): тип и file_id, по которому оно пересылается
+    media_type: str | None = None
+    file_id: str | None = None
+
+
+@dataclass
+class BroadcastState:
+    """Снимок рассылки для воркера (без привязки к сессии)."""
+    id: int
+    text: str
+    status: str
+    last_user_id: int
+    total: int
+    sent: int
+    blocked: int
+    failed: int
+    progress_chat_id: int
+    progress_message_id: int | None
+
+    @classmethod
+    def of(cls, broadcast: Broadcast) -> "BroadcastState":
+        return cls(
+            id=broadcast.id,
+            text=broadcast.text,
+            status=broadcast.status,
+            last_user_id=broadcast.last_user_id,
+            total=broadcast.total,
+            sent=broadcast.sent,
+            blocked=broadcast.blocked,
+            failed=broadcast.failed,
+            progress_chat_id=broadcast.progress_chat_id,
+            progress_message_id=broadcast.progress_message_id,
+        )
+
+
+def upsert_user_stmt(telegram_id: int, username: str | None, first_name: str | None, last_name: str | None) -> Insert:
+    """INSERT ... ON CONFLICT DO UPDATE для пользователя."""
+    stmt = pg_insert(User).values(
+        telegram_id=telegram_id,
+        username=username,
+        first_name=first_name,
+        last_name=last_name,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={
+            "username": stmt.excluded.username,
+            "first_name": stmt.excluded.first_name,
+            "last_name": stmt.excluded.last_name,
+            # Пишет боту — значит, не заблокировал его (is_blocked ставит рассылка по 403)
+            "is_blocked": False,
+            "last_seen_at": func.now(),
+        },
+    )
+
+
+def touch_users_stmt(seen: dict[int, datetime]) -> Update:
+    """
+    Пакетное обновление last_seen_at одним UPDATE ... FROM (VALUES ...).
+
+    Писавший боту пользователь его не блокирует — is_blocked сбрасывается, как и в upsert_user_stmt.
+    """
+    seen_values = values(
+        column("telegram_id", BigInteger),
+        column("seen_at", DateTime(timezone=True)),
+        name="seen",
+    ).data(list(seen.items()))
+    return (
+        update(User)
+        .where(User.telegram_id == seen_values.c.telegram_id)
+        .values(
+            last_seen_at=func.greatest(User.last_seen_at, seen_values.c.seen_at),
+            is_blocked=False,
+        )
+    )
+
+
+def create_author_message_stmt(user_telegram_id: int, text: str, media: dict | None = None) -> Insert:
+    """
+    Вставка сообщения существующего пользователя (без upsert профиля).
+
+    media — колонки вложения (MessageMedia.columns(), см. services/media.py).
+    """
+    return (
+        insert(AuthorMessage)
+        .values(user_telegram_id=user_telegram_id, text=text, **(media or {}))
+        .returning(AuthorMessage.id)
+    )
+
+
+def record_author_message_stmt(
+    telegram_id: int,
+    username: str | None,
+    first_name: str | None,
+    last_name: str | None,
+    text: str,
+    media: dict | None = None,
+) -> Insert:
+    """
+    Upsert пользователя и вставка сообщения одним запросом.
+
+    Upsert идёт в data-modifying CTE, поэтому строка пользователя гарантированно
+    существует к моменту проверки внешнего ключа author_messages.
+    """
+    upserted = upsert_user_stmt(telegram_id, username, first_name, last_name).returning(User.telegram_id).cte("upserted_user")
+    media = media or {}
+    columns = AuthorMessage.__table__.c
+    values = [upserted.c.telegram_id, literal(text)]
+    values += [literal(value, columns[name].type) for name, value in media.items()]
+    return (
+        insert(AuthorMessage)
+        .add_cte(upserted)
+        # Остальные колонки заполняет server_default (Python-default'ы в INSERT ... SELECT не подставляются)
+        .from_select(["user_telegram_id", "text", *media], select(*values), include_defaults=False)
+        .returning(AuthorMessage.id)
+    )
+
+
+def delivery_status_stmt(message_ids: int | list[int], status: str, error: str | None = None) -> Update:
+    """
+    UPDATE статуса доставки без предварительной загрузки строки.
+
+    Статус delivered окончательный: ошибка повторной попытки (например, после
+    истёкшей аренды в outbox) его не перезаписывает.
+    """
+    values: dict = {"delivery_status": status}
+    if status == "delivered":
+        values["delivered_at"] = func.now()
+    if error is not None:
+        values["error"] = error
+    ids = message_ids if isinstance(message_ids, list) else [message_ids]
+    stmt = update(AuthorMessage).where(AuthorMessage.id.in_(ids))
+    if status != "delivered":
+        stmt = stmt.where(AuthorMessage.delivery_status != "delivered")
+    return stmt.values(**values)
+
+
+def record_forwards_stmt(senders: dict[tuple[int, int], int]) -> Insert:
+    """INSERT пересланных сообщений (chat_id, message_id) -> telegram_id отправителя одним запросом."""
+    stmt = pg_insert(ForwardedMessage).values([
+        {"chat_id": chat_id, "message_id": message_id, "user_telegram_id": user_telegram_id}
+        for (chat_id, message_id), user_telegram_id in senders.items()
+    ])
+    return stmt.on_conflict_do_nothing(index_elements=[ForwardedMessage.chat_id, ForwardedMessage.message_id])
+
+
+def forward_sender_stmt(chat_id: int, message_id: int) -> Select:
+    """Отправитель пересланного сообщения — поиск по первичному ключу."""
+    return select(ForwardedMessage.user_telegram_id).where(
+        ForwardedMessage.chat_id == chat_id,
+        ForwardedMessage.message_id == message_id,
+    )
+
+
+def create_broadcast_stmt(text: str, progress_chat_id: int) -> Insert:
+    """Новая рассылка; total — число незаблокированных (и не забаненных) пользователей на момент запуска."""
+    total = (
+        select(func.count())
+        .select_from(User)
+        .where(User.is_blocked.is_(False), User.is_banned.is_(False))
+        .scalar_subquery()
+    )
+    return (
+        insert(Broadcast)
+        .values(text=text, progress_chat_id=progress_chat_id, total=total)
+        .returning(Broadcast.id, Broadcast.total)
+    )
+
+
+def set_banned_stmt(telegram_id: int, banned: bool) -> Insert:
+    """Забанить / разбанить пользователя; строка создаётся, если он ещё не писал боту."""
+    stmt = pg_insert(User).values(telegram_id=telegram_id, is_banned=banned)
+    return stmt.on_conflict_do_update(index_elements=[User.telegram_id], set_={"is_banned": banned})
+
+
+def cancel_broadcasts_stmt() -> Update:
+    """Остановить все идущие рассылки (их воркеры завершатся после текущей пачки)."""
+    return (
+        update(Broadcast)
+        .where(Broadcast.status == "running")
+        .values(status="cancelled", finished_at=func.now())
+        .returning(Broadcast.id)
+    )
 
 
 class Repository:
     def __init__(self, session: Session):
         self.session = session
 
-    def upsert_user(self, telegram_id: int, username: str | None, first_name: str | None, last_name: str | None) -> User:
-        """Создать или обновить пользователя."""
-        stmt = select(User).where(User.telegram_id == telegram_id)
-        user = self.session.execute(stmt).scalar_one_or_none()
-
-        if user is None:
-            user = User(
-                telegram_id=telegram_id,
-                username=username,
-                first_name=first_name,
-                last_name=last_name,
-            )
-            self.session.add(user)
+    @track_db
+    def upsert_user(self, telegram_id: int, username: str | None, first_name: str | None, last_name: str | None) -> None:
+        """Создать или обновить пользователя (один INSERT ... ON CONFLICT)."""
+        # xmax = 0 только у только что вставленной строки
+        stmt = upsert_user_stmt(telegram_id, username, first_name, last_name).returning(literal_column("xmax = 0"))
+        inserted = self.session.execute(stmt).scalar_one()
+        self.session.commit()
+        if inserted:
             logger.info("New user created: telegram_id=%d, username=%s", telegram_id, username)
-        else:
-            user.username = username
-            user.first_name = first_name
-            user.last_name = last_name
-            user.last_seen_at = datetime.now(timezone.utc)
 
+    @track_db
+    def touch_users(self, seen: dict[int, datetime]) -> None:
+        """Записать last_seen_at пачки пользователей (telegram_id -> время последнего апдейта)."""
+        self.session.execute(touch_users_stmt(seen))
+        self.session.commit()
+
+    @track_db
+    def create_author_message(self, user_telegram_id: int, text: str, media: dict | None = None) -> int:
+        """Создать запись о сообщении автору. Возвращает id записи."""
+        message_id = self.session.execute(create_author_message_stmt(user_telegram_id, text, media)).scalar_one()
+        self.session.commit()
+        info_sampled("Author message created: id=%d, user=%d", message_id, user_telegram_id)
+        return message_id
+
+    @track_db
+    def record_author_message(
+        self,
+        telegram_id: int,
+        username: str | None,
+        first_name: str | None,
+        last_name: str | None,
+        text: str,
+        media: dict | None = None,
+    ) -> int:
+        """Upsert пользователя + запись сообщения в одной транзакции. Возвращает id записи."""
+        stmt = record_author_message_stmt(telegram_id, username, first_name, last_name, text, media)
+        message_id = self.session.execute(stmt).scalar_one()
         self.session.commit()
-        return user
+        info_sampled("Author message created: id=%d, user=%d", message_id, telegram_id)
+        return message_id
 
-    def create_author_message(self, user_telegram_id: int, text: str) -> AuthorMessage:
-        """Создать запись о сообщении автору."""
-        msg = AuthorMessage(
-            user_telegram_id=user_telegram_id,
+    @track_db
+    def restore_author_message(
+        self,
+        telegram_id: int,
+        username: str | None,
+        first_name: str | None,
+        last_name: str | None,
+        text: str,
+        created_at: datetime,
+        status: str,
+        error: str | None = None,
+        media: dict | None = None,
+    ) -> None:
+        """Записать сообщение, обработанное без БД (services/replay), с исходным временем и итогом доставки."""
+        self.session.execute(upsert_user_stmt(telegram_id, username, first_name, last_name))
+        self.session.execute(insert(AuthorMessage).values(
+            user_telegram_id=telegram_id,
             text=text,
-        )
-        self.session.add(msg)
+            created_at=created_at,
+            delivery_status=status,
+            delivered_at=created_at if status == "delivered" else None,
+            error=error,
+            **(media or {}),
+        ))
+        self.session.commit()
+
+    @track_db
+    def set_delivery_status(self, message_id: int, status: str, error: str | None = None) -> None:
+        """Обновить статус доставки одним UPDATE."""
+        self.session.execute(delivery_status_stmt(message_id, status, error))
         self.session.commit()
-        logger.info("Author message created: id=%d, user=%d", msg.id, user_telegram_id)
-        return msg
 
     def mark_delivered(self, message_id: int) -> None:
         """Пометить сообщение как доставленное."""
-        msg = self.session.get(AuthorMessage, message_id)
-        if msg:
-            msg.delivery_status = "delivered"
-            msg.delivered_at = datetime.now(timezone.utc)
-            self.session.commit()
+        self.set_delivery_status(message_id, "delivered")
+
+    @track_db
+    def mark_delivered_many(self, message_ids: list[int]) -> None:
+        """Пометить доставленными несколько сообщений (дайджест) одним UPDATE."""
+        self.session.execute(delivery_status_stmt(message_ids, "delivered"))
+        self.session.commit()
 
     def mark_failed(self, message_id: int, error: str) -> None:
         """Пометить сообщение как недоставленное."""
-        msg = self.session.get(AuthorMessage, message_id)
-        if msg:
-            msg.delivery_status = "failed"
-            msg.error = error
-            self.session.commit()
+        self.set_delivery_status(message_id, "failed", error)
+
+    @track_db
+    def pending_stats(self) -> tuple[int, datetime | None, int]:
+        """Готовые к доставке сообщения: (число, created_at самого старого, суммарная длина текста)."""
+        stmt = select(
+            func.count(),
+            func.min(AuthorMessage.created_at),
+            func.coalesce(func.sum(func.length(AuthorMessage.text)), 0),
+        ).where(AuthorMessage.delivery_status == "pending", AuthorMessage.next_attempt_at <= func.now())
+        count, oldest, chars = self.session.execute(stmt).one()
+        return count, oldest, chars
+
+    @track_db
+    def claim_pending_messages(self, limit: int, lease_seconds: int) -> list[PendingDelivery]:
+        """
+        Захватить пачку сообщений, готовых к доставке.
+
+        Строки выбираются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+        параллельные воркеры (в т.ч. в других процессах) не получат одно и то же
+        сообщение. next_attempt_at сдвигается на время аренды: если воркер упадёт
+        посреди доставки, сообщение снова станет доступным после её истечения.
+        """
+        now = datetime.now(timezone.utc)
+        stmt = (
+            select(AuthorMessage, User.username, User.first_name)
+            .join(User, User.telegram_id == AuthorMessage.user_telegram_id)
+            .where(AuthorMessage.delivery_status == "pending", AuthorMessage.next_attempt_at <= now)
+            .order_by(AuthorMessage.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True, of=AuthorMessage)
+        )
+        rows = self.session.execute(stmt).all()
+
+        claimed = []
+        for msg, username, first_name in rows:
+            msg.next_attempt_at = now + timedelta(seconds=lease_seconds)
+            claimed.append(PendingDelivery(
+                message_id=msg.id,
+                user_telegram_id=msg.user_telegram_id,
+                username=username,
+                first_name=first_name,
+                text=msg.text,
+                attempts=msg.attempts,
+                media_type=msg.media_type,
+                file_id=msg.file_id,
+            ))
+        self.session.commit()
+        return claimed
+
+    @track_db
+    def record_forwards(self, senders: dict[tuple[int, int], int]) -> None:
+        """Запомнить, чьё сообщение переслано в (chat_id, message_id) — пачкой из буфера services/reply_routing."""
+        self.session.execute(record_forwards_stmt(senders))
+        self.session.commit()
+
+    @track_db
+    def get_forward_sender(self, chat_id: int, message_id: int) -> int | None:
+        """telegram_id отправителя пересланного сообщения. None — не найдено."""
+        return self.session.execute(forward_sender_stmt(chat_id, message_id)).scalar_one_or_none()
+
+    @track_db
+    def schedule_retry(self, message_id: int, attempts: int, delay_seconds: float, error: str) -> None:
+        """Оставить сообщение в outbox и назначить следующую попытку."""
+        stmt = (
+            update(AuthorMessage)
+            .where(AuthorMessage.id == message_id, AuthorMessage.delivery_status == "pending")
+            .values(
+                attempts=attempts,
+                error=error,
+                next_attempt_at=func.now() + timedelta(seconds=delay_seconds),
+            )
+        )
+        self.session.execute(stmt)
+        self.session.commit()
+
+    @track_db
+    def release_messages(self, message_ids: list[int]) -> None:
+        """Вернуть захваченные, но не отправленные сообщения в outbox без ожидания аренды (дайджест)."""
+        stmt = (
+            update(AuthorMessage)
+            .where(AuthorMessage.id.in_(message_ids), AuthorMessage.delivery_status == "pending")
+            # created_at сохраняет исходный порядок при следующем захвате
+            .values(next_attempt_at=AuthorMessage.created_at)
+        )
+        self.session.execute(stmt)
+        self.session.commit()
+
+    @track_db
+    def create_broadcast(self, text: str, progress_chat_id: int) -> tuple[int, int]:
+        """Создать рассылку. Возвращает (id, число получателей)."""
+        broadcast_id, total = self.session.execute(create_broadcast_stmt(text, progress_chat_id)).one()
+        self.session.commit()
+        return broadcast_id, total
+
+    @track_db
+    def get_broadcast(self, broadcast_id: int) -> BroadcastState | None:
+        broadcast = self.session.get(Broadcast, broadcast_id)
+        return BroadcastState.of(broadcast) if broadcast is not None else None
+
+    @track_db
+    def running_broadcast_ids(self) -> list[int]:
+        stmt = select(Broadcast.id).where(Broadcast.status == "running").order_by(Broadcast.id)
+        return list(self.session.execute(stmt).scalars())
+
+    @track_db
+    def broadcast_recipients(self, after_user_id: int, limit: int) -> list[int]:
+        """
+        Следующая пачка получателей после after_user_id.
+
+        Keyset-пагинация по уникальному индексу users.telegram_id: каждая пачка —
+        короткий запрос, в памяти не больше limit id, а последний id пачки — точка
+        продолжения после рестарта.
+        """
+        stmt = (
+            select(User.telegram_id)
+            .where(User.telegram_id > after_user_id, User.is_blocked.is_(False), User.is_banned.is_(False))
+            .order_by(User.telegram_id)
+            .limit(limit)
+        )
+        return list(self.session.execute(stmt).scalars())
+
+    @track_db
+    def set_broadcast_progress_message(self, broadcast_id: int, message_id: int) -> None:
+        stmt = update(Broadcast).where(Broadcast.id == broadcast_id).values(progress_message_id=message_id)
+        self.session.execute(stmt)
+        self.session.commit()
+
+    @track_db
+    def checkpoint_broadcast(self, broadcast_id: int, last_user_id: int, sent: int, blocked: int, failed: int) -> BroadcastState:
+        """Записать обработанную пачку (приращения счётчиков). Возвращает рассылку с актуальным статусом."""
+        stmt = (
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(
+                last_user_id=last_user_id,
+                sent=Broadcast.sent + sent,
+                blocked=Broadcast.blocked + blocked,
+                failed=Broadcast.failed + failed,
+            )
+            .returning(Broadcast)
+        )
+        state = BroadcastState.of(self.session.execute(stmt).scalar_one())
+        self.session.commit()
+        return state
+
+    @track_db
+    def finish_broadcast(self, broadcast_id: int) -> None:
+        stmt = (
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.status == "running")
+            .values(status="done", finished_at=func.now())
+        )
+        self.session.execute(stmt)
+        self.session.commit()
+
+    @track_db
+    def cancel_broadcasts(self) -> list[int]:
+        ids = list(self.session.execute(cancel_broadcasts_stmt()).scalars())
+        self.session.commit()
+        return ids
+
+    @track_db
+    def block_users(self, telegram_ids: list[int]) -> None:
+        """Пометить пользователей, заблокировавших бота (403 от Telegram)."""
+        stmt = update(User).where(User.telegram_id.in_(telegram_ids)).values(is_blocked=True)
+        self.session.execute(stmt)
+        self.session.commit()
+
+    @track_db
+    def set_banned(self, telegram_id: int, banned: bool) -> None:
+        """Записать бан пользователя (блоклисты процессов обновляет src/bot/blocklist.py)."""
+        self.session.execute(set_banned_stmt(telegram_id, banned))
+        self.session.commit()
+
+    @track_db
+    def banned_user_ids(self) -> list[int]:
+        """Все забаненные пользователи (по частичному индексу ix_users_banned)."""
+        stmt = select(User.telegram_id).where(User.is_banned.is_(True))
+        return list(self.session.execute(stmt).scalars())
+
+    def stream_users(self, created_from: datetime | None, created_to: datetime | None) -> Iterator[RowMapping]:
+        """Пользователи (created_at в [created_from, created_to)) через серверный курсор — память не растёт."""
+        stmt = select(
+            User.telegram_id,
+            User.username,
+            User.first_name,
+            User.last_name,
+            User.is_blocked,
+            User.created_at,
+            User.last_seen_at,
+        ).order_by(User.telegram_id)
+        if created_from is not None:
+            stmt = stmt.where(User.created_at >= created_from)
+        if created_to is not None:
+            stmt = stmt.where(User.created_at < created_to)
+        self.session.execute(NO_STATEMENT_TIMEOUT)
+        yield from self.session.execute(stmt, execution_options={"yield_per": _STREAM_BATCH}).mappings()
+
+    def stream_messages(
+        self,
+        created_from: datetime | None,
+        created_to: datetime | None,
+        status: str | None,
+    ) -> Iterator[RowMapping]:
+        """Лог сообщений через серверный курсор; диапазон дат отсекает лишние партиции."""
+        stmt = select(
+            AuthorMessage.id,
+            AuthorMessage.user_telegram_id,
+            AuthorMessage.text,
+            AuthorMessage.media_type,
+            AuthorMessage.file_id,
+            AuthorMessage.file_size,
+            AuthorMessage.created_at,
+            AuthorMessage.delivered_at,
+            AuthorMessage.delivery_status,
+            AuthorMessage.error,
+            AuthorMessage.attempts,
+        ).order_by(AuthorMessage.created_at, AuthorMessage.id)
+        if created_from is not None:
+            stmt = stmt.where(AuthorMessage.created_at >= created_from)
+        if created_to is not None:
+            stmt = stmt.where(AuthorMessage.created_at < created_to)
+        if status is not None:
+            stmt = stmt.where(AuthorMessage.delivery_status == status)
+        self.session.execute(NO_STATEMENT_TIMEOUT)
+        yield from self.session.execute(stmt, execution_options={"yield_per": _STREAM_BATCH}).mappings()
+
+
+class AsyncRepository:
+    """
+    Асинхронный репозиторий для SERVER_MODE=asgi.
+
+    Использует те же построители запросов, что и Repository, поэтому SQL
+    в обоих режимах одинаковый.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    @track_db
+    async def upsert_user(self, telegram_id: int, username: str | None, first_name: str | None, last_name: str | None) -> None:
+        """Создать или обновить пользователя (один INSERT ... ON CONFLICT)."""
+        stmt = upsert_user_stmt(telegram_id, username, first_name, last_name).returning(literal_column("xmax = 0"))
+        inserted = (await self.session.execute(stmt)).scalar_one()
+        await self.session.commit()
+        if inserted:
+            logger.info("New user created: telegram_id=%d, username=%s", telegram_id, username)
+
+    @track_db
+    async def create_author_message(self, user_telegram_id: int, text: str, media: dict | None = None) -> int:
+        """Создать запись о сообщении автору. Возвращает id записи."""
+        message_id = (await self.session.execute(create_author_message_stmt(user_telegram_id, text, media))).scalar_one()
+        await self.session.commit()
+        info_sampled("Author message created: id=%d, user=%d", message_id, user_telegram_id)
+        return message_id
+
+    @track_db
+    async def record_author_message(
+        self,
+        telegram_id: int,
+        username: str | None,
+        first_name: str | None,
+        last_name: str | None,
+        text: str,
+        media: dict | None = None,
+    ) -> int:
+        """Upsert пользователя + запись сообщения в одной транзакции. Возвращает id записи."""
+        stmt = record_author_message_stmt(telegram_id, username, first_name, last_name, text, media)
+        message_id = (await self.session.execute(stmt)).scalar_one()
+        await self.session.commit()
+        info_sampled("Author message created: id=%d, user=%d", message_id, telegram_id)
+        return message_id
+
+    @track_db
+    async def set_delivery_status(self, message_id: int, status: str, error: str | None = None) -> None:
+        """Обновить статус доставки одним UPDATE."""
+        await self.session.execute(delivery_status_stmt(message_id, status, error))
+        await self.session.commit()
+
+    async def mark_delivered(self, message_id: int) -> None:
+        await self.set_delivery_status(message_id, "delivered")
+
+    async def mark_failed(self, message_id: int, error: str) -> None:
+        await self.set_delivery_status(message_id, "failed", error)
+
+    @track_db
+    async def get_forward_sender(self, chat_id: int, message_id: int) -> int | None:
+        return (await self.session.execute(forward_sender_stmt(chat_id, message_id))).scalar_one_or_none()
+
+    @track_db
+    async def create_broadcast(self, text: str, progress_chat_id: int) -> tuple[int, int]:
+        broadcast_id, total = (await self.session.execute(create_broadcast_stmt(text, progress_chat_id))).one()
+        await self.session.commit()
+        return broadcast_id, total
+
+    @track_db
+    async def cancel_broadcasts(self) -> list[int]:
+        ids = list((await self.session.execute(cancel_broadcasts_stmt())).scalars())
+        await self.session.commit()
+        return ids
+
+    @track_db
+    async def set_banned(self, telegram_id: int, banned: bool) -> None:
+        """Записать бан пользователя (блоклисты процессов обновляет src/bot/blocklist.py)."""
+        await self.session.execute(set_banned_stmt(telegram_id, banned))
+        await self.session.commit()
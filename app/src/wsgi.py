@@ -1,15 +1,39 @@
 """WSGI entrypoint для gunicorn."""
-from src.main import create_bot, setup_webhook, init_db
-from src.bot.webhook_server import app, set_bot
+import atexit
+
+from src.main import create_bot
+from src.bot.blocklist import start_blocklist, stop_blocklist
+from src.bot.webhook_server import app, set_bot, shutdown
 from src.logging import logger
+from src.services.broadcast import start_broadcasts, stop_broadcasts
+from src.services.outbox import start_delivery_workers, stop_delivery_workers
+from src.services.profile_cache import start_last_seen_flusher, stop_last_seen_flusher
+from src.services.reply_routing import start_forwards_flusher, stop_forwards_flusher
+from src.services.replay import start_replay, stop_replay
+from src.startup import run_startup
 
 logger.info("WSGI: Initializing application...")
 
-init_db()
-
 bot = create_bot()
+# Миграции и webhook делает один воркер под локом; остальные проходят быстрый путь
+run_startup(bot)
 set_bot(bot)
-setup_webhook(bot)
+start_replay()
+start_delivery_workers(bot)
+start_broadcasts(bot)
+start_last_seen_flusher()
+start_forwards_flusher()
+start_blocklist()
+
+# При остановке воркера: дообработать очередь апдейтов, затем остановить рассылки и доставку
+# и дописать last_seen_at и отложенные записи (atexit вызывает функции в обратном порядке)
+atexit.register(stop_replay)
+atexit.register(stop_blocklist)
+atexit.register(stop_forwards_flusher)
+atexit.register(stop_last_seen_flusher)
+atexit.register(stop_delivery_workers)
+atexit.register(stop_broadcasts)
+atexit.register(shutdown)
 
 logger.info("WSGI: Application ready")
 